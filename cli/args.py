@@ -1,8 +1,11 @@
 import argparse
 
+from config.config import Config
+from core.backends import BACKENDS
 
-def parse_args():
-    """解析命令行參數"""
+
+def build_parser():
+    """建立命令行參數解析器，常駐服務也以其預設值作為工作設定的基礎"""
     parser = argparse.ArgumentParser(description="使用Gemini AI為代碼文件添加中文註釋")
     parser.add_argument(
         "--folder", "-f", type=str, default=".", help="包含代碼文件的文件夾路徑"
@@ -11,17 +14,63 @@ def parse_args():
         "--output", "-o", type=str, default="commented", help="輸出文件夾路徑"
     )
     parser.add_argument(
-        "--recursive", "-r", action="store_true", help="是否遞歸處理子文件夾"
+        "--recursive",
+        "-r",
+        action="store_true",
+        help="是否遞歸處理子文件夾 (--git-range、--git-files、--files-from 一律包含子文件夾)",
     )
     parser.add_argument(
         "--filter", type=str, default="*.py", help="文件過濾器，如: *.py,*.js,*.java"
     )
+    parser.add_argument(
+        "--git-range",
+        type=str,
+        help="只處理此 git 修訂範圍內新增或修改的文件，如: origin/main...HEAD",
+    )
+    parser.add_argument(
+        "--git-files",
+        action="store_true",
+        help="以 git ls-files 取得文件列表 (套用儲存庫的忽略規則，不遍歷目錄樹)",
+    )
+    parser.add_argument(
+        "--files-from",
+        type=str,
+        help="從文件讀取要處理的相對路徑列表 (每行一個，'-' 表示標準輸入)",
+    )
+    parser.add_argument(
+        "--include-generated",
+        action="store_true",
+        help="不略過壓縮、打包或自動產生的代碼 (如 *.min.js、*_pb2.py)",
+    )
     parser.add_argument(
         "--delay", "-d", type=float, default=6.0, help="API請求之間的延遲(秒)"
     )
     parser.add_argument(
         "--max-backoff", type=float, default=64.0, help="最大退避時間(秒)"
     )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=1, help="並行處理的工作線程數"
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=0,
+        help="以子進程執行雜湊、註釋拼接等 CPU 密集工作的進程數 (0 表示不使用子進程)",
+    )
+    parser.add_argument(
+        "--priority",
+        type=str,
+        choices=["scan", "smallest", "recent", "listed", "longest"],
+        default="scan",
+        help="處理順序: scan 掃描順序, smallest 小文件優先, recent 最近修改優先, "
+        "listed --priority-paths 指定的路徑優先, longest 大文件優先",
+    )
+    parser.add_argument(
+        "--priority-paths",
+        type=str,
+        default="",
+        help="listed 策略的優先路徑或模式，以逗號分隔，如: src/core,*.py",
+    )
     parser.add_argument(
         "--model",
         type=str,
@@ -32,4 +81,200 @@ def parse_args():
         "--api-key", type=str, help="Gemini API金鑰，優先級高於環境變數"
     )
     parser.add_argument("--nyaproxy", action="store_true", help="是否使用nyaproxy代理")
-    return parser.parse_args()
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=list(BACKENDS),
+        help="模型後端: gemini (Gemini SDK)、openai (OpenAI 兼容接口)、fake (不連網的本機假後端)；"
+        "未指定時使用 gemini，搭配 --nyaproxy 時使用 openai",
+    )
+    parser.add_argument(
+        "--base-url",
+        type=str,
+        help="openai 後端的服務位址，如: https://api.openai.com/v1 (預設為本機 nyaproxy)；"
+        "批次模式下為 Gemini API 位址 (可指向本機模擬服務測試)",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["full", "diff"],
+        default="full",
+        help="模型回應格式: full 返回完整代碼, diff 只返回 行號→註釋 並在本地拼接 (輸出更少、更快)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="以串流方式接收回應並邊收邊寫入暫存檔，完成後原子性替換輸出文件",
+    )
+    parser.add_argument(
+        "--stall-timeout",
+        type=float,
+        default=60.0,
+        help="串流模式下超過此秒數沒有新資料即中止 (秒)",
+    )
+    parser.add_argument(
+        "--no-json-mode",
+        dest="json_mode",
+        action="store_false",
+        help="不使用 API 原生的 JSON 模式 (適用於不支援 response_format 的代理或模型)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="增量模式: 未變更的文件複用上次結果，小幅修改的文件只送出變更片段",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".comment_maker_cache",
+        help="增量模式保存上次來源與結果的目錄",
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="低記憶體模式: 邊掃描邊處理並限制同時處理中的文件數，超大文件逐段處理",
+    )
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        help="超過此位元組數的文件逐段讀取與處理 (低記憶體模式預設 262144)",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="只掃描文件並估算請求數、token 與處理時間，不呼叫 API",
+    )
+    parser.add_argument(
+        "--quota-plan",
+        action="store_true",
+        help="依每日配額規劃處理: 先估算所需請求與 token，額度用完時等待配額重置後自動繼續",
+    )
+    parser.add_argument(
+        "--rpd", type=int, help="每個金鑰每日請求數上限 (預設讀取 config.yaml 或 250)"
+    )
+    parser.add_argument(
+        "--tpd", type=int, help="每個金鑰每日 token 上限 (預設不限制)"
+    )
+    parser.add_argument(
+        "--keys", type=int, help="可用的金鑰數量 (預設讀取 config.yaml 或 1)"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="處理完成後持續監看來源目錄，只重新處理變更的文件 (Ctrl+C 停止)",
+    )
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=1.0,
+        help="監看模式下最後一次變更後等待多少秒才處理，合併連續的儲存 (秒)",
+    )
+    parser.add_argument(
+        "--watch-polling",
+        action="store_true",
+        help="監看模式不使用 inotify，改為定期比對修改時間 (適用於網路磁碟)",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="以 Gemini Batch API 提交所有文件為批次工作並等待結果 "
+        "(費用約為一般請求的一半，完成時間不固定；中斷後重新運行會接續等待)",
+    )
+    parser.add_argument(
+        "--batch-poll",
+        type=float,
+        default=30.0,
+        help="批次模式下查詢工作狀態的間隔 (秒)",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        help="分散式模式的共用工作佇列 (本機檔案系統上的 SQLite 資料庫路徑)，需搭配 --queue-role",
+    )
+    parser.add_argument(
+        "--queue-role",
+        type=str,
+        choices=["coordinator", "worker"],
+        help="coordinator 掃描文件並將工作加入佇列；worker 從佇列租用工作並處理",
+    )
+    parser.add_argument(
+        "--worker-id", type=str, help="工作進程識別碼 (預設為 主機名-進程ID)"
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        help="工作租約長度 (秒)，工作進程超過此時間未續約即重新排入佇列 (預設 300)",
+    )
+    return parser
+
+
+def parse_args():
+    """解析命令行參數"""
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.queue_role and not args.queue:
+        parser.error("--queue-role 需要搭配 --queue 指定工作佇列")
+    if args.batch and (args.watch or args.queue_role):
+        parser.error("--batch 不能與 --watch 或 --queue-role 同時使用")
+    return args
+
+
+def parse_serve_args(argv):
+    """解析 serve 子命令的參數"""
+    parser = argparse.ArgumentParser(
+        prog="run_cli.py serve",
+        description="以常駐服務運行，透過本機 HTTP 接口提交處理工作",
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="監聽位址 (預設只接受本機連線)"
+    )
+    parser.add_argument("--port", type=int, default=8765, help="監聽埠號")
+    parser.add_argument(
+        "--api-key", type=str, help="Gemini API金鑰，優先級高於環境變數"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="gemini-2.5-flash",
+        help="Gemini模型名稱，如: gemini-2.5-flash",
+    )
+    parser.add_argument("--nyaproxy", action="store_true", help="是否使用nyaproxy代理")
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=list(BACKENDS),
+        help="模型後端: gemini (Gemini SDK)、openai (OpenAI 兼容接口)、fake (不連網的本機假後端)；"
+        "未指定時使用 gemini，搭配 --nyaproxy 時使用 openai",
+    )
+    parser.add_argument(
+        "--base-url",
+        type=str,
+        help="openai 後端的服務位址，如: https://api.openai.com/v1 (預設為本機 nyaproxy)",
+    )
+    parser.add_argument(
+        "--max-jobs", type=int, default=2, help="同時運行的工作數上限"
+    )
+    parser.add_argument(
+        "--delay",
+        "-d",
+        type=float,
+        default=Config.DEFAULT_REQUEST_DELAY,
+        help="所有工作共用的 API 請求最小間隔 (秒)，包括重試",
+    )
+    parser.add_argument(
+        "--token-file",
+        type=str,
+        default=Config.DAEMON_TOKEN_FILE,
+        help="啟動時產生的存取權杖寫入此檔案 (權限 0600)，每個請求都需要以 "
+        "Authorization: Bearer <權杖> 帶上",
+    )
+    parser.add_argument(
+        "--output-root",
+        type=str,
+        action="append",
+        help="工作的輸出目錄必須位於此目錄之下，可重複指定 (預設為服務的工作目錄)",
+    )
+    parser.add_argument(
+        "--log-file", type=str, default="daemon.log", help="服務的日誌檔案"
+    )
+    return parser.parse_args(argv)
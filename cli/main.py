@@ -1,4 +1,8 @@
-from .args import parse_args
+import sys
+import threading
+
+from .args import parse_args, parse_serve_args
+from core.estimator import RunEstimator
 from core.orchestrator import ProjectOrchestrator
 
 
@@ -7,6 +11,12 @@ def main():
     Entry point for the CLI.
     Parses arguments and calls the core processing engine.
     """
+    if sys.argv[1:2] == ["serve"]:
+        from .server import serve
+
+        serve(parse_serve_args(sys.argv[2:]))
+        return
+
     args = parse_args()
     print("[INFO] CLI mode initiated.")
     # 將 args 轉換為字典
@@ -14,5 +24,32 @@ def main():
     print("[INFO] Settings: ", settings)
     # 創建協調器並運行
     orchestrator = ProjectOrchestrator(settings)
-    orchestrator.run()
+    if settings.get("estimate"):
+        # 只估算成本與時間，不呼叫 API
+        for line in RunEstimator.format_report(orchestrator.estimate()):
+            print(f"[ESTIMATE] {line}")
+    elif settings.get("queue_role") == "coordinator":
+        orchestrator.enqueue()
+    elif settings.get("queue_role") == "worker":
+        _run_until_interrupted(orchestrator, orchestrator.run_worker)
+    elif settings.get("batch"):
+        _run_until_interrupted(orchestrator, orchestrator.run_batch)
+    elif settings.get("watch"):
+        _run_until_interrupted(orchestrator, orchestrator.watch)
+    else:
+        _run_until_interrupted(orchestrator, orchestrator.run)
     print("[INFO] CLI execution finished.")
+
+
+def _run_until_interrupted(orchestrator, target):
+    """在背景線程運行協調器，Ctrl+C 時取消處理並等待已完成的結果寫入"""
+    worker = threading.Thread(target=target)
+    worker.start()
+    try:
+        # 主線程以短暫的 join 等待，才能及時收到 KeyboardInterrupt
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("[INFO] 收到中斷信號，正在取消處理...")
+        orchestrator.cancel_token.cancel()
+        worker.join()
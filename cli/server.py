@@ -0,0 +1,413 @@
+"""
+常駐服務模式
+啟動時只初始化一次 API 客戶端 (SDK 設定、連線測試、模型與 context cache)，
+之後透過本機 HTTP 接口接收處理工作，重複的小型運行不必再付出啟動成本。
+
+每個請求都需要帶上啟動時產生的存取權杖 (Authorization: Bearer <權杖>，權杖寫入
+--token-file)；POST 的 Content-Type 必須是 application/json，帶有 Origin 標頭的
+(瀏覽器發出的) 請求一律拒絕，避免網頁以跨來源請求提交工作。
+
+工作只執行一般處理：estimate、watch 等運行模式，以及 json_mode、stall_timeout
+等屬於共用客戶端的設定都由服務決定，工作中指定時返回 400。
+
+接口 (JSON)：
+    GET  /health              服務狀態
+    GET  /jobs                所有工作的摘要
+    POST /jobs                提交工作，內容為 {"settings": {...}, "wait": false}
+    GET  /jobs/<id>           工作狀態、進度與最近的日誌
+    POST /jobs/<id>/cancel    取消工作
+"""
+
+import hmac
+import itertools
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from config.API_config.test_api_connection import TestApiConnection
+from config.config import Config
+from config.log_config import setup_logging
+from core.cancellation import CancellationToken
+from core.gemini_client import SendCode
+from core.orchestrator import ProjectOrchestrator
+from core.quota_planner import RequestLimiter
+
+from .args import build_parser
+
+# 由服務決定、不接受工作覆寫的設定；json_mode 與 stall_timeout 屬於啟動時建立、
+# 所有工作共用的客戶端與後端，無法逐個工作調整
+_SERVER_SETTINGS = (
+    "api_key",
+    "model",
+    "nyaproxy",
+    "backend",
+    "base_url",
+    "queue",
+    "queue_role",
+    "worker_id",
+    "batch",
+    "external_logging",
+    "json_mode",
+    "stall_timeout",
+)
+
+# 服務只執行一般處理 (含 low_memory，由 run() 自行切換)，不支援的運行模式
+_UNSUPPORTED_MODES = ("estimate", "watch")
+
+
+class DaemonJob:
+    """常駐服務中的一個工作，同時作為協調器的 progress_queue 收集日誌與進度"""
+
+    def __init__(self, job_id, settings):
+        self.id = job_id
+        self.settings = settings
+        self.state = "queued"
+        self.progress = 0
+        self.status = ""
+        self.errors = 0
+        self.logs = deque(maxlen=Config.DAEMON_JOB_LOG_LINES)
+        self.cancel_token = CancellationToken()
+        self.done = threading.Event()
+        self.created = time.time()
+        self.finished = None
+
+    def put(self, message):
+        """接收協調器的 ("log", ...) 與 ("progress", ...) 消息"""
+        message_type, data = message
+        if message_type == "log":
+            text, level = data if isinstance(data, tuple) else (data, "INFO")
+            if level == "ERROR":
+                self.errors += 1
+            self.logs.append(f"[{level}] {text}")
+        elif message_type == "progress":
+            self.progress, self.status = data
+
+    def to_dict(self, include_logs=True):
+        result = {
+            "id": self.id,
+            "state": self.state,
+            "progress": self.progress,
+            "status": self.status,
+            "errors": self.errors,
+            "folder": self.settings.get("folder"),
+            "output": self.settings.get("output"),
+            "created": self.created,
+            "finished": self.finished,
+        }
+        if include_logs:
+            result["logs"] = list(self.logs)
+        return result
+
+
+class CommentDaemon:
+    """管理常駐服務的工作：共用同一個 API 客戶端與請求速率限制，限制同時運行的工作數"""
+
+    def __init__(
+        self,
+        api_client,
+        defaults,
+        max_jobs=2,
+        output_roots=(),
+        request_interval=Config.DEFAULT_REQUEST_DELAY,
+    ):
+        """初始化服務。
+
+        Args:
+            api_client (SendCode): 已初始化的客戶端，所有工作共用。
+            defaults (dict): 工作設定的預設值 (命令行參數的預設值)。
+            max_jobs (int): 同時運行的工作數上限，超過的工作排隊等待。
+            output_roots: 允許作為輸出目錄的上層目錄，輸出目錄必須位於其中之一。
+            request_interval (float): 所有工作共用的請求最小間隔 (秒)。
+        """
+        self.api_client = api_client
+        self.defaults = defaults
+        # 同時運行的工作各自的 delay 只限制自身，合計的請求速率由共用的限制器控制
+        self.request_limiter = RequestLimiter(request_interval)
+        self.output_roots = [Path(root).resolve() for root in output_roots]
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._slots = threading.BoundedSemaphore(max(1, max_jobs))
+
+    def submit(self, overrides):
+        """建立並在背景線程開始一個工作。
+
+        Args:
+            overrides (dict): 覆寫預設值的設定，至少需要 folder 與 output。
+
+        Returns:
+            DaemonJob: 新建立的工作。
+
+        Raises:
+            ValueError: 設定無效。
+        """
+        unknown = sorted(set(overrides) - set(self.defaults))
+        if unknown:
+            raise ValueError(f"未知的設定: {', '.join(unknown)}")
+        forbidden = sorted(set(overrides) & set(_SERVER_SETTINGS))
+        if forbidden:
+            raise ValueError(f"這些設定由服務決定，不能在工作中指定: {', '.join(forbidden)}")
+        modes = [key for key in _UNSUPPORTED_MODES if overrides.get(key)]
+        if modes:
+            raise ValueError(f"常駐服務不支援這些運行模式: {', '.join(modes)}")
+        if overrides.get("files_from") == "-":
+            raise ValueError("常駐服務沒有標準輸入，files_from 必須是文件路徑")
+        for key in ("folder", "output"):
+            if not overrides.get(key):
+                raise ValueError(f"缺少設定: {key}")
+        if not Path(overrides["folder"]).is_dir():
+            raise ValueError(f"源文件夾不存在: {overrides['folder']}")
+        self._check_output(Path(overrides["folder"]), Path(overrides["output"]))
+
+        settings = dict(self.defaults)
+        settings.update(overrides)
+        with self._lock:
+            job = DaemonJob(next(self._ids), settings)
+            self.jobs[job.id] = job
+            self._forget_finished_jobs()
+        threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+        return job
+
+    def _check_output(self, folder, output):
+        """輸出目錄在處理前會被整個刪除重建，只接受允許範圍內的新目錄或本工具先前的輸出。
+
+        Raises:
+            ValueError: 輸出目錄不安全。
+        """
+        folder, output = folder.resolve(), output.resolve()
+        if not any(root in output.parents for root in self.output_roots):
+            roots = ", ".join(map(str, self.output_roots))
+            raise ValueError(f"輸出目錄必須位於允許的目錄之下 ({roots}): {output}")
+        if output == folder or output in folder.parents:
+            raise ValueError(f"輸出目錄不能是源文件夾或其上層目錄: {output}")
+        if (
+            output.exists()
+            and not (output / Config.OUTPUT_MARKER_FILE).is_file()
+            and (not output.is_dir() or any(output.iterdir()))
+        ):
+            raise ValueError(f"輸出目錄已存在且不是本工具先前的輸出: {output}")
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """取消工作，返回工作；工作不存在時返回 None"""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel_token.cancel()
+        return job
+
+    def cancel_all(self):
+        for job in self.list():
+            job.cancel_token.cancel()
+
+    def _run_job(self, job):
+        with self._slots:
+            if job.cancel_token.cancelled:
+                job.state = "cancelled"
+            else:
+                job.state = "running"
+                logging.info(f"開始工作 {job.id}: {job.settings['folder']}")
+                orchestrator = ProjectOrchestrator(
+                    job.settings,
+                    job,
+                    cancel_token=job.cancel_token,
+                    api_client=self.api_client,
+                    request_limiter=self.request_limiter,
+                )
+                orchestrator.run()
+                if job.cancel_token.cancelled:
+                    job.state = "cancelled"
+                elif job.status.startswith("錯誤"):
+                    job.state = "failed"
+                else:
+                    job.state = "finished"
+        job.finished = time.time()
+        job.done.set()
+        logging.info(f"工作 {job.id} 結束: {job.state}")
+
+    def _forget_finished_jobs(self):
+        """只保留最近的已結束工作，避免長時間運行時記憶體持續增長"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[: max(0, len(finished) - Config.DAEMON_MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """處理常駐服務的 HTTP 請求"""
+
+    JOB_PATH = re.compile(r"^/jobs/(\d+)(/cancel)?$")
+
+    @property
+    def daemon(self):
+        return self.server.comment_daemon
+
+    def _authorize(self):
+        """檢查請求來源與存取權杖，不通過時回應錯誤並返回 False"""
+        if self.headers.get("Origin") is not None:
+            self._send_error(403, "不接受瀏覽器發出的請求")
+            return False
+        expected = f"Bearer {self.server.auth_token}"
+        if not hmac.compare_digest(
+            self.headers.get("Authorization", "").encode("utf-8"),
+            expected.encode("utf-8"),
+        ):
+            self._send_error(401, "缺少或錯誤的存取權杖")
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorize():
+            return
+        if self.path == "/health":
+            return self._send_json(200, {"status": "ok", "jobs": len(self.daemon.list())})
+        if self.path == "/jobs":
+            return self._send_json(
+                200, [job.to_dict(include_logs=False) for job in self.daemon.list()]
+            )
+        match = self.JOB_PATH.match(self.path)
+        if match and not match.group(2):
+            job = self.daemon.get(int(match.group(1)))
+            if job is None:
+                return self._send_error(404, "工作不存在")
+            return self._send_json(200, job.to_dict())
+        self._send_error(404, "未知的路徑")
+
+    def do_POST(self):
+        if not self._authorize():
+            return
+        if self.headers.get_content_type() != "application/json":
+            return self._send_error(415, "Content-Type 必須是 application/json")
+        try:
+            body = self._read_json()
+        except ValueError as e:
+            return self._send_error(400, str(e))
+
+        if self.path == "/jobs":
+            try:
+                job = self.daemon.submit(body.get("settings") or {})
+            except ValueError as e:
+                return self._send_error(400, str(e))
+            if body.get("wait"):
+                job.done.wait()
+                return self._send_json(200, job.to_dict())
+            return self._send_json(202, job.to_dict(include_logs=False))
+
+        match = self.JOB_PATH.match(self.path)
+        if match and match.group(2):
+            job = self.daemon.cancel(int(match.group(1)))
+            if job is None:
+                return self._send_error(404, "工作不存在")
+            return self._send_json(202, job.to_dict(include_logs=False))
+        self._send_error(404, "未知的路徑")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > Config.DAEMON_MAX_REQUEST_BYTES:
+            raise ValueError("請求內容過大")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"無效的 JSON: {e}")
+        if not isinstance(body, dict):
+            raise ValueError("請求內容必須是 JSON 物件")
+        return body
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": message})
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def _create_api_client(args):
+    """初始化所有工作共用的 API 客戶端，連線失敗時返回 None"""
+    api_key = args.api_key or Config.DEFAULT_API_KEY
+    tester = TestApiConnection(
+        api_key=api_key,
+        nyaproxy=args.nyaproxy,
+        backend=args.backend,
+        base_url=args.base_url,
+    )
+    if not tester.test_api_connection():
+        return None
+    return SendCode(
+        api_key=api_key,
+        model=args.model,
+        nyaproxy=args.nyaproxy,
+        backend=args.backend,
+        base_url=args.base_url,
+    )
+
+
+def _write_token_file(path, token):
+    """寫入存取權杖，檔案只有目前使用者可讀寫"""
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+
+
+def serve(args):
+    """啟動常駐服務，直到 Ctrl+C 為止
+
+    Args:
+        args: parse_serve_args() 的結果。
+    """
+    setup_logging(args.log_file)
+    api_client = _create_api_client(args)
+    if api_client is None:
+        logging.error("API 連線失敗，服務未啟動。")
+        return
+
+    defaults = vars(build_parser().parse_args([]))
+    defaults["external_logging"] = True
+    daemon = CommentDaemon(
+        api_client,
+        defaults,
+        max_jobs=args.max_jobs,
+        output_roots=args.output_root or [Path.cwd()],
+        request_interval=args.delay,
+    )
+
+    server = ThreadingHTTPServer((args.host, args.port), _RequestHandler)
+    server.daemon_threads = True
+    server.comment_daemon = daemon
+    server.auth_token = secrets.token_urlsafe(32)
+    _write_token_file(args.token_file, server.auth_token)
+    logging.info(f"常駐服務已啟動: http://{args.host}:{server.server_port}")
+    logging.info(f"存取權杖已寫入 {Path(args.token_file).resolve()}")
+    logging.info(f"允許的輸出目錄: {', '.join(map(str, daemon.output_roots))}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("收到中斷信號，取消所有工作並關閉服務...")
+        daemon.cancel_all()
+    finally:
+        server.server_close()
+        api_client.close()
+        Path(args.token_file).unlink(missing_ok=True)
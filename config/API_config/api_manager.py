@@ -18,8 +18,7 @@ from config.config import Config
 # Use Config.Config.API_KEY_ENV_NAME instead of local definition
 # Config.API_KEY_ENV_NAME = "GEMINI_API_KEY" # Original line, now commented out
 
-# 不再使用硬編碼的默認API密鑰
-print(f"[INFO] API金鑰將從環境變數 {Config.API_KEY_ENV_NAME} 中讀取")
+# 不再使用硬編碼的默認API密鑰，API金鑰從環境變數中讀取 (匯入時不輸出任何內容)
 
 
 def get_api_key():
@@ -1,42 +1,28 @@
 import os
-import requests
-import google.generativeai as genai
-from requests.exceptions import RequestException
 from config.config import Config
 
 
 class TestApiConnection:
-    def __init__(self, api_key, nyaproxy):
+    def __init__(self, api_key, nyaproxy, backend=None, base_url=None):
         self.api_key = api_key
         self.nyaproxy = nyaproxy
+        self.backend = backend
+        self.base_url = base_url
         self.model_name = Config.DEFAULT_MODEL_NAME
 
     def test_api_connection(self):
+        # 後端模組在選用時才匯入，nyaproxy 運行不必載入 Gemini SDK
+        from core.backends import create_backend, resolve_backend_name
+
         try:
-            if not self.nyaproxy:
-                genai.configure(api_key=self.api_key)
-                model = genai.GenerativeModel(self.model_name)
-                response = model.generate_content("Hello, how are you?")
-                return True
-            else:
-                response = requests.post(
-                    f"http://localhost:{Config.nyaproxy_port}/api/gemini/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": self.model_name,
-                        "messages": [
-                            {"role": "user", "content": "Hello, how are you?"}
-                        ],
-                    },
-                    timeout=120,
-                )
-                response.raise_for_status()
-                return True
-        except requests.exceptions.RequestException as e:
-            print(f"[ERROR] 連接失敗 請求無法到達: {e}")
-            return False
+            backend = create_backend(
+                resolve_backend_name(self.backend, self.nyaproxy),
+                model=self.model_name,
+                # nyaproxy 自行輪詢金鑰，不轉發 Gemini 金鑰
+                api_key=None if self.nyaproxy and not self.backend else self.api_key,
+                base_url=self.base_url,
+            )
         except Exception as e:
-            print(f"[ERROR] 連接失敗 未知原因: {e}")
+            print(f"[ERROR] 連接失敗 無法建立後端: {e}")
             return False
+        return backend.test_connection()
@@ -10,11 +10,165 @@ class Config:
     DEFAULT_MAX_RETRIES = 3
     DEFAULT_API_KEY = os.getenv("GEMINI_API_KEY")  # 從環境變數中讀取API金鑰
     nyaproxy_port = 8500
+    # 回應格式: "full" 讓模型返回完整代碼, "diff" 只返回 行號 → 註釋 對應
+    OUTPUT_FORMATS = ("full", "diff")
+    DEFAULT_OUTPUT_FORMAT = "full"
+    # 串流模式下超過此秒數沒有收到新資料即視為停滯並中止
+    DEFAULT_STREAM_STALL_TIMEOUT = 60.0
+    # 使用 API 原生的 JSON 模式 (response_mime_type / response_format) 約束輸出
+    DEFAULT_JSON_MODE = True
+    # 以 Gemini context caching 快取固定指令；指令少於 CONTEXT_CACHE_MIN_TOKENS 時
+    # 不建立 (各模型的最小值為 1024–4096，取最大值以免送出注定失敗的請求)，
+    # 模型不支援時改用 system instruction。快取在運行結束時刪除
+    USE_CONTEXT_CACHE = True
+    CONTEXT_CACHE_TTL_SECONDS = 3600
+    CONTEXT_CACHE_MIN_TOKENS = 4096
+    # 模型後端 (見 core/backends)：單次請求的輸入 token 上限、generate_batch 同時進行的請求數、
+    # OpenAI 兼容接口的位址 (預設為本機 nyaproxy)、金鑰環境變數與請求超時，
+    # Gemini 非串流請求的超時 (秒，取消後仍在背景進行的請求最遲在此時結束)，
+    # 以及本機假後端每個請求模擬的延遲 (秒) 與串流時每段的字元數
+    DEFAULT_MAX_CONTEXT_TOKENS = 1048576
+    BACKEND_BATCH_CONCURRENCY = 8
+    OPENAI_BASE_URL = f"http://localhost:{nyaproxy_port}/api/gemini"
+    OPENAI_API_KEY_ENV_NAME = "OPENAI_API_KEY"
+    OPENAI_REQUEST_TIMEOUT = 120
+    GEMINI_REQUEST_TIMEOUT = 120
+    FAKE_BACKEND_LATENCY = 0.0
+    FAKE_BACKEND_CHUNK_CHARS = 64
+    # 批次模式 (Gemini Batch API)：API 位址與版本、查詢工作狀態的間隔 (秒)、
+    # 單一批次工作的請求內容上限 (內嵌請求上限為 20 MB)、每次 HTTP 請求的超時，
+    # 以及保存已提交工作的檢查點檔名 (位於增量快取目錄中)；
+    # 查詢或取回結果遇到暫時性錯誤時的重試間隔 (秒)，每次加倍直到上限
+    GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com"
+    GEMINI_API_VERSION = "v1beta"
+    BATCH_POLL_SECONDS = 30.0
+    BATCH_MAX_REQUEST_BYTES = 19 * 1024 * 1024
+    BATCH_REQUEST_TIMEOUT = 120
+    BATCH_CHECKPOINT_FILE = "batch_checkpoint.json"
+    BATCH_RETRY_BASE_SECONDS = 5.0
+    BATCH_RETRY_MAX_SECONDS = 300.0
+    # 增量處理：保存上次結果的目錄、變更片段附帶的上下文行數，
+    # 以及變更比例超過多少時改為完整重新處理
+    DEFAULT_CACHE_DIR = ".comment_maker_cache"
+    INCREMENTAL_CONTEXT_LINES = 3
+    INCREMENTAL_MAX_CHANGED_RATIO = 0.5
+    # 處理順序策略，見 core/scheduler.py
+    DEFAULT_PRIORITY = "scan"
+    # 背景寫入器：待寫入佇列上限、每批最多寫入數，以及替換前是否 fsync
+    WRITER_QUEUE_SIZE = 64
+    WRITER_BATCH_SIZE = 16
+    WRITER_FSYNC = True
+    # 低記憶體模式：單一文件超過此大小時逐段處理，每段不超過 CHUNK_MAX_BYTES；
+    # 同時在處理中的文件數上限為 工作線程數 × LOW_MEMORY_IN_FLIGHT_FACTOR
+    LOW_MEMORY_MAX_FILE_BYTES = 256 * 1024
+    CHUNK_MAX_BYTES = 32 * 1024
+    LOW_MEMORY_IN_FLIGHT_FACTOR = 2
+    # CPU 子進程池：預設子進程數 (0 表示不使用)、雜湊時每批傳給子進程的文件數，
+    # 以及交給子進程拼接註釋的最小代碼長度 (字元)
+    DEFAULT_CPU_WORKERS = 0
+    CPU_POOL_HASH_CHUNKSIZE = 32
+    CPU_POOL_MIN_SPLICE_BYTES = 64 * 1024
+    # 分散式工作佇列：租約長度、續約間隔、每個工作最多嘗試次數、
+    # SQLite 鎖定等待時間，以及工作進程等待其他進程的工作時的輪詢間隔 (秒)
+    QUEUE_LEASE_SECONDS = 300
+    QUEUE_HEARTBEAT_SECONDS = 60
+    QUEUE_MAX_ATTEMPTS = 3
+    QUEUE_BUSY_TIMEOUT = 30
+    QUEUE_POLL_SECONDS = 5
+    # 常駐服務：每個工作保留的日誌行數、保留的已結束工作數、請求內容大小上限，
+    # 以及啟動時寫入存取權杖的檔案 (權限 0600)
+    DAEMON_JOB_LOG_LINES = 500
+    DAEMON_MAX_FINISHED_JOBS = 100
+    DAEMON_MAX_REQUEST_BYTES = 1024 * 1024
+    DAEMON_TOKEN_FILE = ".comment_maker_daemon_token"
+    # 輸出目錄中的標記檔，常駐服務只允許覆寫帶有此標記 (本工具先前的輸出) 的目錄
+    OUTPUT_MARKER_FILE = ".comment_maker_output"
+    # 監看模式：最後一次變更後等待多少秒才處理 (合併連續儲存)，以及輪詢模式的比對間隔
+    WATCH_DEBOUNCE_SECONDS = 1.0
+    WATCH_POLL_INTERVAL = 2.0
+    # 讀取文件前的取樣檢查：取樣位元組數、依序嘗試的編碼、控制字元比例上限、
+    # 判斷為壓縮代碼的平均/最長行長，以及檢查自動產生標記的開頭行數
+    SNIFF_SAMPLE_BYTES = 8192
+    SNIFF_ENCODINGS = ("utf-8", "big5", "gb18030")
+    SNIFF_MAX_CONTROL_RATIO = 0.1
+    MINIFIED_AVG_LINE_LENGTH = 300
+    MINIFIED_MAX_LINE_LENGTH = 2000
+    GENERATED_HEADER_LINES = 10
+    # GUI 日誌面板的完整歷史記錄檔
+    GUI_LOG_HISTORY_FILE = "gui_history.log"
+    # 每日配額規劃：每個金鑰的預設限制 (0 表示不限制)、配額重置的時區，
+    # 以及估算 token 用的每 token 平均位元組數與各回應格式的輸出/輸入比例
+    DEFAULT_RPM_PER_KEY = 10
+    DEFAULT_RPD_PER_KEY = 250
+    DEFAULT_TPD_PER_KEY = 0
+    QUOTA_RESET_TIMEZONE = "America/Los_Angeles"
+    QUOTA_STATE_FILE = "quota_state.json"
+    BYTES_PER_TOKEN = 4
+    OUTPUT_TOKEN_RATIO = {"full": 1.3, "diff": 0.25}
+    # 估算運行時間用：每次請求的固定延遲 (秒) 與模型每秒輸出的 token 數
+    ESTIMATED_REQUEST_LATENCY = 2.0
+    ESTIMATED_OUTPUT_TOKENS_PER_SECOND = 150.0
 
 
 class PromptConfig:
-    def get_prompt(code, file_name=None):
-        """
+    # 結構化輸出的 JSON Schema，與提示詞要求的格式一致
+    CODE_RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {"code": {"type": "string"}},
+        "required": ["code"],
+    }
+    LINE_COMMENTS_RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "comments": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "line": {"type": "integer"},
+                        "comment": {"type": "string"},
+                    },
+                    "required": ["line", "comment"],
+                },
+            }
+        },
+        "required": ["comments"],
+    }
+
+    # 固定的指令區塊，作為 system instruction 發送，每次請求只需附上代碼本身
+    SYSTEM_INSTRUCTION = """你是一位專業的代碼註釋專家，精通各種程式語言。
+    請為用戶提供的代碼的每一行添加簡潔明了的中文註釋。註釋應該放在每行代碼的末尾。
+    請根據代碼自動判斷程式語言，並使用該語言的正確註釋符號。
+    註釋應該解釋代碼的功能和目的，而不僅僅是翻譯代碼。
+    對於空行或者已經有註釋的行，請保持原樣。
+    對於較長的代碼行，請確保註釋簡潔，不要使行變得過長。
+
+    請遵循以下格式規則：
+    1. 自動識別代碼語言，並使用適當的註釋符號（如Python使用#，JavaScript使用//等）
+    2. 在代碼行末尾添加註釋，格式為"代碼 # 註釋"（根據語言使用相應的註釋符號）千萬不要使用'''格式
+    3. 保持原始代碼的縮進和格式
+    4. 不要修改原始代碼,就算你認爲需要修改 或是無用的代碼
+    5. 不要添加額外的解釋或說明，只返回帶註釋的代碼
+    6. 對於複雜的函數或類，可以在定義行添加簡短的功能說明
+    7. 請以json格式返回 把代碼放在code字段 {"code": "代碼"}
+
+    請直接返回帶有行尾註釋的完整代碼，不要有任何額外的解釋。"""
+
+    LINE_COMMENTS_SYSTEM_INSTRUCTION = """你是一位專業的代碼註釋專家，精通各種程式語言。
+    用戶提供的代碼每一行前面都有 "行號| " 前綴，前綴不屬於代碼本身。
+    請為需要說明的代碼行撰寫簡潔明了的中文註釋，註釋應該解釋代碼的功能和目的，而不僅僅是翻譯代碼。
+
+    請遵循以下格式規則：
+    1. 不要返回代碼，只返回行號和註釋
+    2. 註釋內容不要包含註釋符號（如#、//），也不要換行
+    3. 空行或者已經有註釋的行不要返回
+    4. 對於複雜的函數或類，可以在定義行添加簡短的功能說明
+    5. 請以json格式返回 {"comments": [{"line": 行號, "comment": "註釋"}]}
+
+    請直接返回json，不要有任何額外的解釋。"""
+
+    def get_user_prompt(code, file_name=None):
+        """產生每個文件各自的提示詞 (不含固定指令)
 
         Args:
             code: 代碼內容
@@ -28,27 +182,72 @@ class PromptConfig:
         if file_name:
             file_info = f"文件名: {file_name}\n"
 
-        return f"""你是一位專業的代碼註釋專家，精通各種程式語言。
-    {file_info}
-    請為以下代碼的每一行添加簡潔明了的中文註釋。註釋應該放在每行代碼的末尾。
-    請根據代碼自動判斷程式語言，並使用該語言的正確註釋符號。
-    註釋應該解釋代碼的功能和目的，而不僅僅是翻譯代碼。
-    對於空行或者已經有註釋的行，請保持原樣。
-    對於較長的代碼行，請確保註釋簡潔，不要使行變得過長。
+        return f"""{file_info}以下是需要添加註釋的代碼：
 
-    請遵循以下格式規則：
-    1. 自動識別代碼語言，並使用適當的註釋符號（如Python使用#，JavaScript使用//等）
-    2. 在代碼行末尾添加註釋，格式為"代碼 # 註釋"（根據語言使用相應的註釋符號）千萬不要使用'''格式
-    3. 保持原始代碼的縮進和格式
-    4. 不要修改原始代碼,就算你認爲需要修改 或是無用的代碼
-    5. 不要添加額外的解釋或說明，只返回帶註釋的代碼
-    6. 對於複雜的函數或類，可以在定義行添加簡短的功能說明
-    7. 請以json格式返回 把代碼放在code字段 {{"code": "代碼"}}
+```
+{code}
+```"""
 
-    以下是需要添加註釋的代碼：
+    def get_line_comments_user_prompt(numbered_code, file_name=None, target_lines=None):
+        """產生 diff 格式下每個文件各自的提示詞 (不含固定指令)
 
-    ```
-    {code}
-    ```
+        Args:
+            numbered_code: 已在每行前加上行號的代碼內容
+            file_name: 文件名
+            target_lines: 只需要註釋的行號；其餘行只作為上下文參考
 
-    請直接返回帶有行尾註釋的完整代碼，不要有任何額外的解釋。"""
+        Returns:
+            str: 提示詞
+        """
+        prompt = PromptConfig.get_user_prompt(numbered_code, file_name)
+        if target_lines:
+            line_list = ", ".join(str(n) for n in sorted(target_lines))
+            prompt += (
+                f"\n\n以上只是文件中修改過的片段。只需為以下行號返回註釋：{line_list}"
+                "\n其餘行僅作為上下文參考，不要返回它們的註釋。"
+            )
+        return prompt
+
+    def get_prompt(code, file_name=None):
+        """產生包含固定指令與代碼的完整提示詞，供不支援 system instruction 的場合使用
+
+        Args:
+            code: 代碼內容
+            file_name: 文件名
+
+        Returns:
+            str: 提示詞
+        """
+        return (
+            f"{PromptConfig.SYSTEM_INSTRUCTION}\n\n"
+            f"{PromptConfig.get_user_prompt(code, file_name)}"
+        )
+
+    def get_line_comments_prompt(numbered_code, file_name=None):
+        """產生包含 diff 格式固定指令與代碼的完整提示詞，供批次模式使用
+
+        Args:
+            numbered_code: 已在每行前加上行號的代碼內容
+            file_name: 文件名
+
+        Returns:
+            str: 提示詞
+        """
+        return (
+            f"{PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION}\n\n"
+            f"{PromptConfig.get_line_comments_user_prompt(numbered_code, file_name)}"
+        )
+
+    def get_correction_note(problem):
+        """產生附加在原提示詞後的修正說明，用於回應無效時立即重試
+
+        Args:
+            problem: 上一次回應的問題描述
+
+        Returns:
+            str: 修正說明
+        """
+        return f"""
+
+    注意：你上一次的回應無效，問題是：{problem}
+    請嚴格按照上述格式與規則重新返回結果，不要修改或遺漏任何原始代碼。"""
@@ -1,16 +1,7 @@
 import os
-import yaml
 import logging
 from exceptions.exceptions import FileLoadError, ConfigFormatError
 
-# 設定日誌（你可以根據自己的需求調整）
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="[%(levelname)s] %(message)s",
-    filename="test.log",
-    filemode="w",
-)
-
 
 def exclude_patterns():
     """
@@ -18,6 +9,8 @@ def exclude_patterns():
     包含 config/exclude.yaml 的設定與 .gitignore 的內容。
     遇到錯誤會拋出具體的異常，而不是回傳 False 或只 print。
     """
+    import yaml
+
     combined_patterns = []
 
     # --- 處理 config/exclude.yaml (獨立 try 區塊) ---
@@ -77,15 +70,57 @@ def exclude_patterns():
     return final_patterns
 
 
+def generated_file_settings():
+    """
+    載入 config/exclude.yaml 中 generated 區塊的設定 (自動產生文件的判斷規則)。
+    檔案或區塊不存在時返回空字典，使用內建規則。
+    """
+    import yaml
+
+    exclude_yaml_path = "config/exclude.yaml"
+    try:
+        with open(exclude_yaml_path, "r", encoding="utf-8") as f:
+            yaml_config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
+    except yaml.YAMLError as e:
+        logging.error(f"解析 '{exclude_yaml_path}' 失敗，請檢查檔案格式！錯誤訊息：{e}")
+        raise ConfigFormatError(
+            f"排除設定檔 '{exclude_yaml_path}' 解析失敗: {e}"
+        ) from e
+
+    settings = yaml_config.get("generated") if isinstance(yaml_config, dict) else None
+    if settings is None:
+        return {}
+    if not isinstance(settings, dict):
+        raise ConfigFormatError(
+            f"排除設定檔 '{exclude_yaml_path}' 格式錯誤: generated 必須是對應表。"
+        )
+    return settings
+
+
 def save_exclude_patterns(patterns):
     """
-    將排除模式保存到 config/exclude.yaml。
+    將排除模式保存到 config/exclude.yaml，保留檔案中的其他設定 (例如 generated)。
     """
+    import yaml
+
     exclude_yaml_path = "config/exclude.yaml"
     try:
+        yaml_config = {}
+        if os.path.exists(exclude_yaml_path):
+            with open(exclude_yaml_path, "r", encoding="utf-8") as f:
+                loaded = yaml.safe_load(f)
+            if isinstance(loaded, dict):
+                yaml_config = loaded
+        yaml_config["exclude"] = patterns
         with open(exclude_yaml_path, "w", encoding="utf-8") as f:
             yaml.dump(
-                {"exclude": patterns}, f, allow_unicode=True, default_flow_style=False
+                yaml_config,
+                f,
+                allow_unicode=True,
+                default_flow_style=False,
+                sort_keys=False,
             )
         logging.info(f"排除模式已成功保存到 '{exclude_yaml_path}'。")
     except Exception as e:
@@ -0,0 +1,60 @@
+"""
+模型後端
+SendCode 透過統一的 LLMBackend 接口呼叫模型，各後端的模組在選用時才匯入，
+不使用的 SDK 不會增加啟動時間。
+"""
+
+import importlib
+
+from core.backends.base import (
+    BackendCapabilities,
+    LLMBackend,
+    call_cancellable,
+    closing_on_cancel,
+)
+
+# 後端名稱 → (模組, 類別名)
+BACKENDS = {
+    "gemini": ("core.backends.gemini", "GeminiBackend"),
+    "openai": ("core.backends.openai_compat", "OpenAICompatibleBackend"),
+    "fake": ("core.backends.fake", "FakeBackend"),
+}
+
+
+def resolve_backend_name(backend=None, nyaproxy=False):
+    """決定使用的後端：明確指定的優先，否則 nyaproxy 使用 OpenAI 兼容接口，其餘使用 Gemini SDK"""
+    return backend or ("openai" if nyaproxy else "gemini")
+
+
+def create_backend(name, **options):
+    """建立指定名稱的後端。
+
+    Args:
+        name (str): BACKENDS 中的後端名稱。
+        **options: 傳給後端建構子的參數 (model、api_key、base_url、stall_timeout)。
+
+    Returns:
+        LLMBackend: 後端實例。
+
+    Raises:
+        ValueError: 未知的後端名稱。
+    """
+    try:
+        module_name, class_name = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"未知的後端: {name} (可用: {', '.join(BACKENDS)})"
+        ) from None
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    return backend_class(**options)
+
+
+__all__ = [
+    "BACKENDS",
+    "BackendCapabilities",
+    "LLMBackend",
+    "call_cancellable",
+    "closing_on_cancel",
+    "create_backend",
+    "resolve_backend_name",
+]
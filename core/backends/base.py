@@ -0,0 +1,243 @@
+import threading
+from contextlib import contextmanager
+
+from config.config import Config
+from core.quota_planner import estimate_tokens
+from exceptions.exceptions import OperationCancelledError
+
+
+class BackendCapabilities:
+    """後端支援的功能，SendCode 依此決定是否使用串流、JSON 模式等"""
+
+    __slots__ = (
+        "streaming",
+        "json_mode",
+        "token_counting",
+        "max_context_tokens",
+        "native_batch",
+    )
+
+    def __init__(
+        self,
+        streaming=False,
+        json_mode=False,
+        token_counting=False,
+        max_context_tokens=Config.DEFAULT_MAX_CONTEXT_TOKENS,
+        native_batch=False,
+    ):
+        """
+        Args:
+            streaming (bool): 支援串流回應。
+            json_mode (bool): 支援以 JSON Schema 約束輸出。
+            token_counting (bool): count_tokens() 返回模型實際的 token 數，
+                否則只是以文本長度估算。
+            max_context_tokens (int): 單次請求的輸入 token 上限。
+            native_batch (bool): generate_batch() 使用服務端的批次接口，
+                否則只是並行發送一般請求。
+        """
+        self.streaming = streaming
+        self.json_mode = json_mode
+        self.token_counting = token_counting
+        self.max_context_tokens = max_context_tokens
+        self.native_batch = native_batch
+
+
+def call_cancellable(func, cancel_token=None, on_cancel=None):
+    """在背景線程執行阻塞的請求，取消時不等待其完成就立即返回
+
+    沒有提供 on_cancel (或其無法中止請求) 時，請求本身不會被中止，而是在背景線程中
+    繼續進行直到完成；呼叫者應為請求設定超時 (例如 Gemini 的 request_options)，
+    讓被放棄的請求最終結束。
+
+    Args:
+        func: 發送請求的函數。
+        cancel_token (CancellationToken, optional): 取消信號，None 時直接調用 func。
+        on_cancel: 取消時調用，用於關閉連線等中止請求的動作。
+
+    Raises:
+        OperationCancelledError: 請求完成前被取消。
+    """
+    if cancel_token is None:
+        return func()
+    cancel_token.check()
+    result = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            result["value"] = func()
+        except BaseException as e:
+            result["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    while not done.wait(cancel_token.POLL_INTERVAL):
+        if cancel_token.cancelled:
+            if on_cancel is not None:
+                on_cancel()
+            cancel_token.check()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+@contextmanager
+def closing_on_cancel(cancel_token, close):
+    """期間內 cancel_token 被取消時在背景調用 close
+
+    串流讀取會阻塞在網路上，只在片段之間檢查取消信號無法及時結束；
+    取消時關閉底層的回應，讓阻塞的讀取立即返回並釋放連線。
+
+    Args:
+        cancel_token (CancellationToken, optional): 取消信號，None 時不做任何事。
+        close: 關閉回應的函數。
+    """
+    if cancel_token is None:
+        yield
+        return
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(cancel_token.POLL_INTERVAL):
+            if cancel_token.cancelled:
+                try:
+                    close()
+                except Exception:
+                    pass
+                return
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        yield
+    finally:
+        finished.set()
+
+
+class LLMBackend:
+    """模型後端的共同接口。
+
+    後端只負責把提示詞送到模型並返回原始文本；重試、退避、回應解析與驗證
+    都由 SendCode 處理，因此所有後端的行為一致。子類至少實作 generate()，
+    支援串流的後端再實作 stream()。請求失敗時直接拋出異常，錯誤訊息中包含
+    429 / quota 等字樣時 SendCode 會以較長的退避時間重試。
+    """
+
+    name = ""
+    capabilities = BackendCapabilities()
+
+    def __init__(
+        self,
+        model=None,
+        api_key=None,
+        base_url=None,
+        stall_timeout=Config.DEFAULT_STREAM_STALL_TIMEOUT,
+    ):
+        """
+        Args:
+            model (str, optional): 模型名稱，None 時使用 Config.DEFAULT_MODEL_NAME。
+            api_key (str, optional): API 金鑰。
+            base_url (str, optional): 服務位址，只有 HTTP 後端使用。
+            stall_timeout (float): 串流超過此秒數沒有新資料即視為停滯。
+        """
+        self.model_name = model or Config.DEFAULT_MODEL_NAME
+        self.api_key = api_key
+        self.base_url = base_url
+        self.stall_timeout = stall_timeout
+
+    def prepare(self, system_instruction):
+        """預先建立指定 system instruction 的模型 (例如 context cache)，預設不做任何事"""
+
+    def close(self):
+        """釋放服務端的資源 (例如 context cache)，預設不做任何事"""
+
+    def generate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        """發送一次請求並返回回應文本。
+
+        Args:
+            prompt (str): 提示詞。
+            system_instruction (str, optional): 固定指令。
+            schema (dict, optional): JSON Schema；提供時要求模型以 JSON 模式輸出。
+            cancel_token (CancellationToken, optional): 取消信號。
+
+        Returns:
+            str: 回應文本，模型沒有返回內容時為空字串。
+
+        Raises:
+            OperationCancelledError: 請求完成前被取消。
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, system_instruction=None, schema=None, cancel_token=None):
+        """以串流方式發送請求，逐段產生回應文本。
+
+        cancel_token 被取消或生成器被關閉時應關閉底層的回應與連線。
+
+        Raises:
+            StreamStalledError: 讀取超時。
+        """
+        raise NotImplementedError(f"{self.name} 後端不支援串流")
+
+    async def agenerate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        """generate() 的非同步版本，預設在線程池中執行同步請求"""
+        import asyncio
+
+        return await asyncio.to_thread(
+            self.generate, prompt, system_instruction, schema, cancel_token
+        )
+
+    def generate_batch(
+        self,
+        prompts,
+        system_instruction=None,
+        schema=None,
+        cancel_token=None,
+        concurrency=Config.BACKEND_BATCH_CONCURRENCY,
+    ):
+        """發送多個使用相同指令的請求。
+
+        預設以 agenerate() 並行發送，同時進行的請求不超過 concurrency 個。
+
+        Returns:
+            list: 與 prompts 順序相同，成功時為回應文本，失敗時為異常物件。
+
+        Raises:
+            OperationCancelledError: 被取消。
+        """
+        # asyncio 連帶匯入 ssl 等模組，只在使用時才載入以免拖慢 CLI 啟動
+        import asyncio
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(max(1, concurrency))
+
+            async def run_one(prompt):
+                async with semaphore:
+                    try:
+                        return await self.agenerate(
+                            prompt, system_instruction, schema, cancel_token
+                        )
+                    except OperationCancelledError:
+                        raise
+                    except Exception as e:
+                        return e
+
+            return await asyncio.gather(*(run_one(prompt) for prompt in prompts))
+
+        return asyncio.run(run_all())
+
+    def count_tokens(self, text):
+        """計算文本的 token 數；不支援 token 計數的後端以文本長度估算"""
+        return estimate_tokens(text)
+
+    def test_connection(self):
+        """發送簡短的請求確認後端可用"""
+        try:
+            self.generate("Hello, how are you?")
+            return True
+        except Exception as e:
+            print(f"[ERROR] 連接失敗 ({self.name}): {e}")
+            return False
@@ -0,0 +1,105 @@
+import json
+import re
+import time
+
+from config.config import Config, PromptConfig
+from core.backends.base import BackendCapabilities, LLMBackend
+from core.comment_splicer import splice_line_comments
+
+_FILE_NAME_PATTERN = re.compile(r"^文件名: (.+)$", re.MULTILINE)
+_NUMBERED_LINE_PATTERN = re.compile(r"^\s*(\d+)\| (.*)$")
+_TARGET_LINES_PATTERN = re.compile(r"只需為以下行號返回註釋：([\d, ]+)")
+
+
+class FakeBackend(LLMBackend):
+    """不連網的本機後端，依提示詞產生確定性的回應。
+
+    從提示詞中取出代碼，為每一行非空代碼產生 "第 N 行" 註釋；full 格式
+    返回拼接好的代碼，diff 格式返回行號與註釋。相同的輸入永遠得到相同的輸出，
+    可用於測試整個處理流程或在沒有網路的情況下做壓力測試。
+    """
+
+    name = "fake"
+    capabilities = BackendCapabilities(
+        streaming=True,
+        json_mode=True,
+        token_counting=True,
+        max_context_tokens=Config.DEFAULT_MAX_CONTEXT_TOKENS,
+    )
+
+    def __init__(self, model=None, api_key=None, base_url=None, latency=None, **options):
+        """
+        Args:
+            latency (float, optional): 每個請求模擬的延遲 (秒)，
+                None 時使用 Config.FAKE_BACKEND_LATENCY。
+        """
+        super().__init__(model, api_key, base_url, **options)
+        self.latency = Config.FAKE_BACKEND_LATENCY if latency is None else latency
+
+    def _wait(self, cancel_token):
+        if cancel_token is not None:
+            cancel_token.sleep(self.latency)
+        elif self.latency:
+            time.sleep(self.latency)
+
+    def _respond(self, prompt, system_instruction, schema):
+        """依提示詞產生回應文本"""
+        if "```\n" not in prompt:
+            return "Hello!"
+        code = prompt.split("```\n", 1)[1].rsplit("\n```", 1)[0]
+        match = _FILE_NAME_PATTERN.search(prompt)
+        file_name = match.group(1).strip() if match else None
+
+        if system_instruction == PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION:
+            match = _TARGET_LINES_PATTERN.search(prompt)
+            targets = (
+                {int(n) for n in match.group(1).replace(" ", "").split(",") if n}
+                if match
+                else None
+            )
+            comments = []
+            for line in code.splitlines():
+                numbered = _NUMBERED_LINE_PATTERN.match(line)
+                if not numbered or not numbered.group(2).strip():
+                    continue
+                line_number = int(numbered.group(1))
+                if targets is None or line_number in targets:
+                    comments.append(
+                        {"line": line_number, "comment": f"第 {line_number} 行"}
+                    )
+            return json.dumps({"comments": comments}, ensure_ascii=False)
+
+        comments = {
+            index: f"第 {index} 行"
+            for index, line in enumerate(code.splitlines(), start=1)
+            if line.strip()
+        }
+        commented_code, _ = splice_line_comments(code, comments, file_name)
+        # 與提示詞要求的格式相同，不論是否使用 JSON 模式都返回 {"code": ...}
+        return json.dumps({"code": commented_code}, ensure_ascii=False)
+
+    def generate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        self._wait(cancel_token)
+        return self._respond(prompt, system_instruction, schema)
+
+    async def agenerate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        import asyncio
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if cancel_token is not None:
+            cancel_token.check()
+        return self._respond(prompt, system_instruction, schema)
+
+    def stream(self, prompt, system_instruction=None, schema=None, cancel_token=None):
+        self._wait(cancel_token)
+        text = self._respond(prompt, system_instruction, schema)
+        size = Config.FAKE_BACKEND_CHUNK_CHARS
+        for start in range(0, len(text), size):
+            if cancel_token is not None and cancel_token.cancelled:
+                break
+            yield text[start : start + size]
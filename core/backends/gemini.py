@@ -0,0 +1,163 @@
+import datetime
+import threading
+
+from config.config import Config
+from core.backends.base import (
+    BackendCapabilities,
+    LLMBackend,
+    call_cancellable,
+    closing_on_cancel,
+)
+
+
+def _close_stream(response):
+    """關閉 SDK 的串流回應：SDK 沒有公開的關閉方法，取消底層的 gRPC 串流或迭代器"""
+    iterator = getattr(response, "_iterator", None)
+    for name in ("cancel", "close"):
+        method = getattr(iterator, name, None)
+        if callable(method):
+            method()
+            return
+
+
+class GeminiBackend(LLMBackend):
+    """透過 google-generativeai SDK 呼叫 Gemini
+
+    SDK 的非串流請求無法從外部中止：取消時 call_cancellable 立即返回，但請求仍在
+    背景線程中進行，直到完成或達到 Config.GEMINI_REQUEST_TIMEOUT 為止。
+    串流請求則在取消時關閉底層的串流。
+    """
+
+    name = "gemini"
+    capabilities = BackendCapabilities(
+        streaming=True,
+        json_mode=True,
+        token_counting=True,
+        max_context_tokens=Config.DEFAULT_MAX_CONTEXT_TOKENS,
+    )
+
+    def __init__(self, model=None, api_key=None, base_url=None, **options):
+        super().__init__(model, api_key or Config.DEFAULT_API_KEY, base_url, **options)
+        # 只有使用 Gemini SDK 的運行才匯入它，其他後端省下數秒的匯入時間
+        import google.generativeai as genai
+
+        self._genai = genai
+        genai.configure(api_key=self.api_key)
+        # 每種 system instruction 對應一個模型實例 (full / diff 兩種格式)
+        self._models = {}
+        self._models_lock = threading.Lock()
+        # 建立的 context cache，close() 時刪除，不必付費保留到 TTL 結束
+        self._cached_contents = []
+
+    def prepare(self, system_instruction):
+        self._get_model(system_instruction)
+
+    def _get_model(self, system_instruction):
+        """取得帶有指定 system instruction 的模型，同一指令只建立一次"""
+        with self._models_lock:
+            model = self._models.get(system_instruction)
+            if model is None:
+                model = self._create_model(system_instruction)
+                self._models[system_instruction] = model
+            return model
+
+    def _create_model(self, system_instruction):
+        """建立模型，固定指令夠長時放進 context cache
+
+        context cache 有最小 token 數限制且並非所有模型都支援；指令太短時
+        不嘗試建立，建立失敗時改用一般的 system instruction。固定前綴同樣能
+        命中隱式快取。
+        """
+        if system_instruction is None:
+            return self._genai.GenerativeModel(self.model_name)
+        if Config.USE_CONTEXT_CACHE and self._cacheable(system_instruction):
+            try:
+                from google.generativeai import caching
+
+                cached_content = caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    system_instruction=system_instruction,
+                    ttl=datetime.timedelta(seconds=Config.CONTEXT_CACHE_TTL_SECONDS),
+                )
+                self._cached_contents.append(cached_content)
+                print(f"[INFO] 已建立 context cache: {cached_content.name}")
+                return self._genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_content
+                )
+            except Exception as e:
+                print(f"[INFO] 無法建立 context cache，改用 system instruction: {e}")
+        return self._genai.GenerativeModel(
+            self.model_name, system_instruction=system_instruction
+        )
+
+    def _cacheable(self, system_instruction):
+        """固定指令的 token 數是否達到 context cache 的最小值"""
+        try:
+            tokens = (
+                self._genai.GenerativeModel(self.model_name)
+                .count_tokens(system_instruction)
+                .total_tokens
+            )
+        except Exception as e:
+            print(f"[INFO] 無法計算固定指令的 token 數，不使用 context cache: {e}")
+            return False
+        return tokens >= Config.CONTEXT_CACHE_MIN_TOKENS
+
+    def close(self):
+        """刪除建立的 context cache"""
+        with self._models_lock:
+            cached_contents, self._cached_contents = self._cached_contents, []
+            self._models.clear()
+        for cached_content in cached_contents:
+            try:
+                cached_content.delete()
+                print(f"[INFO] 已刪除 context cache: {cached_content.name}")
+            except Exception as e:
+                print(f"[WARNING] 刪除 context cache {cached_content.name} 失敗: {e}")
+
+    @staticmethod
+    def _generation_config(schema):
+        """JSON 模式下的 generation_config，未提供 schema 時返回 None"""
+        if schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": schema}
+
+    def generate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        model = self._get_model(system_instruction)
+        generation_config = self._generation_config(schema)
+        response = call_cancellable(
+            lambda: model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                # 取消後被放棄的請求最遲在超時後結束，不會無限期佔用線程與連線
+                request_options={"timeout": Config.GEMINI_REQUEST_TIMEOUT},
+            ),
+            cancel_token,
+        )
+        if not response or not hasattr(response, "text"):
+            return ""
+        return response.text or ""
+
+    def stream(self, prompt, system_instruction=None, schema=None, cancel_token=None):
+        model = self._get_model(system_instruction)
+        response = model.generate_content(
+            prompt,
+            stream=True,
+            generation_config=self._generation_config(schema),
+        )
+        try:
+            with closing_on_cancel(cancel_token, lambda: _close_stream(response)):
+                for chunk in response:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+                    text = getattr(chunk, "text", "")
+                    if text:
+                        yield text
+        finally:
+            # 停滯或提前結束時不再讀取剩餘的回應
+            _close_stream(response)
+
+    def count_tokens(self, text):
+        return self._get_model(None).count_tokens(text).total_tokens
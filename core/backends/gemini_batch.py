@@ -0,0 +1,205 @@
+import json
+
+from config.config import Config
+from core.backends.base import call_cancellable
+from exceptions.exceptions import BatchJobError
+
+# 批次工作結束時的狀態，其餘狀態 (PENDING、RUNNING) 需要繼續等待
+TERMINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED", "EXPIRED")
+
+
+def split_batch_requests(requests, max_bytes=Config.BATCH_MAX_REQUEST_BYTES):
+    """把請求分成多組，每組的提示詞總大小不超過 max_bytes
+
+    超過上限的單一請求自成一組，由服務端決定是否接受。
+
+    Args:
+        requests: (key, prompt) 的列表。
+        max_bytes (int): 每組的大小上限。
+
+    Returns:
+        list: 每組為 (key, prompt) 的列表。
+    """
+    groups, current, size = [], [], 0
+    for key, prompt in requests:
+        request_size = len(prompt.encode("utf-8")) + len(key.encode("utf-8"))
+        if current and size + request_size > max_bytes:
+            groups.append(current)
+            current, size = [], 0
+        current.append((key, prompt))
+        size += request_size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _response_text(response):
+    """取出 GenerateContentResponse 中第一個候選的文本"""
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiBatchClient:
+    """Gemini Batch API 的 REST 客戶端。
+
+    一次提交多個 generateContent 請求 (內嵌於請求體)，服務端在背景處理，
+    完成後再取回結果。費用約為一般請求的一半，但完成時間不固定 (最長 24 小時)，
+    適合不需要即時結果的大量離線處理。base_url 可指向本機的模擬服務以便測試。
+    """
+
+    def __init__(self, api_key=None, model=None, base_url=None, cancel_token=None):
+        """
+        Args:
+            api_key (str, optional): Gemini API 金鑰，None 時使用 Config.DEFAULT_API_KEY。
+            model (str, optional): 模型名稱，None 時使用 Config.DEFAULT_MODEL_NAME。
+            base_url (str, optional): API 位址，None 時使用 Config.GEMINI_API_BASE_URL。
+            cancel_token (CancellationToken, optional): 取消信號。
+        """
+        self.api_key = api_key or Config.DEFAULT_API_KEY
+        self.model_name = model or Config.DEFAULT_MODEL_NAME
+        self.base_url = (base_url or Config.GEMINI_API_BASE_URL).rstrip("/")
+        self.cancel_token = cancel_token
+        import requests
+
+        self._requests = requests
+
+    def _call(self, method, path, body=None, raw=False):
+        """發送請求並返回解析後的 JSON (raw 時返回原始文本)
+
+        Raises:
+            BatchJobError: 連線失敗、HTTP 錯誤或回應不是 JSON；
+                連線失敗與 HTTP 429、5xx 標記為暫時性錯誤。
+            OperationCancelledError: 請求完成前被取消。
+        """
+        url = f"{self.base_url}/{path}"
+        # 取消時關閉 session 以中止進行中的連線
+        session = self._requests.Session()
+        try:
+            response = call_cancellable(
+                lambda: session.request(
+                    method,
+                    url,
+                    headers={
+                        "Content-Type": "application/json",
+                        "x-goog-api-key": self.api_key or "",
+                    },
+                    json=body,
+                    timeout=Config.BATCH_REQUEST_TIMEOUT,
+                ),
+                self.cancel_token,
+                on_cancel=session.close,
+            )
+        except self._requests.exceptions.RequestException as e:
+            raise BatchJobError(f"{method} {url} 失敗: {e}", transient=True) from e
+        finally:
+            session.close()
+        if response.status_code >= 400:
+            raise BatchJobError(
+                f"{method} {url} 失敗: HTTP {response.status_code} {response.text[:500]}",
+                transient=response.status_code == 429 or response.status_code >= 500,
+            )
+        if raw:
+            return response.text
+        try:
+            return response.json()
+        except ValueError as e:
+            raise BatchJobError(f"{method} {url} 的回應不是 JSON: {e}") from e
+
+    def create(self, requests, display_name, json_mode=True):
+        """提交批次工作
+
+        Args:
+            requests: (key, prompt) 的列表，key 會隨結果返回以對應請求。
+            display_name (str): 工作名稱，方便在控制台辨識。
+            json_mode (bool): 要求模型以 JSON 輸出。
+
+        Returns:
+            str: 工作名稱 (batches/...)，之後以此查詢狀態。
+        """
+        items = []
+        for key, prompt in requests:
+            request = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+            if json_mode:
+                request["generationConfig"] = {"responseMimeType": "application/json"}
+            items.append({"request": request, "metadata": {"key": key}})
+        body = {
+            "batch": {
+                "displayName": display_name,
+                "inputConfig": {"requests": {"requests": items}},
+            }
+        }
+        operation = self._call(
+            "POST",
+            f"{Config.GEMINI_API_VERSION}/models/{self.model_name}:batchGenerateContent",
+            body,
+        )
+        name = operation.get("name") or (operation.get("metadata") or {}).get("name")
+        if not name:
+            raise BatchJobError(f"建立批次工作的回應中沒有工作名稱: {operation}")
+        return name
+
+    def get(self, name):
+        """查詢批次工作，返回服務端的原始內容"""
+        return self._call("GET", f"{Config.GEMINI_API_VERSION}/{name}")
+
+    def cancel(self, name):
+        """取消批次工作"""
+        self._call("POST", f"{Config.GEMINI_API_VERSION}/{name}:cancel", {})
+
+    @staticmethod
+    def state(batch):
+        """取出工作狀態，去掉 BATCH_STATE_ / JOB_STATE_ 前綴 (例如 SUCCEEDED)"""
+        state = (batch.get("metadata") or {}).get("state") or batch.get("state") or ""
+        for prefix in ("BATCH_STATE_", "JOB_STATE_"):
+            if state.startswith(prefix):
+                state = state[len(prefix) :]
+        if not state and batch.get("done"):
+            state = "FAILED" if batch.get("error") else "SUCCEEDED"
+        return state or "PENDING"
+
+    def results(self, batch, keys=()):
+        """取出已完成工作的結果
+
+        Args:
+            batch (dict): get() 返回的內容。
+            keys: 提交時的 key 順序，結果中沒有 metadata 時依順序對應。
+
+        Returns:
+            dict: key → (回應文本, 錯誤訊息)，兩者之一為 None。
+
+        Raises:
+            BatchJobError: 結果中沒有回應內容。
+        """
+        output = batch.get("response") or (batch.get("metadata") or {}).get("output") or {}
+        entries = output.get("inlinedResponses")
+        if isinstance(entries, dict):
+            entries = entries.get("inlinedResponses")
+        if entries is None and output.get("responsesFile"):
+            # 結果較大時服務端改為寫入檔案，每行一個 JSON
+            text = self._call(
+                "GET",
+                f"download/{Config.GEMINI_API_VERSION}/{output['responsesFile']}:download?alt=media",
+                raw=True,
+            )
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if entries is None:
+            raise BatchJobError(f"批次工作的結果中沒有回應內容: {batch.get('name')}")
+
+        keys = list(keys)
+        results = {}
+        for index, entry in enumerate(entries):
+            key = (entry.get("metadata") or {}).get("key") or entry.get("key")
+            if key is None and index < len(keys):
+                key = keys[index]
+            if key is None:
+                continue
+            error = entry.get("error")
+            if error:
+                message = error.get("message") if isinstance(error, dict) else error
+                results[key] = (None, str(message))
+            else:
+                results[key] = (_response_text(entry.get("response") or {}), None)
+        return results
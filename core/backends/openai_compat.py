@@ -0,0 +1,141 @@
+import json
+import os
+
+from config.config import Config
+from core.backends.base import (
+    BackendCapabilities,
+    LLMBackend,
+    call_cancellable,
+    closing_on_cancel,
+)
+from exceptions.exceptions import StreamStalledError
+
+
+def _strict_schema(schema):
+    """為每個 object 加上 additionalProperties: false
+
+    OpenAI 的 strict 模式要求每個 object 都明確禁止額外字段，否則整個請求以
+    400 拒絕；Gemini 的 response_schema 不接受此字段，因此只在這裡補上。
+    """
+    if isinstance(schema, dict):
+        strict = {key: _strict_schema(value) for key, value in schema.items()}
+        if strict.get("type") == "object":
+            strict["additionalProperties"] = False
+        return strict
+    if isinstance(schema, list):
+        return [_strict_schema(item) for item in schema]
+    return schema
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """透過 OpenAI 兼容的 /chat/completions 接口呼叫模型，預設連到本機的 nyaproxy"""
+
+    name = "openai"
+    capabilities = BackendCapabilities(
+        streaming=True,
+        json_mode=True,
+        max_context_tokens=Config.DEFAULT_MAX_CONTEXT_TOKENS,
+    )
+
+    def __init__(self, model=None, api_key=None, base_url=None, **options):
+        super().__init__(
+            model,
+            api_key or os.getenv(Config.OPENAI_API_KEY_ENV_NAME),
+            (base_url or Config.OPENAI_BASE_URL).rstrip("/"),
+            **options,
+        )
+        import requests
+
+        self._requests = requests
+
+    @property
+    def endpoint(self):
+        return f"{self.base_url}/chat/completions"
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        # nyaproxy 自行輪詢金鑰，不需要 Authorization
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _payload(self, prompt, system_instruction, schema, stream=False):
+        """組成請求內容，固定指令放在 system 角色"""
+        messages = []
+        if system_instruction:
+            messages.append({"role": "system", "content": system_instruction})
+        messages.append({"role": "user", "content": prompt})
+        payload = {"model": self.model_name, "messages": messages}
+        if stream:
+            payload["stream"] = True
+        if schema is not None:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "response",
+                    "schema": _strict_schema(schema),
+                    "strict": True,
+                },
+            }
+        return payload
+
+    def generate(
+        self, prompt, system_instruction=None, schema=None, cancel_token=None
+    ):
+        payload = self._payload(prompt, system_instruction, schema)
+        print(f"[DEBUG] 發送到 {self.endpoint} 的請求體: {json.dumps(payload, indent=2)}")
+        # 取消時關閉 session 以中止進行中的連線
+        session = self._requests.Session()
+        try:
+            response = call_cancellable(
+                lambda: session.post(
+                    self.endpoint,
+                    headers=self._headers(),
+                    json=payload,
+                    timeout=Config.OPENAI_REQUEST_TIMEOUT,
+                ),
+                cancel_token,
+                on_cancel=session.close,
+            )
+        finally:
+            session.close()
+        response.raise_for_status()
+
+        json_response = response.json()
+        print(f"[DEBUG] 從 {self.endpoint} 接收到的原始響應: {json_response}")
+        choices = json_response.get("choices") or []
+        if not choices:
+            print("[ERROR] 響應中沒有 'choices' 或 'message' 字段")
+            return ""
+        return (choices[0].get("message") or {}).get("content") or ""
+
+    def stream(self, prompt, system_instruction=None, schema=None, cancel_token=None):
+        """透過 SSE 串流取得回應片段"""
+        payload = self._payload(prompt, system_instruction, schema, stream=True)
+        try:
+            with self._requests.post(
+                self.endpoint,
+                headers=self._headers(),
+                json=payload,
+                stream=True,
+                # 讀取超時即為停滯判定時間
+                timeout=(10, self.stall_timeout),
+            ) as response, closing_on_cancel(cancel_token, response.close):
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:") :].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    choices = event.get("choices") or []
+                    if not choices:
+                        continue
+                    text = (choices[0].get("delta") or {}).get("content")
+                    if text:
+                        yield text
+        except self._requests.exceptions.ReadTimeout as e:
+            raise StreamStalledError(f"串流回應讀取超時: {e}") from e
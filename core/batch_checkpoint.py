@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+
+
+def prompt_hash(prompt):
+    """提示詞的雜湊值，用於判斷已提交的請求是否仍對應目前的文件內容"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class BatchCheckpoint:
+    """保存已提交的批次工作，中斷後重新運行時接續等待而不重複提交。
+
+    每個工作記錄名稱、最後已知的狀態，以及其中每個請求的 key (相對路徑)
+    與提示詞雜湊。模型或輸出格式改變時舊的記錄不再適用，會被忽略。
+    """
+
+    def __init__(self, path, model, output_format):
+        """
+        Args:
+            path (Path): 檢查點檔案路徑。
+            model (str): 模型名稱。
+            output_format (str): 輸出格式 (full 或 diff)。
+        """
+        self.path = path
+        self.model = model
+        self.output_format = output_format
+        self.jobs = []
+        self._load()
+
+    def covered_keys(self, hashes):
+        """已提交且提示詞未改變的請求 key
+
+        Args:
+            hashes (dict): key → 目前的提示詞雜湊。
+
+        Returns:
+            set: 不需要重新提交的 key。
+        """
+        return {
+            key
+            for job in self.jobs
+            for key, value in job["requests"].items()
+            if hashes.get(key) == value
+        }
+
+    def stale_jobs(self, hashes):
+        """其中所有請求都已過期 (文件改變或不再存在) 的工作"""
+        return [
+            job
+            for job in self.jobs
+            if not any(hashes.get(key) == value for key, value in job["requests"].items())
+        ]
+
+    def add_job(self, name, requests):
+        """記錄新提交的工作並立即保存
+
+        Args:
+            name (str): 工作名稱。
+            requests (dict): key → 提示詞雜湊。
+        """
+        self.jobs.append({"name": name, "state": "PENDING", "requests": requests})
+        self.save()
+
+    def update_state(self, job, state):
+        job["state"] = state
+        self.save()
+
+    def remove_job(self, job):
+        """工作的結果已寫入 (或已放棄) 後移除記錄"""
+        self.jobs.remove(job)
+        self.save()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logging.warning(f"讀取批次檢查點 {self.path} 失敗: {e}")
+            return
+        if (
+            state.get("model") != self.model
+            or state.get("output_format") != self.output_format
+        ):
+            logging.warning(
+                f"批次檢查點 {self.path} 的模型或輸出格式與本次運行不同，忽略其中的工作。"
+            )
+            return
+        self.jobs = state.get("jobs", [])
+
+    def save(self):
+        """寫入檢查點；沒有未完成的工作時刪除檔案"""
+        try:
+            if not self.jobs:
+                if self.path.exists():
+                    self.path.unlink()
+                return
+            state = {
+                "model": self.model,
+                "output_format": self.output_format,
+                "jobs": self.jobs,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(f".{self.path.name}.tmp")
+            temp_path.write_text(
+                json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"保存批次檢查點 {self.path} 失敗: {e}")
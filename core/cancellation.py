@@ -0,0 +1,85 @@
+import threading
+import weakref
+
+from exceptions.exceptions import OperationCancelledError
+
+
+class CancellationToken:
+    """在協調器、處理器與 API 客戶端之間共用的取消與暫停信號。
+
+    所有等待 (退避、請求間隔、配額重置) 都改用 sleep()，取消時立即返回；
+    暫停只在兩個請求之間生效，進行中的請求會先完成。
+    """
+
+    # 等待暫停解除或檢查進行中請求時的輪詢間隔 (秒)
+    POLL_INTERVAL = 0.2
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        # 設定時表示正在運行，清除時表示已暫停
+        self._running = threading.Event()
+        self._running.set()
+        self._owns_running = True
+        self._children = weakref.WeakSet()
+        self._children_lock = threading.Lock()
+
+    def child(self):
+        """建立子信號：可單獨取消 (例如取消單一文件)，並隨此信號一起取消與暫停"""
+        token = CancellationToken()
+        token._running = self._running
+        token._owns_running = False
+        with self._children_lock:
+            self._children.add(token)
+        if self.cancelled:
+            token._cancelled.set()
+        return token
+
+    def cancel(self):
+        """要求取消，同時解除暫停讓等待中的線程能結束"""
+        self._cancelled.set()
+        with self._children_lock:
+            children = list(self._children)
+        for token in children:
+            token.cancel()
+        # 子信號與父信號共用暫停狀態，取消子信號不會解除整體的暫停
+        if self._owns_running:
+            self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def check(self):
+        """已取消時拋出 OperationCancelledError"""
+        if self._cancelled.is_set():
+            raise OperationCancelledError("處理已被取消")
+
+    def wait_if_paused(self):
+        """暫停時阻塞直到繼續或取消。
+
+        Raises:
+            OperationCancelledError: 已取消。
+        """
+        while not self._running.wait(self.POLL_INTERVAL):
+            if self._cancelled.is_set():
+                break
+        self.check()
+
+    def sleep(self, seconds):
+        """可被取消中斷的 time.sleep。
+
+        Raises:
+            OperationCancelledError: 等待期間被取消。
+        """
+        if self._cancelled.wait(max(0.0, seconds)):
+            self.check()
@@ -0,0 +1,46 @@
+def _is_boundary(line):
+    """頂層語句的開頭 (沒有縮排的非空行) 適合作為分段位置"""
+    return bool(line.strip()) and not line[0].isspace()
+
+
+def iter_line_chunks(path, max_bytes, encoding="utf-8"):
+    """逐行讀取文件並產生不超過 max_bytes 的片段，不會一次讀入整個文件。
+
+    片段只在行與行之間切開，並盡量在頂層語句 (函數、類等沒有縮排的行) 之前切開，
+    讓每個片段保持完整的上下文。單行超過上限時該行自成一段。
+    將所有片段依序相接即為原始內容。
+
+    Args:
+        path (Path): 文件路徑。
+        max_bytes (int): 每個片段的最大位元組數 (以 utf-8 計算)。
+        encoding (str): 文件編碼。
+
+    Yields:
+        str: 文件片段。
+    """
+    lines = []
+    sizes = []
+    total = 0
+    # 緩衝區中最後一個可作為分段位置的行索引
+    boundary = 0
+    with open(path, "r", encoding=encoding, newline="") as f:
+        for line in f:
+            size = len(line.encode("utf-8"))
+            while lines and total + size > max_bytes:
+                # 分段位置太靠前時片段會太小，改為直接在此切開
+                cut = boundary if boundary > len(lines) // 2 else len(lines)
+                yield "".join(lines[:cut])
+                lines = lines[cut:]
+                sizes = sizes[cut:]
+                total = sum(sizes)
+                boundary = max(
+                    (i for i in range(1, len(lines)) if _is_boundary(lines[i])),
+                    default=0,
+                )
+            if lines and _is_boundary(line):
+                boundary = len(lines)
+            lines.append(line)
+            sizes.append(size)
+            total += size
+    if lines:
+        yield "".join(lines)
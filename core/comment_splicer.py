@@ -0,0 +1,306 @@
+import io
+import json
+import logging
+import os
+import tokenize
+
+# 各語言的行尾註釋符號 (前綴, 後綴)，未列出的副檔名預設使用 "#"
+COMMENT_SYNTAX = {
+    ".py": ("#", ""),
+    ".pyw": ("#", ""),
+    ".rb": ("#", ""),
+    ".sh": ("#", ""),
+    ".bash": ("#", ""),
+    ".ps1": ("#", ""),
+    ".r": ("#", ""),
+    ".pl": ("#", ""),
+    ".yaml": ("#", ""),
+    ".yml": ("#", ""),
+    ".toml": ("#", ""),
+    ".js": ("//", ""),
+    ".jsx": ("//", ""),
+    ".ts": ("//", ""),
+    ".tsx": ("//", ""),
+    ".java": ("//", ""),
+    ".c": ("//", ""),
+    ".h": ("//", ""),
+    ".cpp": ("//", ""),
+    ".hpp": ("//", ""),
+    ".cc": ("//", ""),
+    ".cs": ("//", ""),
+    ".go": ("//", ""),
+    ".rs": ("//", ""),
+    ".swift": ("//", ""),
+    ".kt": ("//", ""),
+    ".php": ("//", ""),
+    ".dart": ("//", ""),
+    ".scala": ("//", ""),
+    ".sql": ("--", ""),
+    ".lua": ("--", ""),
+    ".hs": ("--", ""),
+    ".vb": ("'", ""),
+    ".bat": ("REM", ""),
+    ".html": ("<!--", "-->"),
+    ".htm": ("<!--", "-->"),
+    ".xml": ("<!--", "-->"),
+    ".vue": ("<!--", "-->"),
+    ".css": ("/*", "*/"),
+    ".scss": ("//", ""),
+    ".less": ("//", ""),
+}
+DEFAULT_COMMENT_SYNTAX = ("#", "")
+
+# 依行尾註釋前綴對應的區塊註釋 (開始, 結束)
+BLOCK_COMMENT_SYNTAX = {
+    "//": ("/*", "*/"),
+    "/*": ("/*", "*/"),
+    "<!--": ("<!--", "-->"),
+}
+# 可跨行的字串界定符；其餘引號的字串在行尾結束 (除非以反斜線續行)
+MULTILINE_QUOTES = ('"""', "'''", "`")
+# 使用反引號字串 (模板字串、原始字串) 的語言
+BACKTICK_STRING_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".vue", ".go")
+# 標記語言的引號只在標籤內有意義，文字中的撇號不是字串
+NO_STRING_EXTENSIONS = (".html", ".htm", ".xml")
+
+
+def get_comment_syntax(file_name):
+    """根據文件名取得行尾註釋符號
+
+    Args:
+        file_name: 文件名或路徑
+
+    Returns:
+        tuple: (註釋前綴, 註釋後綴)
+    """
+    ext = os.path.splitext(str(file_name))[1].lower()
+    return COMMENT_SYNTAX.get(ext, DEFAULT_COMMENT_SYNTAX)
+
+
+def _string_quotes(ext, prefix):
+    """依語言決定追蹤的字串界定符，較長的界定符在前"""
+    if ext in NO_STRING_EXTENSIONS:
+        return ()
+    quotes = ['"""', "'''"]
+    if ext in BACKTICK_STRING_EXTENSIONS:
+        quotes.append("`")
+    quotes.append('"')
+    # Rust 的生命週期 ('a) 與以 ' 為註釋符號的語言不把 ' 視為字串
+    if ext != ".rs" and prefix != "'":
+        quotes.append("'")
+    return tuple(quotes)
+
+
+def _python_unsafe_lines(code):
+    """以 tokenize 找出 Python 代碼中位於多行字串內的行，無法解析時返回 None"""
+    fstring_start = getattr(tokenize, "FSTRING_START", None)
+    fstring_end = getattr(tokenize, "FSTRING_END", None)
+    unsafe = set()
+    open_fstrings = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == fstring_start:
+                open_fstrings.append(token.start[0])
+            elif token.type == fstring_end and open_fstrings:
+                unsafe.update(range(open_fstrings.pop(), token.end[0]))
+            elif token.type == tokenize.STRING:
+                # 字串結束的那一行可以在字串之後加註釋，之前的行都在字串內
+                unsafe.update(range(token.start[0], token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    return unsafe
+
+
+def _scan_unsafe_lines(code, prefix, ext):
+    """逐字掃描代碼，找出行尾仍在區塊註釋或字串內的行 (非 Python 語言使用)"""
+    block = BLOCK_COMMENT_SYNTAX.get(prefix)
+    quotes = _string_quotes(ext, prefix)
+    unsafe = set()
+    # None、("block", 結束符號) 或 ("string", 界定符)
+    state = None
+    for line_number, line in enumerate(code.splitlines(), start=1):
+        index = 0
+        while index < len(line):
+            if state is None:
+                if block and line.startswith(block[0], index):
+                    state = ("block", block[1])
+                    index += len(block[0])
+                    continue
+                if line.startswith(prefix, index):
+                    # 行尾註釋，之後的內容都不是代碼
+                    break
+                quote = next((q for q in quotes if line.startswith(q, index)), None)
+                if quote:
+                    state = ("string", quote)
+                    index += len(quote)
+                else:
+                    index += 1
+            elif state[0] == "block":
+                end = line.find(state[1], index)
+                if end < 0:
+                    break
+                state = None
+                index = end + len(block[1])
+            elif line[index] == "\\":
+                # 字串中的跳脫字元
+                index += 2
+            elif line.startswith(state[1], index):
+                index += len(state[1])
+                state = None
+            else:
+                index += 1
+
+        continued = line.rstrip().endswith("\\")
+        if state is not None or continued:
+            unsafe.add(line_number)
+        if (
+            state is not None
+            and state[0] == "string"
+            and state[1] not in MULTILINE_QUOTES
+            and not continued
+        ):
+            # 單行字串沒有閉合，視為在行尾結束
+            state = None
+    return unsafe
+
+
+def find_unsafe_lines(code, file_name):
+    """找出無法安全地在行尾加上註釋的行
+
+    位於多行字串 (含 docstring) 或區塊註釋中的行加上註釋會改變字串內容或
+    提前結束註釋；以反斜線續行的行加上註釋會造成語法錯誤。Python 以 tokenize
+    精確判斷，其他語言逐字掃描字串與區塊註釋。
+
+    Args:
+        code: 代碼內容
+        file_name: 文件名，用於判斷語言
+
+    Returns:
+        set: 不應加上註釋的行號 (從 1 開始)
+    """
+    prefix, _ = get_comment_syntax(file_name)
+    ext = os.path.splitext(str(file_name))[1].lower()
+    if ext in (".py", ".pyw"):
+        unsafe = _python_unsafe_lines(code)
+        if unsafe is not None:
+            unsafe.update(
+                line_number
+                for line_number, line in enumerate(code.splitlines(), start=1)
+                if line.rstrip().endswith("\\")
+            )
+            return unsafe
+    return _scan_unsafe_lines(code, prefix, ext)
+
+
+def number_lines(code, line_numbers=None):
+    """在每行代碼前加上 "行號| " 前綴，供 diff 格式的提示詞使用
+
+    Args:
+        code: 代碼內容
+        line_numbers: 只輸出這些行號 (從 1 開始)，None 表示全部
+
+    Returns:
+        str: 加上行號的代碼
+    """
+    lines = code.splitlines()
+    width = len(str(len(lines)))
+    numbered = []
+    previous = 0
+    for index, line in enumerate(lines, start=1):
+        if line_numbers is not None and index not in line_numbers:
+            continue
+        # 不連續的片段之間以 "..." 分隔
+        if previous and index != previous + 1:
+            numbered.append(f"{'':>{width}}  ...")
+        numbered.append(f"{index:>{width}}| {line}")
+        previous = index
+    return "\n".join(numbered)
+
+
+def parse_line_comments(response_content):
+    """解析模型返回的 {"comments": [{"line": n, "comment": "..."}]}
+
+    Args:
+        response_content: 模型返回的原始文本
+
+    Returns:
+        dict: {行號: 註釋}，解析失敗時返回 None
+    """
+    text = response_content.strip()
+    # 移除可能存在的 ``` 圍欄
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+
+    try:
+        parsed = json.loads(text, strict=False)
+    except json.JSONDecodeError as e:
+        logging.warning(f"解析行註釋 JSON 失敗: {e}")
+        return None
+
+    entries = parsed.get("comments") if isinstance(parsed, dict) else None
+    if not isinstance(entries, list):
+        logging.warning("行註釋 JSON 中未找到 'comments' 列表")
+        return None
+
+    comments = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            line_number = int(entry.get("line"))
+        except (TypeError, ValueError):
+            continue
+        comment = entry.get("comment")
+        if isinstance(comment, str) and comment.strip():
+            comments[line_number] = comment
+    return comments
+
+
+def _clean_comment(comment, prefix, suffix):
+    """整理單條註釋：去除換行以及模型自行加上的註釋符號"""
+    comment = " ".join(comment.split())
+    if comment.startswith(prefix):
+        comment = comment[len(prefix) :].strip()
+    if suffix and comment.endswith(suffix):
+        comment = comment[: -len(suffix)].strip()
+    return comment
+
+
+def splice_line_comments(code, comments, file_name):
+    """將 行號 → 註釋 對應拼接回原始代碼的行尾
+
+    原始代碼的每一行都會被完整保留，只在行尾追加註釋；位於多行字串、
+    區塊註釋中或以反斜線續行的行 (見 find_unsafe_lines) 不加註釋。
+
+    Args:
+        code: 原始代碼內容
+        comments: {行號: 註釋}，行號從 1 開始
+        file_name: 文件名，用於判斷註釋符號
+
+    Returns:
+        tuple: (帶註釋的代碼, 實際插入的註釋數量)
+    """
+    prefix, suffix = get_comment_syntax(file_name)
+    lines = code.splitlines(keepends=True)
+    unsafe = find_unsafe_lines(code, file_name) if comments else set()
+    inserted = 0
+
+    for line_number, comment in comments.items():
+        if line_number < 1 or line_number > len(lines) or line_number in unsafe:
+            continue
+        line = lines[line_number - 1]
+        body = line.rstrip("\r\n")
+        ending = line[len(body) :]
+        # 空行和純註釋行保持原樣
+        if not body.strip() or body.strip().startswith(prefix):
+            continue
+        comment = _clean_comment(comment, prefix, suffix)
+        if not comment:
+            continue
+        closing = f" {suffix}" if suffix else ""
+        lines[line_number - 1] = f"{body.rstrip()}  {prefix} {comment}{closing}{ending}"
+        inserted += 1
+
+    return "".join(lines), inserted
@@ -0,0 +1,85 @@
+import hashlib
+
+from config.config import Config
+from core.comment_splicer import splice_line_comments
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """以固定大小的區塊計算文件的 SHA-256，避免一次讀入大文件"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_task(path):
+    """子進程中計算雜湊，錯誤以字串返回，單一文件失敗不中斷整批"""
+    try:
+        return hash_file(path), None
+    except OSError as e:
+        return None, str(e)
+
+
+class CpuPool:
+    """把 CPU 密集的前後處理交給子進程，避免與網路工作線程爭用 GIL。
+
+    目前包括分組前的內容雜湊與 diff 格式的註釋拼接。子進程之間只傳遞路徑、
+    雜湊值與代碼字串等精簡資料；workers 為 0 時在目前線程直接執行。
+    """
+
+    def __init__(self, workers=0):
+        """初始化進程池。
+
+        Args:
+            workers (int): 子進程數，0 表示不使用子進程。
+        """
+        self.workers = max(0, int(workers or 0))
+        self._executor = None
+
+    def start(self):
+        """建立子進程，返回自身以便鏈式調用"""
+        if self.workers and self._executor is None:
+            # 只有啟用子進程時才載入 multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def hash_files(self, paths):
+        """計算多個文件的 SHA-256。
+
+        Args:
+            paths (list): 文件路徑。
+
+        Returns:
+            list: 與 paths 順序相同的 (雜湊值, 錯誤訊息)，成功時錯誤訊息為 None。
+        """
+        if self._executor is None:
+            return [_hash_task(path) for path in paths]
+        return list(
+            self._executor.map(
+                _hash_task, paths, chunksize=Config.CPU_POOL_HASH_CHUNKSIZE
+            )
+        )
+
+    def splice(self, code, comments, file_name):
+        """拼接行尾註釋，與 splice_line_comments 相同。
+
+        小文件在子進程間傳遞的成本高於拼接本身，只有超過
+        Config.CPU_POOL_MIN_SPLICE_BYTES 的代碼才交給子進程。
+        """
+        if (
+            self._executor is None
+            or len(code) < Config.CPU_POOL_MIN_SPLICE_BYTES
+        ):
+            return splice_line_comments(code, comments, file_name)
+        return self._executor.submit(
+            splice_line_comments, code, comments, file_name
+        ).result()
+
+    def close(self):
+        """關閉子進程，尚未開始的工作會被取消"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
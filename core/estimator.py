@@ -0,0 +1,112 @@
+from config.config import Config
+from core.quota_planner import estimate_tokens_from_size
+
+
+class RunEstimator:
+    """在不呼叫 API 的情況下估算一次運行的請求數、token 與所需時間。
+
+    只使用文件大小 (stat)，不讀取文件內容，大型目錄也能在數秒內完成。
+    內容重複的文件與增量快取命中的文件不會被扣除，結果為上限估計。
+    """
+
+    def __init__(self, planner, delay=Config.DEFAULT_REQUEST_DELAY, workers=1):
+        """初始化估算器。
+
+        Args:
+            planner (QuotaPlanner): 提供 token 估算與每日/每分鐘配額。
+            delay (float): 每個文件處理後的延遲 (秒)。
+            workers (int): 並行工作線程數。
+        """
+        self.planner = planner
+        self.delay = max(0.0, float(delay or 0))
+        self.workers = max(1, int(workers or 1))
+
+    def estimate(self, sizes):
+        """估算處理指定大小的文件所需的資源與時間。
+
+        Args:
+            sizes (list): 每個待處理文件的位元組數。
+
+        Returns:
+            dict: files、empty_files、bytes、requests、input_tokens、output_tokens、
+                tokens、days、seconds (不含等待配額重置的時間)、limited_by。
+        """
+        request_sizes = [size for size in sizes if size > 0]
+        plan = self.planner.plan(request_sizes)
+
+        # 每個請求的耗時：固定延遲加上輸出 token 的生成時間，之後再等待 delay
+        durations = [
+            Config.ESTIMATED_REQUEST_LATENCY
+            + estimate_tokens_from_size(size)
+            * self.planner.output_ratio
+            / Config.ESTIMATED_OUTPUT_TOKENS_PER_SECOND
+            + self.delay
+            for size in request_sizes
+        ]
+        seconds = max(sum(durations) / self.workers, max(durations, default=0.0))
+        limited_by = "workers"
+        if self.planner.requests_per_minute:
+            rate_limited_seconds = (
+                len(request_sizes) / self.planner.requests_per_minute * 60
+            )
+            if rate_limited_seconds > seconds:
+                seconds = rate_limited_seconds
+                limited_by = "rpm"
+        if plan["days"] > 1:
+            limited_by = "rpd"
+
+        result = dict(plan)
+        result.update(
+            {
+                "files": len(sizes),
+                "empty_files": len(sizes) - len(request_sizes),
+                "bytes": sum(sizes),
+                "seconds": seconds,
+                "limited_by": limited_by,
+            }
+        )
+        return result
+
+    @staticmethod
+    def format_report(result):
+        """將估算結果轉為可讀的報告行。
+
+        Args:
+            result (dict): estimate() 的返回值。
+
+        Returns:
+            list: 報告的每一行。
+        """
+        lines = [
+            f"文件數: {result['files']} (空文件 {result['empty_files']} 個，不需要請求)",
+            f"總大小: {result['bytes'] / 1024:.1f} KiB",
+            f"預計請求數: {result['requests']}",
+            f"輸入 token: 約 {result['input_tokens']}",
+            f"輸出 token: 約 {result['output_tokens']}",
+            f"總 token: 約 {result['tokens']}",
+            f"預計處理時間: {_format_duration(result['seconds'])}",
+        ]
+        if result.get("skipped_generated"):
+            lines.append(
+                f"已略過 {result['skipped_generated']} 個壓縮或自動產生的文件，"
+                f"約節省 {result['saved_tokens']} 輸入 token。"
+            )
+        if result["limited_by"] == "rpm":
+            lines.append("處理速度受每分鐘請求數限制，增加工作線程不會更快。")
+        if result["days"] > 1:
+            lines.append(
+                f"超過每日配額，預計需要 {result['days']} 天完成 (可使用 --quota-plan 自動分日處理)。"
+            )
+        return lines
+
+
+def _format_duration(seconds):
+    """將秒數轉為 時:分:秒 格式"""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours} 小時 {minutes} 分 {seconds} 秒"
+    if minutes:
+        return f"{minutes} 分 {seconds} 秒"
+    return f"{seconds} 秒"
@@ -1,19 +1,91 @@
+import difflib
 import logging
+import os
+import time
 from pathlib import Path
 
+from config.config import Config, PromptConfig
+from core.chunker import iter_line_chunks
+from core.comment_splicer import (
+    number_lines,
+    parse_line_comments,
+    splice_line_comments,
+)
+from core.file_sniffer import sniff_file
+from core.output_writer import apply_file_mode, create_temp_file
+from core.response_parser import extract_code_from_response, validate_commented_code
+from exceptions.exceptions import (
+    OperationCancelledError,
+    ResponseFormatError,
+    StreamStalledError,
+)
+
+
 class FileProcessor:
     """
     負責處理單一文件：讀取、呼叫API以取得註解，並寫入結果。
     """
 
-    def __init__(self, api_client):
+    # 串流模式下每隔多少秒記錄一次接收進度
+    STREAM_PROGRESS_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        api_client,
+        output_format="full",
+        stream=False,
+        run_cache=None,
+        writer=None,
+        max_file_size=0,
+        cancel_token=None,
+        cpu_pool=None,
+        on_warning=None,
+        skip_generated=True,
+    ):
         """
         初始化檔案處理器。
 
         Args:
             api_client: 用於與 Gemini API 通訊的客戶端實例。
+            output_format (str): "full" 由模型返回完整代碼；"diff" 只取得
+                行號 → 註釋 對應，並在本地拼接回原始代碼。
+            stream (bool): 是否以串流方式接收回應並邊收邊寫入暫存檔。
+                僅作用於 "full" 格式，diff 格式的回應本身很短。
+            run_cache (RunCache, optional): 上一次運行的結果快取。提供時，
+                未變更的文件直接複用舊結果，小幅修改的文件只送出變更片段。
+            writer (OutputWriter, optional): 背景寫入器。提供時結果交由寫入線程
+                原子性地寫入，否則在目前線程直接寫入。
+            max_file_size (int): 超過此位元組數的文件不整份讀入，改為逐段讀取、
+                逐段送出並逐段寫入，0 表示不限制。
+            cancel_token (CancellationToken, optional): 取消信號。取消時
+                process() 拋出 OperationCancelledError，不寫入未完成的結果。
+            cpu_pool (CpuPool, optional): CPU 子進程池。提供時大文件的註釋拼接
+                交給子進程，不佔用網路工作線程的 GIL。
+            on_warning (callable, optional): 接收警告消息 (例如略過的文件)，
+                用於轉發給 GUI；未提供時只寫入日誌。
+            skip_generated (bool): 是否略過取樣判斷為壓縮或自動產生的文件。
+                文件已由掃描器依 --include-generated 與 exclude.yaml 的 generated
+                設定篩選時應傳入 False，此時只略過二進位與無法解碼的文件。
         """
         self.api_client = api_client
+        self.output_format = output_format
+        self.stream = stream
+        self.run_cache = run_cache
+        self.writer = writer
+        self.max_file_size = max_file_size
+        self.cancel_token = cancel_token
+        self.cpu_pool = cpu_pool
+        self.on_warning = on_warning
+        self.skip_generated = skip_generated
+        if self.stream and self.output_format == "diff":
+            logging.info("diff 格式的回應很短，串流模式將不會啟用。")
+        elif (
+            self.stream
+            and api_client is not None
+            and not api_client.capabilities.streaming
+        ):
+            logging.info("目前的模型後端不支援串流，串流模式將不會啟用。")
+            self.stream = False
 
     def process(self, src_path: Path, dest_path: Path):
         """
@@ -25,33 +97,464 @@ class FileProcessor:
 
         Returns:
             bool: 如果處理成功則返回 True，否則返回 False。
+
+        Raises:
+            OperationCancelledError: 處理期間被取消。
         """
         try:
+            self._check_cancelled()
             logging.info(f"正在處理文件: {src_path}")
-            code_content = src_path.read_text(encoding='utf-8')
+            # 先取樣文件開頭，二進位、壓縮或自動產生的文件不必讀取也不送出
+            sniff = sniff_file(src_path)
+            if self._is_skipped(sniff):
+                self._warn(
+                    f"略過文件 {src_path}: {sniff.kind} ({sniff.reason})，保留原始內容。"
+                )
+                return True
+            if self._is_oversized(src_path):
+                return self._process_chunked(src_path, dest_path, sniff.encoding)
+            code_content = src_path.read_text(encoding=sniff.encoding)
+            if sniff.encoding not in ("utf-8", "utf-8-sig"):
+                logging.info(
+                    f"文件 {src_path} 以 {sniff.encoding} 編碼讀取，結果將以 utf-8 寫入。"
+                )
 
             # 如果文件為空，直接複製並跳過
             if not code_content.strip():
                 logging.info(f"文件 {src_path} 為空，直接複製。")
-                # 確保目標目錄存在
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                dest_path.write_text("", encoding='utf-8')
+                self._write_output(dest_path, "")
                 return True
 
+            # 先嘗試複用上一次的結果
+            if self.run_cache is not None:
+                previous = self.run_cache.lookup(src_path)
+                if previous is not None:
+                    commented_code = self._reuse_previous(
+                        code_content, previous, src_path
+                    )
+                    if commented_code is not None:
+                        self._write_output(dest_path, commented_code)
+                        self.run_cache.store(src_path, code_content, commented_code)
+                        logging.info(f"成功處理並儲存文件到: {dest_path} (增量)")
+                        return True
+
             # 呼叫 API 產生註解
-            commented_code = self.api_client.generate_comments_for_code(
-                code=code_content, file_path=str(src_path)
-            )
+            if self.output_format == "diff":
+                commented_code = self._generate_with_line_comments(
+                    code_content, src_path
+                )
+            elif self.stream:
+                commented_code = self._process_streaming(
+                    code_content, src_path, dest_path
+                )
+                if commented_code and self.run_cache is not None:
+                    self._store_in_cache(src_path, code_content, commented_code)
+                return commented_code is not None
+            else:
+                commented_code = self.api_client.generate_comments_for_code(
+                    code=code_content, file_path=str(src_path)
+                )
 
             if commented_code:
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                dest_path.write_text(commented_code, encoding='utf-8')
+                self._write_output(dest_path, commented_code)
                 logging.info(f"成功處理並儲存文件到: {dest_path}")
+                if self.run_cache is not None:
+                    self._store_in_cache(src_path, code_content, commented_code)
                 return True
             else:
                 logging.error(f"從 API 未能獲取文件 {src_path} 的註解。")
                 return False
 
+        except OperationCancelledError:
+            logging.info(f"文件 {src_path} 的處理已取消。")
+            raise
         except Exception as e:
             logging.error(f"處理文件 {src_path} 時發生錯誤: {e}")
             return False
+
+    def prepare_batch_request(self, src_path: Path, dest_path: Path):
+        """批次模式：處理不需要 API 的文件，其餘返回要提交的提示詞。
+
+        略過的文件保留原始內容，空文件直接寫入，未變更的快取結果直接複用；
+        這些情況返回 None。超過大小上限的文件仍整份送出，由批次工作處理。
+
+        Args:
+            src_path (Path): 來源檔案的路徑。
+            dest_path (Path): 目標檔案的路徑。
+
+        Returns:
+            tuple | None: (原始代碼, 提示詞)，不需要提交時返回 None。
+        """
+        sniff = sniff_file(src_path)
+        if self._is_skipped(sniff):
+            self._warn(
+                f"略過文件 {src_path}: {sniff.kind} ({sniff.reason})，保留原始內容。"
+            )
+            return None
+        code_content = src_path.read_text(encoding=sniff.encoding)
+        if not code_content.strip():
+            logging.info(f"文件 {src_path} 為空，直接複製。")
+            self._write_output(dest_path, "")
+            return None
+        if self.run_cache is not None:
+            previous = self.run_cache.lookup(src_path)
+            if previous is not None and previous[0] == code_content:
+                self._write_output(dest_path, previous[1])
+                logging.info(f"文件 {src_path} 未變更，直接複用上一次的結果。")
+                return None
+
+        if self.output_format == "diff":
+            prompt = PromptConfig.get_line_comments_prompt(
+                number_lines(code_content), src_path.name
+            )
+        else:
+            prompt = PromptConfig.get_prompt(code_content, src_path.name)
+        return code_content, prompt
+
+    def apply_batch_response(self, src_path, dest_path, code_content, response_text):
+        """批次模式：解析批次工作返回的回應並寫入結果。
+
+        批次結果無法重試，回應無效時記錄錯誤並保留已複製的原始內容。
+
+        Args:
+            src_path (Path): 來源檔案的路徑。
+            dest_path (Path): 目標檔案的路徑。
+            code_content (str): 提交時的原始代碼。
+            response_text (str): 模型的回應文本。
+
+        Returns:
+            bool: 成功寫入結果時返回 True。
+        """
+        if self.output_format == "diff":
+            comments = parse_line_comments(response_text)
+            if comments is None:
+                logging.error(
+                    f"文件 {src_path} 的批次結果無法解析 comments 列表，保留原始內容。"
+                )
+                return False
+            commented_code, inserted = self._splice(
+                code_content, comments, src_path.name
+            )
+            logging.info(f"文件 {src_path} 插入 {inserted} 條行尾註釋。")
+        else:
+            commented_code = extract_code_from_response(response_text)
+            problem = (
+                validate_commented_code(code_content, commented_code, src_path.name)
+                if commented_code
+                else "回應中沒有可用的代碼內容"
+            )
+            if problem:
+                logging.error(
+                    f"文件 {src_path} 的批次結果無效: {problem}，保留原始內容。"
+                )
+                return False
+
+        self._write_output(dest_path, commented_code)
+        logging.info(f"成功處理並儲存文件到: {dest_path} (批次)")
+        if self.run_cache is not None:
+            self._store_in_cache(src_path, code_content, commented_code)
+        return True
+
+    def _splice(self, code_content, comments, file_name):
+        if self.cpu_pool is not None:
+            return self.cpu_pool.splice(code_content, comments, file_name)
+        return splice_line_comments(code_content, comments, file_name)
+
+    def _check_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def _warn(self, message):
+        if self.on_warning is not None:
+            self.on_warning(message)
+        else:
+            logging.warning(message)
+
+    def _write_output(self, dest_path, text):
+        """寫入結果：有背景寫入器時交給寫入線程，否則經暫存檔原子性地直接寫入"""
+        if self.writer is not None:
+            self.writer.write(dest_path, text)
+            return
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = create_temp_file(dest_path)
+        temp_path.write_text(text, encoding='utf-8')
+        apply_file_mode(temp_path, dest_path)
+        os.replace(temp_path, dest_path)
+
+    def _replace_output(self, temp_path, dest_path):
+        """以已寫好的暫存檔替換目標：有背景寫入器時依序交給寫入線程，否則直接替換"""
+        if self.writer is not None:
+            self.writer.move(temp_path, dest_path)
+            return
+        apply_file_mode(temp_path, dest_path)
+        os.replace(temp_path, dest_path)
+
+    def _is_skipped(self, sniff):
+        """依取樣結果判斷文件是否保留原始內容而不送出 (空文件另行處理)"""
+        if sniff.kind in ("minified", "generated"):
+            return self.skip_generated
+        return not sniff.should_process and sniff.kind != "empty"
+
+    def needs_api(self, src_path: Path):
+        """判斷處理此文件是否需要呼叫 API (空文件與未變更的快取結果不需要)。
+
+        Args:
+            src_path (Path): 來源檔案的路徑。
+
+        Returns:
+            bool: 需要呼叫 API 時返回 True；無法判斷時也返回 True。
+        """
+        try:
+            sniff = sniff_file(src_path)
+            if sniff.kind == "empty" or self._is_skipped(sniff):
+                return False
+            if self._is_oversized(src_path):
+                return True
+            code_content = src_path.read_text(encoding=sniff.encoding)
+        except (OSError, UnicodeDecodeError):
+            return True
+        if not code_content.strip():
+            return False
+        if self.run_cache is None:
+            return True
+        previous = self.run_cache.lookup(src_path)
+        return previous is None or previous[0] != code_content
+
+    def _is_oversized(self, src_path):
+        return bool(self.max_file_size) and src_path.stat().st_size > self.max_file_size
+
+    def _process_chunked(self, src_path: Path, dest_path: Path, encoding="utf-8"):
+        """逐段處理超過大小上限的文件，記憶體中只保留目前的片段。
+
+        每段分別呼叫 API，結果依序寫入暫存檔，全部完成後原子性地替換目標檔案。
+        某段失敗時該段保留原始代碼，不影響其他片段，但整個文件視為處理失敗。
+
+        Args:
+            src_path (Path): 來源檔案的路徑。
+            dest_path (Path): 目標檔案的路徑。
+            encoding (str): 來源檔案的編碼。
+
+        Returns:
+            bool: 所有片段都取得註解時返回 True，任一片段失敗時返回 False。
+        """
+        logging.info(
+            f"文件 {src_path} 超過 {self.max_file_size} 位元組，改為分段處理。"
+        )
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = create_temp_file(dest_path, suffix=".part")
+        chunk_count = 0
+        failed_chunks = 0
+        try:
+            with open(temp_path, "w", encoding="utf-8", newline="") as temp_file:
+                for chunk in iter_line_chunks(
+                    src_path, Config.CHUNK_MAX_BYTES, encoding
+                ):
+                    self._check_cancelled()
+                    chunk_count += 1
+                    if not chunk.strip():
+                        temp_file.write(chunk)
+                        continue
+                    if self.output_format == "diff":
+                        commented_chunk = self._generate_with_line_comments(
+                            chunk, src_path
+                        )
+                    else:
+                        commented_chunk = self.api_client.generate_comments_for_code(
+                            code=chunk, file_path=str(src_path)
+                        )
+                    # 失敗時返回 None，該段保留原始代碼
+                    if commented_chunk is None:
+                        failed_chunks += 1
+                        commented_chunk = chunk
+                    # 片段之間以換行相接，模型常會省略結尾的換行
+                    if chunk.endswith("\n") and not commented_chunk.endswith("\n"):
+                        commented_chunk += "\n"
+                    temp_file.write(commented_chunk)
+            self._replace_output(temp_path, dest_path)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        if failed_chunks:
+            logging.error(
+                f"文件 {src_path} 有 {failed_chunks}/{chunk_count} 段未能取得註解，"
+                "該部分保留原始代碼。"
+            )
+            return False
+        logging.info(f"成功處理並儲存文件到: {dest_path} (分段，共 {chunk_count} 段)")
+        return True
+
+    def _store_in_cache(self, src_path, code_content, commented_code):
+        """保存結果到增量快取；沒有加入任何註釋的結果不會被保存"""
+        if commented_code == code_content:
+            return
+        self.run_cache.store(src_path, code_content, commented_code)
+
+    def _reuse_previous(self, code_content, previous, src_path):
+        """根據上一次的結果產生本次的註釋代碼。
+
+        來源未變更時直接返回舊結果；小幅修改時只把變更的片段 (附帶少量上下文)
+        以 diff 格式送出，再與舊結果中未變更的行合併。
+
+        Args:
+            code_content (str): 本次的來源代碼。
+            previous (tuple): (舊來源代碼, 舊註釋結果)。
+            src_path (Path): 來源檔案的路徑。
+
+        Returns:
+            str | None: 帶註釋的代碼；無法增量處理時返回 None，改為完整處理。
+        """
+        old_source, old_output = previous
+        if code_content == old_source:
+            logging.info(f"文件 {src_path} 與上次處理時相同，直接複用結果。")
+            return old_output
+
+        old_lines = old_source.splitlines()
+        old_output_lines = old_output.splitlines()
+        # 舊結果必須與舊來源逐行對應，才能把未變更的行直接搬過來
+        if len(old_lines) != len(old_output_lines) or any(
+            not output_line.startswith(source_line.rstrip())
+            for source_line, output_line in zip(old_lines, old_output_lines)
+        ):
+            logging.info(f"文件 {src_path} 的上次結果無法逐行對應，改為完整處理。")
+            return None
+
+        new_lines = code_content.splitlines()
+        opcodes = difflib.SequenceMatcher(
+            None, old_lines, new_lines, autojunk=False
+        ).get_opcodes()
+        changed_lines = {
+            j + 1
+            for tag, _, _, j1, j2 in opcodes
+            if tag in ("replace", "insert")
+            for j in range(j1, j2)
+            if new_lines[j].strip()
+        }
+        if len(changed_lines) > len(new_lines) * Config.INCREMENTAL_MAX_CHANGED_RATIO:
+            logging.info(f"文件 {src_path} 變更範圍過大，改為完整處理。")
+            return None
+
+        comments = {}
+        if changed_lines:
+            context = Config.INCREMENTAL_CONTEXT_LINES
+            sent_lines = {
+                n
+                for line in changed_lines
+                for n in range(line - context, line + context + 1)
+                if 1 <= n <= len(new_lines)
+            }
+            comments = self.api_client.generate_line_comments(
+                code=code_content,
+                file_path=str(src_path),
+                line_numbers=sent_lines,
+                target_lines=changed_lines,
+            )
+            if comments is None:
+                return None
+            logging.info(
+                f"文件 {src_path} 增量處理: 變更 {len(changed_lines)} 行，"
+                f"送出 {len(sent_lines)}/{len(new_lines)} 行。"
+            )
+
+        # 變更的行拼接新註釋，未變更的行沿用舊結果
+        comments = {n: c for n, c in comments.items() if n in changed_lines}
+        merged, _ = self._splice(code_content, comments, src_path.name)
+        merged_lines = merged.splitlines(keepends=True)
+        for tag, i1, i2, j1, _ in opcodes:
+            if tag != "equal":
+                continue
+            for offset in range(i2 - i1):
+                line = merged_lines[j1 + offset]
+                ending = line[len(line.rstrip("\r\n")) :]
+                merged_lines[j1 + offset] = old_output_lines[i1 + offset] + ending
+        return "".join(merged_lines)
+
+    def _process_streaming(self, code_content, src_path: Path, dest_path: Path):
+        """以串流方式接收註解，寫入暫存檔並在完成後原子性地替換目標檔案。
+
+        中途失敗時目標檔案保持原樣，不會留下寫到一半的結果。串流回應無效、
+        停滯或請求出錯 (例如配額限制) 時改用非串流模式，由其重試與退避處理。
+
+        Args:
+            code_content (str): 原始代碼。
+            src_path (Path): 來源檔案的路徑。
+            dest_path (Path): 目標檔案的路徑。
+
+        Returns:
+            str | None: 帶註釋的代碼，失敗時返回 None。
+        """
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = create_temp_file(dest_path, suffix=".part")
+        pieces = []
+        received = 0
+        last_report = time.monotonic()
+
+        try:
+            with open(temp_path, "w", encoding="utf-8") as temp_file:
+                for piece in self.api_client.stream_comments_for_code(
+                    code=code_content, file_path=str(src_path)
+                ):
+                    self._check_cancelled()
+                    temp_file.write(piece)
+                    pieces.append(piece)
+                    received += len(piece)
+                    now = time.monotonic()
+                    if now - last_report >= self.STREAM_PROGRESS_INTERVAL:
+                        logging.info(
+                            f"文件 {src_path} 已接收 {received}/{len(code_content)}+ 個字元..."
+                        )
+                        last_report = now
+            if received == 0:
+                raise ResponseFormatError("串流回應的 'code' 字段為空")
+            self._replace_output(temp_path, dest_path)
+            logging.info(f"成功處理並儲存文件到: {dest_path} (串流，{received} 個字元)")
+            return "".join(pieces)
+
+        except OperationCancelledError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        except Exception as e:
+            temp_path.unlink(missing_ok=True)
+            if isinstance(e, ResponseFormatError):
+                reason = f"串流回應格式無效: {e}"
+            elif isinstance(e, StreamStalledError):
+                reason = f"串流回應停滯，已中止: {e}"
+            else:
+                reason = f"串流請求出錯: {e}"
+            logging.warning(f"文件 {src_path} 的{reason}，改用非串流模式重試。")
+            commented_code = self.api_client.generate_comments_for_code(
+                code=code_content, file_path=str(src_path)
+            )
+            if not commented_code:
+                logging.error(f"從 API 未能獲取文件 {src_path} 的註解。")
+                return None
+            self._write_output(dest_path, commented_code)
+            logging.info(f"成功處理並儲存文件到: {dest_path}")
+            return commented_code
+
+    def _generate_with_line_comments(self, code_content, src_path):
+        """以 diff 格式取得 行號 → 註釋，並拼接回原始代碼。
+
+        Args:
+            code_content (str): 原始代碼。
+            src_path (Path): 來源檔案的路徑。
+
+        Returns:
+            str | None: 帶註釋的代碼，API 失敗時返回 None。
+        """
+        comments = self.api_client.generate_line_comments(
+            code=code_content, file_path=str(src_path)
+        )
+        if comments is None:
+            return None
+
+        commented_code, inserted = self._splice(
+            code_content, comments, src_path.name
+        )
+        skipped = len(comments) - inserted
+        logging.info(
+            f"文件 {src_path} 插入 {inserted} 條行尾註釋"
+            + (f"，忽略 {skipped} 條無效行號、空行或無法安全加註的行的註釋。" if skipped else "。")
+        )
+        return commented_code
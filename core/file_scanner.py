@@ -1,42 +1,209 @@
 import shutil
 import fnmatch
+import subprocess
+import sys
+from pathlib import Path
+from config.config import Config
 from config.exclude_file import exclude_patterns
+from core.generated_classifier import GeneratedFileClassifier
+from exceptions.exceptions import GitCommandError
 import logging
 import os
 
 
+class ScanItem:
+    """待處理文件的精簡記錄，只保存相對路徑字串，來源與目標路徑在需要時才組合。"""
+
+    __slots__ = ("relative_path",)
+
+    def __init__(self, relative_path):
+        self.relative_path = relative_path
+
+    def src_path(self, src_dir):
+        return Path(src_dir) / self.relative_path
+
+    def dest_path(self, output_path):
+        return Path(output_path) / self.relative_path
+
+
 class FileScanner:
     """負責掃描文件和複製項目結構，並處理排除規則。"""
 
-    def __init__(self, src_dir, output_path, filters, recursive, exclude_patterns=None):
+    def __init__(
+        self,
+        src_dir,
+        output_path,
+        filters,
+        recursive,
+        exclude_patterns=None,
+        git_range=None,
+        git_files=False,
+        files_from=None,
+        skip_generated=True,
+    ):
         """初始化掃描器。
 
         Args:
             src_dir (Path): 來源目錄。
             output_path (Path): 輸出目錄。
             filters (list): 文件包含過濾器列表 (例如, ['*.py', '*.js'])。
-            recursive (bool): 是否遞歸掃描子目錄。
+            recursive (bool): 是否遞歸掃描子目錄。使用 git 或外部列表時一律包含
+                子目錄中的文件，列表本身已決定範圍。
             exclude_patterns (list, optional): 要排除的模式列表。如果為 None，則從 config/exclude_file.py 載入。
+            git_range (str, optional): git 修訂範圍 (例如 'origin/main...HEAD')，
+                只處理該範圍內新增或修改的文件。
+            git_files (bool): 以 `git ls-files` 取得文件列表，直接套用儲存庫的忽略規則。
+            files_from (str, optional): 從文件 (或 '-' 代表標準輸入) 讀取相對路徑列表，
+                例如 `git diff --name-only` 的輸出。
+            skip_generated (bool): 是否略過壓縮、打包或自動產生的代碼，
+                判斷規則見 config/exclude.yaml 的 generated 區塊。
         """
         self.src_dir = src_dir
         self.output_path = output_path
         self.filters = filters
-        self.recursive = recursive
+        # git 與外部列表通常包含子目錄中的文件，不遞歸時會被靜默略過
+        self.recursive = recursive or bool(git_range or git_files or files_from)
+        self.git_range = git_range
+        self.git_files = git_files
+        self.files_from = files_from
         self.excludes = exclude_patterns if exclude_patterns is not None else []
         if not self.excludes:  # 如果傳入的為空或 None，則從文件載入
             from config.exclude_file import exclude_patterns as load_exclude_patterns
 
             self.excludes = load_exclude_patterns()
+        self.classifier = (
+            GeneratedFileClassifier.from_config() if skip_generated else None
+        )
 
     def scan_and_copy(self):
         """執行掃描和複製操作。"""
+        if self._uses_file_list():
+            # 文件列表模式不遍歷目錄樹，只複製選中的文件
+            files_to_process = self._scan_files()
+            self._copy_selected_files(files_to_process)
+            return files_to_process
         self._copy_project_structure()
         return self._scan_files()
 
-    def _copy_project_structure(self):
-        """將源目錄結構複製到輸出目錄，同時考慮排除規則。"""
+    def scan(self):
+        """只掃描待處理的文件，不建立或修改輸出目錄 (例如用於估算)。"""
+        return self._scan_files()
+
+    def iter_and_copy(self):
+        """與 scan_and_copy 相同，但逐一產生 ScanItem 而不建立完整列表，
+        記憶體用量不隨文件數量增長。
+
+        Yields:
+            ScanItem: 待處理文件的相對路徑記錄。
+        """
+        if self._uses_file_list():
+            self._reset_output_dir()
+            for path in self._iter_matching_paths():
+                item = ScanItem(path.relative_to(self.src_dir).as_posix())
+                dest_path = item.dest_path(self.output_path)
+                dest_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(path, dest_path)
+                yield item
+            return
+        self._copy_project_structure()
+        for path in self._iter_matching_paths():
+            yield ScanItem(path.relative_to(self.src_dir).as_posix())
+
+    def generated_summary(self):
+        """略過的自動產生文件與節省 token 的摘要，沒有略過時返回 None。"""
+        if self.classifier is None:
+            return None
+        return self.classifier.summary()
+
+    def _uses_file_list(self):
+        """是否由 git 或外部列表提供文件，而不是遍歷目錄。"""
+        return bool(self.git_range or self.git_files or self.files_from)
+
+    def _copy_selected_files(self, files_to_process):
+        """重建輸出目錄，只複製待處理的文件，作為處理失敗時的原始內容。"""
+        self._reset_output_dir()
+        for src_path, dest_path in files_to_process:
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src_path, dest_path)
+
+    def _iter_paths(self):
+        """產生待檢查的路徑：預設遍歷目錄，文件列表模式則使用列表中的路徑。"""
+        if not self._uses_file_list():
+            return self.src_dir.rglob("*") if self.recursive else self.src_dir.glob("*")
+        return self._iter_listed_paths()
+
+    def _iter_listed_paths(self):
+        """從 git 或外部列表取得相對路徑，轉為來源目錄下存在的文件路徑。"""
+        if self.files_from:
+            relative_paths = self._read_files_from()
+        elif self.git_range:
+            logging.info(f"使用 git 修訂範圍 {self.git_range} 中變更的文件。")
+            relative_paths = self._run_git(
+                "diff",
+                "--name-only",
+                "--relative",
+                "--diff-filter=ACMR",
+                "-z",
+                self.git_range,
+                "--",
+            )
+        else:
+            logging.info("使用 git ls-files 取得文件列表 (套用儲存庫的忽略規則)。")
+            relative_paths = self._run_git(
+                "ls-files", "-z", "--cached", "--others", "--exclude-standard"
+            )
+
+        # relative_to 只比較字面路徑，".." 或符號連結仍可能指向來源目錄外，
+        # 因此先解析成實際路徑再檢查，並以解析後的相對路徑組出結果
+        src_root = self.src_dir.resolve()
+        seen = set()
+        for relative_path in relative_paths:
+            relative_path = relative_path.strip()
+            if not relative_path or relative_path in seen:
+                continue
+            seen.add(relative_path)
+            path = Path(relative_path)
+            if not path.is_absolute():
+                path = self.src_dir / path
+            try:
+                path = self.src_dir / path.resolve().relative_to(src_root)
+            except (OSError, ValueError):
+                logging.info(f"路徑 {relative_path} 不在來源目錄內，略過。")
+                continue
+            # 修訂範圍內已刪除或列表中不存在的文件直接略過
+            if path.is_file():
+                yield path
+
+    def _read_files_from(self):
+        """讀取外部提供的路徑列表，每行一個路徑。"""
+        if self.files_from == "-":
+            return sys.stdin.read().splitlines()
+        with open(self.files_from, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def _run_git(self, *args):
+        """在來源目錄執行 git 命令並返回以 NUL 分隔的路徑列表。"""
+        command = ["git", "-C", str(self.src_dir), *args]
+        try:
+            result = subprocess.run(command, capture_output=True, check=True)
+        except FileNotFoundError as e:
+            raise GitCommandError("找不到 git 命令，請確認已安裝 git。") from e
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode("utf-8", errors="replace").strip()
+            raise GitCommandError(f"執行 {' '.join(command)} 失敗: {stderr}") from e
+        output = result.stdout.decode("utf-8", errors="surrogateescape")
+        return [p for p in output.split("\0") if p]
+
+    def _reset_output_dir(self):
+        """清空並重建輸出目錄，寫入標記檔以識別為本工具的輸出。"""
         if self.output_path.exists():
             shutil.rmtree(self.output_path)
+        self.output_path.mkdir(parents=True)
+        (self.output_path / Config.OUTPUT_MARKER_FILE).touch()
+
+    def _copy_project_structure(self):
+        """將源目錄結構複製到輸出目錄，同時考慮排除規則。"""
+        self._reset_output_dir()
 
         # 如果有排除規則，則創建一個忽略模式
         ignore_patterns = (
@@ -48,53 +215,95 @@ class FileScanner:
 
     def _scan_files(self):
         """掃描源目錄以查找匹配的文件，同時考慮排除規則。"""
-        files_to_process = []
-        path_iterator = (
-            self.src_dir.rglob("*") if self.recursive else self.src_dir.glob("*")
-        )
+        return [
+            (path, self.output_path / path.relative_to(self.src_dir))
+            for path in self._iter_matching_paths()
+        ]
+
+    def _is_excluded(self, path, relative_path):
+        """判斷單一路徑 (文件或目錄) 是否符合排除規則。"""
+        relative_path_str = str(relative_path)
+        for pattern in self.excludes:
+            # 處理以 '/' 結尾的目錄排除模式 (例如 'temp/')
+            if pattern.endswith("/"):
+                # 檢查相對路徑是否以該目錄模式開頭
+                if relative_path_str.startswith(pattern):
+                    return True
+                # 檢查路徑的任何部分是否是該目錄名 (例如 'temp' 在 'a/temp/b')
+                if path.is_dir() and pattern[:-1] in relative_path.parts:
+                    return True
+            # 處理文件或資料夾名模式 (例如 '*.log', 'node_modules')
+            else:
+                # 檢查文件名或資料夾名是否匹配
+                if fnmatch.fnmatch(path.name, pattern):
+                    return True
+                # 檢查整個相對路徑是否匹配 (例如 'src/temp/file.txt' 對應 'src/temp/*.txt')
+                if fnmatch.fnmatch(relative_path_str, pattern):
+                    return True
+                # 新增：檢查路徑的任何部分是否是該目錄名 (例如 '.git' 在 '.git/objects/...')
+                if pattern in relative_path.parts:
+                    return True
+                # 新增：檢查相對路徑是否以該模式開頭，用於處理像 '.env' 這樣的頂層文件或目錄
+                if (
+                    relative_path_str.startswith(pattern + os.sep)
+                    or relative_path_str == pattern
+                ):
+                    return True
+        return False
+
+    def is_excluded(self, path):
+        """判斷來源目錄中的路徑本身或其任一上層目錄是否被排除，來源目錄外的路徑也視為排除。
+
+        Args:
+            path (Path): 文件或目錄路徑。
+
+        Returns:
+            bool: 被排除時返回 True。
+        """
+        try:
+            relative_path = path.relative_to(self.src_dir)
+        except ValueError:
+            return True
+        parts = relative_path.parts
+        for depth in range(1, len(parts) + 1):
+            partial = Path(*parts[:depth])
+            if self._is_excluded(self.src_dir / partial, partial):
+                return True
+        return False
+
+    def match_changed_path(self, path):
+        """判斷監看模式中變更的文件應如何處理。
+
+        Args:
+            path (Path): 來源目錄中的文件路徑。
+
+        Returns:
+            str | None: "process" 需要重新註釋；"copy" 不需註釋，只需複製到輸出目錄；
+                None 表示被排除或不在掃描範圍內。
+        """
+        if self.is_excluded(path):
+            return None
+        relative_path = path.relative_to(self.src_dir)
+        if not self.recursive and len(relative_path.parts) > 1:
+            return None
+        if not any(fnmatch.fnmatch(path.name, p) for p in self.filters):
+            return "copy"
+        if self.classifier is not None and path.exists():
+            if self.classifier.classify(path, relative_path.as_posix()):
+                return "copy"
+        return "process"
+
+    def _iter_matching_paths(self):
+        """逐一產生符合過濾器且未被排除的文件路徑。"""
+        path_iterator = self._iter_paths()
 
         for path in path_iterator:
-            # 檢查路徑是否應被排除
-            is_excluded = False
             relative_path = path.relative_to(self.src_dir)
             relative_path_str = str(relative_path)
 
             logging.info(f"檢查路徑: {relative_path_str}")
 
-            for pattern in self.excludes:
-                # 處理以 '/' 結尾的目錄排除模式 (例如 'temp/')
-                if pattern.endswith("/"):
-                    # 檢查相對路徑是否以該目錄模式開頭
-                    if relative_path_str.startswith(pattern):
-                        is_excluded = True
-                        break
-                    # 檢查路徑的任何部分是否是該目錄名 (例如 'temp' 在 'a/temp/b')
-                    if path.is_dir() and pattern[:-1] in relative_path.parts:
-                        is_excluded = True
-                        break
-                # 處理文件或資料夾名模式 (例如 '*.log', 'node_modules')
-                else:
-                    # 檢查文件名或資料夾名是否匹配
-                    if fnmatch.fnmatch(path.name, pattern):
-                        is_excluded = True
-                        break
-                    # 檢查整個相對路徑是否匹配 (例如 'src/temp/file.txt' 對應 'src/temp/*.txt')
-                    if fnmatch.fnmatch(relative_path_str, pattern):
-                        is_excluded = True
-                        break
-                    # 新增：檢查路徑的任何部分是否是該目錄名 (例如 '.git' 在 '.git/objects/...')
-                    if pattern in relative_path.parts:
-                        is_excluded = True
-                        break
-                    # 新增：檢查相對路徑是否以該模式開頭，用於處理像 '.env' 這樣的頂層文件或目錄
-                    if (
-                        relative_path_str.startswith(pattern + os.sep)
-                        or relative_path_str == pattern
-                    ):
-                        is_excluded = True
-                        break
-
-            if is_excluded:
+            if self._is_excluded(path, relative_path):
                 logging.info(f"路徑 {relative_path_str} 被排除。")
                 continue
 
@@ -112,13 +321,13 @@ class FileScanner:
                         logging.info(f"文件名 '{path.name}' 不匹配過濾器 '{p}'。")
 
                 if match_found:
+                    if self.classifier is not None and self.classifier.classify(
+                        path, relative_path.as_posix()
+                    ):
+                        continue
                     logging.info(f"文件 {relative_path_str} 符合過濾器並被包含。")
-                    relative_path = path.relative_to(self.src_dir)
-                    destination_path = self.output_path / relative_path
-                    files_to_process.append((path, destination_path))
+                    yield path
                 else:
                     logging.info(f"文件 {relative_path_str} 不符合過濾器。")
             else:
                 logging.info(f"路徑 {relative_path_str} 是目錄，不處理。")
-
-        return files_to_process
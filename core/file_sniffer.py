@@ -0,0 +1,142 @@
+import codecs
+import re
+
+from config.config import Config
+
+# 文件開頭常見的 "自動產生" 標記
+GENERATED_MARKERS = re.compile(
+    r"@generated|\bdo not edit\b|\bauto-?generated\b|\bcode generated by\b"
+    r"|\bgenerated by\b.*\b(?:compiler|protoc|tool|script)\b|\bthis file (?:is|was) generated\b",
+    re.IGNORECASE,
+)
+
+# 依 BOM 判斷的編碼，較長的 BOM 需先比對
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# UTF-16/32 的 BOM
+_WIDE_BOMS = tuple(bom for bom, _ in _BOMS if bom != codecs.BOM_UTF8)
+
+# 除常見空白字元外的控制字元
+_CONTROL_BYTES = bytes(range(0, 32)).translate(None, b"\t\n\r\f\b\x1b")
+
+
+class SniffResult:
+    """文件取樣的結果。
+
+    kind 為 "text"、"empty"、"binary"、"minified"、"generated" 或 "undecodable"，
+    只有 "text" 需要處理；encoding 為判斷出的編碼；reason 說明略過的原因。
+    """
+
+    __slots__ = ("kind", "encoding", "reason")
+
+    def __init__(self, kind, encoding=None, reason=""):
+        self.kind = kind
+        self.encoding = encoding
+        self.reason = reason
+
+    @property
+    def should_process(self):
+        return self.kind == "text"
+
+
+def sniff_file(path, sample_size=None, extra_markers=()):
+    """只讀取文件開頭的一小段，判斷是否為二進位、壓縮過、自動產生的文件並偵測編碼。
+
+    Args:
+        path (Path): 文件路徑。
+        sample_size (int, optional): 取樣的位元組數，預設為 Config.SNIFF_SAMPLE_BYTES。
+        extra_markers (iterable): 額外的自動產生標記 (不分大小寫的子字串)。
+
+    Returns:
+        SniffResult: 取樣結果。
+    """
+    sample_size = sample_size or Config.SNIFF_SAMPLE_BYTES
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+        truncated = bool(f.read(1))
+    return sniff_bytes(sample, truncated=truncated, extra_markers=extra_markers)
+
+
+def sniff_bytes(sample, truncated=False, extra_markers=()):
+    """依文件開頭的位元組判斷文件類型與編碼。
+
+    Args:
+        sample (bytes): 文件開頭的內容。
+        truncated (bool): sample 是否只是文件的一部分。
+        extra_markers (iterable): 額外的自動產生標記 (不分大小寫的子字串)。
+
+    Returns:
+        SniffResult: 取樣結果。
+    """
+    if not sample.strip():
+        return SniffResult("empty" if not truncated else "text", "utf-8")
+
+    wide_bom = sample.startswith(_WIDE_BOMS)
+    # UTF-16/32 的文字本身就含有 NUL，只對其他編碼檢查二進位特徵
+    if not wide_bom and b"\0" in sample:
+        return SniffResult("binary", reason="包含 NUL 位元組")
+
+    encoding = _detect_encoding(sample, truncated)
+    if encoding is None:
+        return SniffResult("undecodable", reason="無法判斷文件編碼")
+
+    if not wide_bom:
+        control_count = len(sample) - len(sample.translate(None, _CONTROL_BYTES))
+        if control_count / len(sample) > Config.SNIFF_MAX_CONTROL_RATIO:
+            return SniffResult("binary", encoding, "控制字元比例過高")
+
+    text = _decode_sample(sample, encoding, truncated)
+    lines = text.splitlines()
+    # 最後一行可能被截斷，不計入平均長度
+    complete_lines = lines[:-1] if truncated and len(lines) > 1 else lines
+    if complete_lines:
+        longest = max(len(line) for line in complete_lines)
+        average = sum(len(line) for line in complete_lines) / len(complete_lines)
+    else:
+        longest = average = len(text)
+    if (
+        average > Config.MINIFIED_AVG_LINE_LENGTH
+        or longest > Config.MINIFIED_MAX_LINE_LENGTH
+    ):
+        return SniffResult(
+            "minified", encoding, f"行長過長 (平均 {average:.0f}，最長 {longest} 字元)"
+        )
+
+    header = "\n".join(lines[: Config.GENERATED_HEADER_LINES])
+    match = GENERATED_MARKERS.search(header)
+    if match:
+        return SniffResult("generated", encoding, f"文件開頭標記 '{match.group(0)}'")
+    lowered_header = header.lower()
+    for marker in extra_markers:
+        if marker.lower() in lowered_header:
+            return SniffResult("generated", encoding, f"文件開頭標記 '{marker}'")
+
+    return SniffResult("text", encoding)
+
+
+def _detect_encoding(sample, truncated):
+    """依 BOM 或嘗試解碼判斷編碼，無法解碼時返回 None"""
+    candidates = Config.SNIFF_ENCODINGS
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            candidates = (encoding,)
+            break
+    for encoding in candidates:
+        try:
+            _decode_sample(sample, encoding, truncated)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _decode_sample(sample, encoding, truncated):
+    """解碼取樣內容；取樣被截斷時容許結尾有不完整的多位元組字元"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    return decoder.decode(sample, final=not truncated)
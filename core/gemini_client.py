@@ -1,48 +1,121 @@
+import copy
 import os
 from config.config import Config
 from config.config import PromptConfig
-import google.generativeai as genai
-import requests
+from core.backends import LLMBackend, create_backend, resolve_backend_name
+from core.cancellation import CancellationToken
+from core.comment_splicer import number_lines, parse_line_comments
+from core.response_parser import (
+    CommentedCodeValidator,
+    extract_code_from_response,
+    validate_commented_code,
+)
+from core.quota_planner import estimate_tokens
+from core.stream_decoder import StreamingCodeDecoder
+from exceptions.exceptions import (
+    OperationCancelledError,
+    ResponseFormatError,
+    StreamStalledError,
+)
+import queue
 import random
 import re
+import threading
 import time
 import json
 
 
 class SendCode:
-    def __init__(self, api_key=None, model=None, nyaproxy=False):
+    """為代碼產生註釋的客戶端：組成提示詞、重試與退避、解析並驗證回應。
+
+    實際的模型呼叫交給 core/backends 中的後端 (Gemini SDK、OpenAI 兼容接口
+    或本機假後端)，所有後端共用相同的重試與驗證邏輯。
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        model=None,
+        nyaproxy=False,
+        stall_timeout=Config.DEFAULT_STREAM_STALL_TIMEOUT,
+        json_mode=Config.DEFAULT_JSON_MODE,
+        cancel_token=None,
+        backend=None,
+        base_url=None,
+    ):
+        """
+        Args:
+            api_key (str, optional): API 金鑰，nyaproxy 自行管理金鑰時不使用。
+            model (str, optional): 模型名稱。
+            nyaproxy (bool): 未指定 backend 時，是否透過 nyaproxy (OpenAI 兼容接口) 發送。
+            stall_timeout (float): 串流超過此秒數沒有新資料即中止。
+            json_mode (bool): 使用 API 原生的 JSON 模式；後端不支援時自動停用。
+            cancel_token (CancellationToken, optional): 取消信號。
+            backend (str | LLMBackend, optional): 後端名稱或已建立的後端實例。
+            base_url (str, optional): OpenAI 兼容接口的位址。
+        """
         self.model_name = model or Config.DEFAULT_MODEL_NAME
         self.max_retries = Config.DEFAULT_MAX_RETRIES
         self.max_backoff = Config.DEFAULT_MAX_BACKOFF
-        self.api_key = api_key or Config.DEFAULT_API_KEY
-        self.nyaproxy = nyaproxy
+        self.stall_timeout = stall_timeout
+        # 取消時中斷退避等待與進行中的請求
+        self.cancel_token = cancel_token
+        # 每次實際呼叫模型前 (包括重試) 調用，參數為提示詞；用於共用的速率限制
+        self.before_request = None
+
+        if isinstance(backend, LLMBackend):
+            self.backend = backend
+        else:
+            self.backend = create_backend(
+                resolve_backend_name(backend, nyaproxy),
+                model=self.model_name,
+                # nyaproxy 自行輪詢金鑰，不轉發 Gemini 金鑰
+                api_key=None if nyaproxy and not backend else api_key,
+                base_url=base_url,
+                stall_timeout=stall_timeout,
+            )
+        self.json_mode = json_mode and self.backend.capabilities.json_mode
+        self.backend.prepare(PromptConfig.SYSTEM_INSTRUCTION)
+
+    @property
+    def capabilities(self):
+        return self.backend.capabilities
+
+    def close(self):
+        """運行結束時釋放後端在服務端建立的資源 (例如 context cache)"""
+        self.backend.close()
+
+    def with_cancel_token(self, cancel_token):
+        """返回使用另一個取消信號的客戶端，與原客戶端共用已建立的後端與 context cache
 
-        if not self.nyaproxy:
-            genai.configure(api_key=self.api_key)
-            self.gemini_model = genai.GenerativeModel(self.model_name)
+        常駐服務中多個工作共用同一個已初始化的客戶端，各自可被取消。
+        """
+        client = copy.copy(self)
+        client.cancel_token = cancel_token
+        return client
+
+    def with_request_hook(self, before_request):
+        """返回在每次呼叫模型前先調用 before_request(prompt) 的客戶端
+
+        重試與修正提示詞的請求同樣會調用，可在其中等待速率限制或預留配額。
+        """
+        client = copy.copy(self)
+        client.before_request = before_request
+        return client
 
-    # 新增的輔助函數，用於處理模型返回的 JSON 響應
+    # 處理模型返回的 JSON 響應，無法取得代碼時拋出 ResponseFormatError
     def _extract_commented_code_from_response(self, response_content):
-        # 首先移除最外層的 ```json 和 ```
-        if response_content.startswith("```json") and response_content.endswith("```"):
-            json_string = response_content[len("```json\n") : -3].strip()
+        if self.json_mode:
+            # JSON 模式下回應受 schema 約束，不需要處理圍欄
+            try:
+                commented_code = json.loads(response_content, strict=False).get("code")
+            except (json.JSONDecodeError, AttributeError) as e:
+                raise ResponseFormatError(f"JSON 模式回應解析失敗: {e}") from e
         else:
-            # 如果不是預期的格式，則直接使用原始內容（可能需要進一步處理或報錯）
-            print("[WARNING] 模型返回的內容不是預期的 ```json 格式")
-            return response_content
-
-        try:
-            # 解析內部 JSON
-            parsed_response = json.loads(json_string)
-            # 從解析後的 JSON 中提取 'code' 字段
-            if "code" in parsed_response:
-                return parsed_response["code"]
-            else:
-                print("[WARNING] 解析後的 JSON 中未找到 'code' 字段")
-                return json_string  # 回退到原始 JSON 字符串
-        except json.JSONDecodeError as e:
-            print(f"[ERROR] 解析模型返回的 JSON 失敗: {e}")
-            return json_string  # 解析失敗，回退到原始 JSON 字符串
+            commented_code = extract_code_from_response(response_content)
+        if not isinstance(commented_code, str) or not commented_code.strip():
+            raise ResponseFormatError("回應中沒有可用的代碼內容")
+        return commented_code
 
     def generate_comments_for_code(
         self,
@@ -56,147 +129,330 @@ class SendCode:
             file_path: 文件路徑
 
         Returns:
-            str: 添加註釋後的代碼
+            str | None: 添加註釋後的代碼，失敗時返回 None
         """
         # 獲取文件名
         file_name = os.path.basename(file_path)
 
-        # 獲取提示詞，並添加文件名信息
-        prompt = PromptConfig.get_prompt(code, file_name)
+        # 獲取提示詞，固定指令透過 system instruction 發送
+        prompt = PromptConfig.get_user_prompt(code, file_name)
+
+        def parse_response(response_text):
+            commented_code = self._extract_commented_code_from_response(
+                response_text
+            )
+            # 檢查是否完整保留了每一行原始代碼
+            problem = validate_commented_code(code, commented_code, file_name)
+            if problem:
+                raise ResponseFormatError(problem)
+            return commented_code
+
+        # 出錯時返回 None，由調用者決定保留原始代碼並視為失敗，
+        # 不能返回原始代碼，否則未註釋的結果會被當作成功而不再重試
+        return self._request(
+            prompt,
+            parse_response,
+            correct_prompt=lambda problem: prompt
+            + PromptConfig.get_correction_note(problem),
+            schema=PromptConfig.CODE_RESPONSE_SCHEMA,
+            system_instruction=PromptConfig.SYSTEM_INSTRUCTION,
+        )
+
+    def generate_line_comments(
+        self, code, file_path, line_numbers=None, target_lines=None
+    ):
+        """使用Gemini API為代碼生成 行號 → 註釋 對應 (diff 格式)
+
+        模型只返回需要註釋的行號與註釋內容，不再回傳整份代碼。
+
+        Args:
+            code: 代碼內容
+            file_path: 文件路徑
+            line_numbers: 只發送這些行 (變更片段與上下文)，None 表示整份代碼
+            target_lines: 只需要註釋的行號，None 表示全部
+
+        Returns:
+            dict: {行號: 註釋}，失敗時返回 None
+        """
+        file_name = os.path.basename(file_path)
+        prompt = PromptConfig.get_line_comments_user_prompt(
+            number_lines(code, line_numbers), file_name, target_lines
+        )
+
+        def parse_response(response_text):
+            comments = parse_line_comments(response_text)
+            if comments is None:
+                raise ResponseFormatError("無法解析 comments 列表")
+            return comments
+
+        return self._request(
+            prompt,
+            parse_response,
+            correct_prompt=lambda problem: prompt
+            + PromptConfig.get_correction_note(problem),
+            schema=PromptConfig.LINE_COMMENTS_RESPONSE_SCHEMA,
+            system_instruction=PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION,
+        )
+
+    def stream_comments_for_code(self, code, file_path):
+        """以串流方式為代碼生成註釋，邊接收邊解碼
+
+        Args:
+            code: 代碼內容
+            file_path: 文件路徑
+
+        Yields:
+            str: 已解碼的帶註釋代碼片段
+
+        Raises:
+            StreamStalledError: 超過 stall_timeout 秒沒有收到新資料
+            ResponseFormatError: 回應中找不到 "code" 字段、字串未正常結束，
+                或輸出沒有保留原始代碼行
+        """
+        file_name = os.path.basename(file_path)
+        prompt = PromptConfig.get_user_prompt(code, file_name)
+
+        if self._exceeds_context(prompt):
+            raise ResponseFormatError("提示詞超過模型的上下文上限")
+
+        def open_stream(stream_token):
+            return self.backend.stream(
+                prompt,
+                system_instruction=PromptConfig.SYSTEM_INSTRUCTION,
+                schema=self._schema(PromptConfig.CODE_RESPONSE_SCHEMA),
+                cancel_token=stream_token,
+            )
+
+        decoder = StreamingCodeDecoder()
+        validator = CommentedCodeValidator(code, file_name)
+        # 在停滯計時開始前等待速率限制
+        self._before_request(prompt)
+        raw_chunks = self._with_stall_timeout(open_stream)
+        try:
+            for raw_chunk in raw_chunks:
+                piece = decoder.feed(raw_chunk)
+                if piece:
+                    validator.feed(piece)
+                    if validator.problem:
+                        raise ResponseFormatError(validator.problem)
+                    yield piece
+                if decoder.finished:
+                    break
+        finally:
+            # 提前結束 (解碼完成、驗證失敗或停滯) 時關閉底層串流
+            raw_chunks.close()
+
+        if not decoder.started:
+            raise ResponseFormatError("串流回應中未找到 'code' 字段")
+        if not decoder.finished:
+            raise ResponseFormatError("串流回應在 'code' 字段結束前中斷")
+        problem = validator.finish()
+        if problem:
+            raise ResponseFormatError(problem)
+
+    def _with_stall_timeout(self, open_stream):
+        """在背景線程中迭代串流，若超過 stall_timeout 沒有新片段則中止
+
+        串流使用獨立的子取消信號；停滯、被取消或提前結束時取消該信號，
+        後端隨即關閉底層的回應，背景線程不會繼續佔用連線。
+
+        Args:
+            open_stream: 接收取消信號並返回回應片段迭代器的函數
+
+        Yields:
+            str: 回應片段
 
-        if not self.nyaproxy:
+        Raises:
+            StreamStalledError: 串流停滯
+            OperationCancelledError: 接收期間被取消
+        """
+        chunk_queue = queue.Queue()
+        done = object()
+        token = self.cancel_token
+        stream_token = token.child() if token is not None else CancellationToken()
+
+        def pump():
+            chunks = None
             try:
-                for attempt in range(self.max_retries):
+                chunks = open_stream(stream_token)
+                for chunk in chunks:
+                    if stream_token.cancelled:
+                        break
+                    chunk_queue.put(chunk)
+                chunk_queue.put(done)
+            except Exception as e:
+                chunk_queue.put(e)
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+
+        threading.Thread(target=pump, daemon=True).start()
+
+        # 有取消信號時分段等待，取消後不必等到停滯超時
+        poll_interval = token.POLL_INTERVAL if token is not None else self.stall_timeout
+        try:
+            while True:
+                deadline = time.monotonic() + self.stall_timeout
+                while True:
+                    if token is not None:
+                        token.check()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise StreamStalledError(
+                            f"串流回應超過 {self.stall_timeout:.0f} 秒沒有新資料"
+                        )
                     try:
-                        response = self.gemini_model.generate_content(prompt)
-
-                        # 檢查響應是否為空
-                        if (
-                            not response
-                            or not hasattr(response, "text")
-                            or not response.text
-                        ):
-                            print(
-                                f"[WARNING] API返回空響應 (嘗試 {attempt+1}/{self.max_retries})"
-                            )
-                            if attempt < self.max_retries - 1:
-                                wait_time = min(
-                                    (2**attempt) + random.random(), self.max_backoff
-                                )
-                                print(f"[INFO] 等待 {wait_time:.2f} 秒後重試...")
-                                time.sleep(wait_time)
-                                continue
-                            else:
-                                print("[ERROR] 多次嘗試後API仍返回空響應，返回原始代碼")
-                                return code
-
-                        commented_code = self._extract_commented_code_from_response(
-                            response.text
+                        item = chunk_queue.get(
+                            timeout=min(poll_interval, remaining)
                         )
+                        break
+                    except queue.Empty:
+                        continue
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stream_token.cancel()
+
+    def _schema(self, schema):
+        """JSON 模式下傳給後端的 schema，未啟用時返回 None"""
+        return schema if self.json_mode else None
+
+    def _exceeds_context(self, prompt):
+        """提示詞是否超過後端的輸入上限；超過時重試也不會成功，直接放棄"""
+        tokens = estimate_tokens(prompt)
+        limit = self.backend.capabilities.max_context_tokens
+        if tokens <= limit:
+            return False
+        print(f"[ERROR] 提示詞約 {tokens} token，超過 {self.backend.name} 後端的上限 {limit}")
+        return True
+
+    def _before_request(self, prompt):
+        if self.before_request is not None:
+            self.before_request(prompt)
 
-                        # 檢查註釋後的代碼是否為空
-                        if not commented_code or commented_code.strip() == "":
-                            print("[WARNING] 生成的註釋代碼為空，重試...")
-                            if attempt < self.max_retries - 1:
-                                wait_time = min(
-                                    (2**attempt) + random.random(), self.max_backoff
-                                )
-                                print(f"[INFO] 等待 {wait_time:.2f} 秒後重試...")
-                                time.sleep(wait_time)
-                                continue
-                            else:
-                                print(
-                                    "[ERROR] 多次嘗試後生成的註釋代碼仍為空，返回原始代碼"
-                                )
-                                return code
-
-                        return commented_code
-
-                    except Exception as e:
-                        error_msg = str(e)
-                        print(f"[ERROR] 生成註釋時出錯: {error_msg}")
-
-                        # 處理API配額限制錯誤
-                        if (
-                            "429" in error_msg
-                            or "quota" in error_msg
-                            or "exhausted" in error_msg
-                            or "rate limit" in error_msg.lower()
-                        ):
-                            if attempt < self.max_retries - 1:
-                                wait_time = min(
-                                    (2**attempt) * 10 + random.uniform(0, 5),
-                                    self.max_backoff,
-                                )
-                                print(
-                                    f"[WARNING] 檢測到API配額限制，等待 {wait_time:.2f} 秒後重試..."
-                                )
-                                time.sleep(wait_time)
-                                continue
-                            else:
-                                print(
-                                    "[ERROR] 多次嘗試後仍然遇到API配額限制，返回原始代碼"
-                                )
-                                return code
-
-                        # 其他錯誤，如果還有重試次數，則等待後重試
+    def _sleep(self, seconds):
+        """退避等待，有取消信號時可被中斷"""
+        if self.cancel_token is not None:
+            self.cancel_token.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _request(
+        self,
+        prompt,
+        parse_response,
+        correct_prompt=None,
+        schema=None,
+        system_instruction=None,
+    ):
+        """發送提示詞並用 parse_response 解析回應
+
+        Args:
+            prompt: 提示詞
+            parse_response: 將回應文本轉為結果的函數，回應無效時拋出
+                ResponseFormatError
+            correct_prompt: 根據問題描述產生修正提示詞的函數；提供時，
+                無效回應會立即以修正提示詞重試，而不是等待退避
+            schema: JSON 模式下約束輸出的 JSON Schema
+            system_instruction: 固定指令，以 system instruction 發送
+
+        Returns:
+            解析後的結果，失敗時返回 None
+        """
+        if self._exceeds_context(prompt):
+            return None
+        schema = self._schema(schema)
+        try:
+            for attempt in range(self.max_retries):
+                try:
+                    self._before_request(prompt)
+                    response_text = self.backend.generate(
+                        prompt,
+                        system_instruction=system_instruction,
+                        schema=schema,
+                        cancel_token=self.cancel_token,
+                    )
+
+                    # 檢查響應是否為空
+                    if not response_text:
+                        print(
+                            f"[WARNING] API返回空響應 (嘗試 {attempt+1}/{self.max_retries})"
+                        )
                         if attempt < self.max_retries - 1:
                             wait_time = min(
                                 (2**attempt) + random.random(), self.max_backoff
                             )
                             print(f"[INFO] 等待 {wait_time:.2f} 秒後重試...")
-                            time.sleep(wait_time)
+                            self._sleep(wait_time)
+                            continue
                         else:
-                            print("[ERROR] 多次嘗試後仍然出錯，返回原始代碼")
-                            return code
+                            print("[ERROR] 多次嘗試後API仍返回空響應")
+                            return None
 
-                # 如果所有嘗試都失敗，返回原始代碼
-                return code
-            except Exception as e:
-                print(f"[ERROR] 生成註釋時出錯: {e}")
-                return code  # 出錯時返回原始代碼
-        else:
-            # 使用nyaproxy 代理
-            try:
-                print(f"[INFO] 使用nyaproxy 代理")
-                request_payload = {
-                    "model": self.model_name,
-                    "messages": [{"role": "user", "content": prompt}],
-                }
-                print(
-                    f"[DEBUG] 發送到 nyaproxy 的請求體: {json.dumps(request_payload, indent=2)}"
-                )  # 新增的打印語句
-
-                response = requests.post(
-                    f"http://localhost:{Config.nyaproxy_port}/api/gemini/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                    },
-                    json=request_payload,
-                    timeout=120,
-                )
-                response.raise_for_status()
-
-                json_response = response.json()
-                print(
-                    f"[DEBUG] 從 nyaproxy 接收到的原始響應: {json_response}"
-                )  # 新增的打印語句
-
-                if "choices" in json_response and len(json_response["choices"]) > 0:
-                    raw_content = json_response["choices"][0]["message"]["content"]
-                    commented_code = self._extract_commented_code_from_response(
-                        raw_content
-                    )
-                    return commented_code
-                else:
+                    return parse_response(response_text)
+
+                except ResponseFormatError as e:
                     print(
-                        "[ERROR] nyaproxy 返回的響應中沒有 'choices' 或 'message' 字段"
+                        f"[WARNING] 模型回應無效: {e} (嘗試 {attempt+1}/{self.max_retries})"
                     )
-                    return code
-
-            except requests.exceptions.RequestException as e:
-                print(f"[ERROR] 通過 nyaproxy 發送請求時出錯: {e}")
-                return code
-            except json.JSONDecodeError as e:
-                print(f"[ERROR] 解碼 nyaproxy 響應時出錯: {e}")
-                return code
+                    if correct_prompt is not None and attempt < self.max_retries - 1:
+                        # 回應無效不是配額問題，不需要等待，直接修正提示詞重試
+                        prompt = correct_prompt(str(e))
+                        print("[INFO] 立即以修正提示詞重試...")
+                        continue
+                    if attempt < self.max_retries - 1:
+                        wait_time = min((2**attempt) + random.random(), self.max_backoff)
+                        print(f"[INFO] 等待 {wait_time:.2f} 秒後重試...")
+                        self._sleep(wait_time)
+                        continue
+                    print("[ERROR] 多次嘗試後模型回應仍無效")
+                    return None
+
+                except OperationCancelledError:
+                    raise
+
+                except Exception as e:
+                    error_msg = str(e)
+                    print(f"[ERROR] 生成註釋時出錯: {error_msg}")
+
+                    # 處理API配額限制錯誤
+                    if (
+                        "429" in error_msg
+                        or "quota" in error_msg
+                        or "exhausted" in error_msg
+                        or "rate limit" in error_msg.lower()
+                    ):
+                        if attempt < self.max_retries - 1:
+                            wait_time = min(
+                                (2**attempt) * 10 + random.uniform(0, 5),
+                                self.max_backoff,
+                            )
+                            print(
+                                f"[WARNING] 檢測到API配額限制，等待 {wait_time:.2f} 秒後重試..."
+                            )
+                            self._sleep(wait_time)
+                            continue
+                        else:
+                            print("[ERROR] 多次嘗試後仍然遇到API配額限制")
+                            return None
+
+                    # 其他錯誤，如果還有重試次數，則等待後重試
+                    if attempt < self.max_retries - 1:
+                        wait_time = min((2**attempt) + random.random(), self.max_backoff)
+                        print(f"[INFO] 等待 {wait_time:.2f} 秒後重試...")
+                        self._sleep(wait_time)
+                    else:
+                        print("[ERROR] 多次嘗試後仍然出錯")
+                        return None
+
+            # 如果所有嘗試都失敗
+            return None
+        except OperationCancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] 生成註釋時出錯: {e}")
+            return None
@@ -0,0 +1,157 @@
+import fnmatch
+import logging
+
+from core.file_sniffer import sniff_file
+from core.quota_planner import estimate_tokens_from_size
+
+# 內建的各語言自動產生文件特徵：
+#   names   文件名模式
+#   paths   相對路徑模式 (例如打包進來的第三方代碼)
+#   markers 文件開頭的標記 (不分大小寫)
+BUILTIN_RULES = {
+    "*.py": {
+        "names": ["*_pb2.py", "*_pb2_grpc.py", "*_pb2.pyi"],
+        "paths": ["*/migrations/[0-9][0-9][0-9][0-9]_*.py"],
+        "markers": ["Generated by the protocol buffer compiler", "Generated by Django"],
+    },
+    "*.js": {
+        "names": ["*.min.js", "*.bundle.js", "*-bundle.js", "*.chunk.js", "*.pack.js"],
+        "paths": ["vendor/*", "*/vendor/*", "bower_components/*", "*/static/dist/*"],
+        "markers": ["webpackBootstrap", "For license information please see"],
+    },
+    "*.mjs": {"names": ["*.min.mjs"], "paths": ["vendor/*", "*/vendor/*"]},
+    "*.css": {"names": ["*.min.css"], "paths": ["vendor/*", "*/vendor/*"]},
+    "*.ts": {"names": ["*.d.ts", "*.generated.ts"]},
+    "*.go": {
+        "names": ["*.pb.go", "*_gen.go", "zz_generated*.go", "*_string.go"],
+        "paths": ["vendor/*", "*/vendor/*"],
+        "markers": ["Code generated"],
+    },
+    "*.java": {"markers": ["@Generated", "Generated by the protocol buffer compiler"]},
+    "*.kt": {"markers": ["@Generated"]},
+    "*.cs": {
+        "names": ["*.Designer.cs", "*.designer.cs", "*.g.cs", "*.g.i.cs"],
+        "markers": ["<auto-generated"],
+    },
+    "*.dart": {"names": ["*.g.dart", "*.freezed.dart", "*.pb.dart"]},
+    "*.rs": {"markers": ["automatically generated by rust-bindgen"]},
+    "*.php": {"paths": ["vendor/*", "*/vendor/*"]},
+    "*.c": {"markers": ["Generated by Cython", "A Bison parser, made by"]},
+    "*.h": {"markers": ["generated by flex", "A Bison parser, made by"]},
+}
+
+
+class GeneratedFileClassifier:
+    """判斷文件是否為壓縮、打包或自動產生的代碼，這類文件不值得註釋且非常耗費 token。
+
+    依序檢查：不受限制的模式 (allow)、各語言的文件名與路徑特徵、文件大小，
+    最後取樣文件開頭檢查行長與自動產生標記。
+    """
+
+    def __init__(
+        self, rules=None, max_file_size_kb=0, check_content=True, allow=None
+    ):
+        """初始化分類器。
+
+        Args:
+            rules (dict, optional): 語言模式 → {names, paths, markers}，與內建規則合併。
+            max_file_size_kb (int): 超過此大小 (KB) 的文件視為產生的代碼，0 表示不限制。
+            check_content (bool): 是否取樣文件開頭檢查行長與標記。
+            allow (list, optional): 永遠不視為產生代碼的相對路徑或文件名模式。
+        """
+        self.rules = {
+            pattern: {key: list(values) for key, values in rule.items()}
+            for pattern, rule in BUILTIN_RULES.items()
+        }
+        for pattern, rule in (rules or {}).items():
+            merged = self.rules.setdefault(pattern, {})
+            for key in ("names", "paths", "markers"):
+                merged.setdefault(key, []).extend((rule or {}).get(key) or [])
+        self.max_file_size = int(max_file_size_kb or 0) * 1024
+        self.check_content = check_content
+        self.allow = list(allow or [])
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+
+    @classmethod
+    def from_config(cls):
+        """依 config/exclude.yaml 的 generated 設定建立分類器，停用時返回 None"""
+        from config.exclude_file import generated_file_settings
+
+        settings = generated_file_settings()
+        if not settings.get("enabled", True):
+            return None
+        return cls(
+            rules=settings.get("rules"),
+            max_file_size_kb=settings.get("max_file_size_kb", 0),
+            check_content=settings.get("check_content", True),
+            allow=settings.get("allow"),
+        )
+
+    def classify(self, path, relative_path):
+        """判斷文件是否為產生的代碼。
+
+        Args:
+            path (Path): 文件路徑。
+            relative_path (str): 相對於來源目錄的路徑 (以 / 分隔)。
+
+        Returns:
+            str | None: 判斷為產生代碼的原因，否則返回 None。
+        """
+        if any(
+            fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(path.name, pattern)
+            for pattern in self.allow
+        ):
+            return None
+
+        markers = []
+        for language_pattern, rule in self.rules.items():
+            if not fnmatch.fnmatch(path.name, language_pattern):
+                continue
+            for pattern in rule.get("names", []):
+                if fnmatch.fnmatchcase(path.name, pattern):
+                    return self._record(path, f"文件名符合 {pattern}")
+            for pattern in rule.get("paths", []):
+                if fnmatch.fnmatch(relative_path, pattern):
+                    return self._record(path, f"路徑符合 {pattern}")
+            markers.extend(rule.get("markers", []))
+
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return None
+        if self.max_file_size and size > self.max_file_size:
+            return self._record(path, f"文件大小 {size // 1024} KB 超過上限", size)
+
+        if self.check_content:
+            try:
+                sniff = sniff_file(path, extra_markers=markers)
+            except OSError:
+                return None
+            if sniff.kind in ("minified", "generated"):
+                return self._record(path, sniff.reason, size)
+        return None
+
+    def saved_tokens(self):
+        """估算略過的文件所節省的輸入 token"""
+        return estimate_tokens_from_size(self.skipped_bytes)
+
+    def summary(self):
+        """略過結果的摘要，沒有略過任何文件時返回 None"""
+        if not self.skipped_files:
+            return None
+        return (
+            f"略過 {self.skipped_files} 個壓縮或自動產生的文件 "
+            f"({self.skipped_bytes / 1024:.1f} KB)，約節省 {self.saved_tokens()} 輸入 token。"
+        )
+
+    def _record(self, path, reason, size=None):
+        if size is None:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = 0
+        self.skipped_files += 1
+        self.skipped_bytes += size
+        logging.info(f"文件 {path} 判斷為產生的代碼 ({reason})，略過。")
+        return reason
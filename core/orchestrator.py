@@ -1,27 +1,66 @@
 import logging
-import time
+import socket
+import threading
 import os  # 新增導入
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from core.cancellation import CancellationToken
+from core.cpu_pool import CpuPool
 from core.file_scanner import FileScanner
 from core.file_processor import FileProcessor
+from core.estimator import RunEstimator
 from core.gemini_client import SendCode
+from core.output_writer import OutputWriter
+from core.quota_planner import QuotaPlanner
+from core.run_cache import RunCache
+from core.scheduler import WorkScheduler
 from config.API_config.test_api_connection import TestApiConnection
+from config.config import Config
 from config.log_config import setup_logging
 from config.exclude_file import exclude_patterns  # 導入 exclude_patterns
+from exceptions.exceptions import BatchJobError, OperationCancelledError
 
 
 class ProjectOrchestrator:
     """協調整個項目處理流程，包括掃描、處理和進度報告。"""
 
-    def __init__(self, settings, progress_queue=None):
+    def __init__(
+        self,
+        settings,
+        progress_queue=None,
+        cancel_token=None,
+        api_client=None,
+        request_limiter=None,
+    ):
         self.settings = settings
+        # 由 GUI 或 CLI 持有同一個信號以取消或暫停運行
+        self.cancel_token = cancel_token or CancellationToken()
         self.progress_queue = progress_queue
-        self.api_client = None
+        # 常駐服務注入已初始化的客戶端，省去 SDK 設定與連線測試；
+        # 注入的客戶端由服務負責關閉
+        self.api_client = api_client
+        self._owns_api_client = api_client is None
+        # 常駐服務的所有工作共用同一個限制器，合計的請求速率不超過單一運行
+        self.request_limiter = request_limiter
         self.exclude_patterns = exclude_patterns()  # 載入排除模式
+        self._progress_lock = threading.Lock()
+        self._processed_files = 0
+        self._total_files = 0
+        self.quota_planner = None
+        self._pending_files = {}
+        self.writer = None
+        # 監看模式中已回報的寫入失敗數
+        self._reported_write_failures = 0
+        self.cpu_pool = None
 
-    def run(self):
-        """執行主協調流程。"""
+    def run(self, keep_api_client=False):
+        """執行主協調流程。
+
+        Args:
+            keep_api_client (bool): 完成後不關閉自行建立的 API 客戶端
+                (監看模式在第一次處理後繼續使用)。
+        """
         try:
             self._setup_logging()
             self._log("協調器開始運行...")
@@ -32,86 +71,966 @@ class ProjectOrchestrator:
 
             self._log(f"載入的排除模式: {self.exclude_patterns}")
 
-            scanner = FileScanner(
-                src_dir=Path(self.settings.get("folder")),
-                output_path=Path(self.settings.get("output")),
-                filters=[
-                    f.strip()
-                    for f in self.settings.get("filter", "").split(",")
-                    if f.strip()
-                ],
-                recursive=self.settings.get("recursive", False),
-                exclude_patterns=self.exclude_patterns,  # 傳遞排除模式
-            )
+            scanner = self._create_scanner()
+
+            # 網路工作線程只提交結果，由寫入線程負責原子性地寫入磁碟
+            self.writer = OutputWriter().start()
+            run_cache = self._create_run_cache()
+            self.cpu_pool = self._create_cpu_pool()
+            processor = self._create_processor(run_cache)
+            self._processed_files = 0
+            workers = max(1, int(self.settings.get("workers", 1) or 1))
+
+            if self.settings.get("low_memory", False):
+                self._run_bounded(scanner, processor, run_cache, workers)
+                self._finish_run()
+                return
 
             self._log("開始掃描文件和複製項目結構...")
             files_to_process = scanner.scan_and_copy()
             total_files = len(files_to_process)
             self._log(f"掃描完成，共找到 {total_files} 個文件需要處理。")
+            self._log_generated_summary(scanner)
+            self._total_files = total_files
 
-            processor = FileProcessor(self.api_client)
-            processed_files = 0
+            # 內容相同的文件只呼叫一次 API，結果複製到其餘目標路徑
+            groups = self._group_identical_files(files_to_process)
+            duplicates = total_files - len(groups)
+            if duplicates:
+                self._log(
+                    f"發現 {duplicates} 個內容重複的文件，實際只需處理 {len(groups)} 份唯一內容。"
+                )
+            groups = self._create_scheduler().order(groups)
+            if self.settings.get("quota_plan", False):
+                groups = self._plan_quota(processor, run_cache, groups)
 
-            for src_path, dest_path in files_to_process:
-                if processor.process(src_path, dest_path):
-                    # 處理成功
-                    pass
-                else:
-                    # 處理失敗
-                    self._log(f"處理文件 {src_path} 失敗。", is_error=True)
+            if workers == 1:
+                for group in groups:
+                    self._process_group(processor, group)
+            else:
+                self._log(f"使用 {workers} 個並行工作線程處理。")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    # 每份唯一內容只提交一次，並行時也不會重複請求
+                    for _ in executor.map(
+                        lambda group: self._process_group(processor, group), groups
+                    ):
+                        pass
+
+            self._finish_run()
+
+        except OperationCancelledError:
+            self._finish_cancelled()
+        except Exception as e:
+            self._log(f"協調過程中發生未預期的錯誤: {e}", is_error=True)
+            self._update_progress(100, f"錯誤: {e}")
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+            if self.cpu_pool is not None:
+                self.cpu_pool.close()
+            if not keep_api_client:
+                self._close_api_client()
+
+    def _finish_run(self):
+        """等待寫入完成並回報結果。"""
+        self.writer.close()
+        output_path = Path(self.settings.get("output"))
+        src_dir = Path(self.settings.get("folder"))
+        for failed_path in self.writer.failed:
+            self._log(f"寫入文件 {failed_path} 失敗。", is_error=True)
+            if self.quota_planner is not None:
+                # 結果沒有寫入的文件仍未註釋，放回待處理列表
+                relative_path = Path(failed_path).relative_to(output_path)
+                self._pending_files[src_dir / relative_path] = relative_path.as_posix()
+
+        if self.quota_planner is not None:
+            # 只保留處理失敗的文件，已用額度留給同一配額窗口內的下一次運行
+            self.quota_planner.save_pending(self._pending_files.values())
+        self._log("所有文件處理完成。")
+        self._update_progress(100, "處理完成")
+
+    def _finish_cancelled(self):
+        """取消後保存已完成的結果與剩餘工作。"""
+        if self.writer is not None:
+            self.writer.close()
+        if self.quota_planner is not None:
+            with self._progress_lock:
+                pending = list(self._pending_files.values())
+            self.quota_planner.save_pending(pending)
+            self._log(f"剩餘 {len(pending)} 個文件，以 --quota-plan 重新運行即可接續處理。")
+        self._log("處理已取消。")
+        self._update_progress(0, "已取消")
+
+    def _wait_if_paused(self):
+        """暫停時阻塞到繼續為止，取消時拋出 OperationCancelledError。
 
-                processed_files += 1
-                progress = int((processed_files / total_files) * 100)
-                self._update_progress(
-                    progress, f"進度: {processed_files}/{total_files}"
+        暫停前先保存剩餘工作，暫停期間關閉程式也能在之後接續。
+        """
+        if self.cancel_token.paused and self.quota_planner is not None:
+            with self._progress_lock:
+                pending = list(self._pending_files.values())
+            self.quota_planner.save_pending(pending)
+        self.cancel_token.wait_if_paused()
+
+    def _run_bounded(self, scanner, processor, run_cache, workers):
+        """低記憶體模式：邊掃描邊處理，不建立完整的文件列表。
+
+        同時在處理中的文件數有上限，掃描會等待工作線程跟上，記憶體用量不隨
+        文件數量增長。此模式不做內容去重與排序，也不預先估算配額。
+        """
+        src_dir = Path(self.settings.get("folder"))
+        output_path = Path(self.settings.get("output"))
+        self._total_files = None
+        if self.settings.get("quota_plan", False):
+            self._create_quota_planner(run_cache)
+            self._log("低記憶體模式不預先估算配額，只在每次請求前檢查額度。")
+
+        in_flight_limit = workers * Config.LOW_MEMORY_IN_FLIGHT_FACTOR
+        self._log(
+            f"低記憶體模式: 邊掃描邊處理，最多 {in_flight_limit} 個文件同時在處理中。"
+        )
+        in_flight = threading.BoundedSemaphore(in_flight_limit)
+
+        def process_item(item):
+            try:
+                self._process_group(
+                    processor,
+                    [(item.src_path(src_dir), item.dest_path(output_path))],
                 )
-                time.sleep(self.settings.get("delay", 1))
+            except OperationCancelledError:
+                pass
+            except Exception as e:
+                self._log(f"處理文件 {item.relative_path} 時發生錯誤: {e}", is_error=True)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in scanner.iter_and_copy():
+                self._wait_if_paused()
+                in_flight.acquire()
+                executor.submit(process_item, item)
+        # 工作線程中的取消不會拋出到這裡，掃描完成後再確認一次
+        self.cancel_token.check()
+        self._log_generated_summary(scanner)
+
+    def _log_generated_summary(self, scanner):
+        summary = scanner.generated_summary()
+        if summary:
+            self._log(summary, is_warning=True)
+
+    def watch(self):
+        """監看模式：完成第一次完整處理後持續監看來源目錄，只重新處理變更的文件。
+
+        連續的儲存會合併為一批；同一文件在處理期間又被修改時，取消舊版本的請求。
+        直到 cancel_token 被取消 (Ctrl+C) 為止。
+        """
+        from core.watcher import FileWatcher
+
+        self.run(keep_api_client=True)
+        if self.api_client is None or self.cancel_token.cancelled:
+            self._close_api_client()
+            return
+
+        try:
+            self.writer = OutputWriter().start()
+            self._reported_write_failures = 0
+            run_cache = self._create_run_cache()
+            self.cpu_pool = self._create_cpu_pool()
+            scanner = self._create_scanner()
+            watcher = FileWatcher(
+                scanner.src_dir,
+                recursive=scanner.recursive,
+                is_excluded=lambda path: self._is_watch_excluded(scanner, path),
+                debounce=self.settings.get("watch_debounce")
+                or Config.WATCH_DEBOUNCE_SECONDS,
+                force_polling=self.settings.get("watch_polling", False),
+            )
+            self._total_files = None
+            self._processed_files = 0
+            self._log(f"開始監看 {scanner.src_dir} 的變更 ({watcher.mode})，按 Ctrl+C 停止。")
+
+            workers = max(1, int(self.settings.get("workers", 1) or 1))
+            # 來源路徑 → (取消信號, future)，用於取消同一文件的舊版本
+            in_flight = {}
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for batch in watcher.batches(self.cancel_token):
+                    self._report_write_failures()
+                    for src_path in sorted(batch):
+                        self._handle_watch_change(
+                            scanner, run_cache, executor, in_flight, src_path
+                        )
+        except OperationCancelledError:
+            self._log("監看已停止。")
+        except Exception as e:
+            self._log(f"監看過程中發生未預期的錯誤: {e}", is_error=True)
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+                self._report_write_failures()
+            if self.cpu_pool is not None:
+                self.cpu_pool.close()
+            self._close_api_client()
+
+    def _report_write_failures(self):
+        """回報監看期間尚未回報過的寫入失敗"""
+        failed = self.writer.failed[self._reported_write_failures :]
+        self._reported_write_failures += len(failed)
+        for failed_path in failed:
+            self._log(f"寫入文件 {failed_path} 失敗。", is_error=True)
+
+    def _is_watch_excluded(self, scanner, path):
+        """監看時排除被掃描器排除的路徑，以及位於來源目錄內的輸出與快取目錄"""
+        for own_dir in (
+            self.settings.get("output"),
+            self.settings.get("cache_dir") or Config.DEFAULT_CACHE_DIR,
+        ):
+            own_dir = Path(own_dir).resolve()
+            resolved = path.resolve()
+            if resolved == own_dir or own_dir in resolved.parents:
+                return True
+        return scanner.is_excluded(path)
 
-            self._log("所有文件處理完成。")
+    def _handle_watch_change(self, scanner, run_cache, executor, in_flight, src_path):
+        """處理一個變更的文件：取消同一文件仍在進行的舊請求，再提交新版本。"""
+        if self._is_watch_excluded(scanner, src_path):
+            return
+        action = scanner.match_changed_path(src_path)
+        if action is None:
+            return
+        dest_path = Path(self.settings.get("output")) / src_path.relative_to(
+            scanner.src_dir
+        )
+        with self._progress_lock:
+            previous = in_flight.get(src_path)
+        if not src_path.exists():
+            self._log(f"文件 {src_path} 已刪除，移除輸出文件。")
+            if previous is None:
+                self.writer.remove(dest_path)
+                return
+            # 先取消仍在處理的舊版本，待其結束後再刪除，避免結果在刪除後才寫入
+            previous[0].cancel()
+            previous[1].add_done_callback(lambda _: self.writer.remove(dest_path))
+            return
+        if action == "copy":
+            self.writer.copy(src_path, dest_path)
+            return
+
+        if previous is not None and not previous[1].done():
+            previous[0].cancel()
+            self._log(f"文件 {src_path} 又被修改，取消舊版本的處理。", is_warning=True)
+
+        token = self.cancel_token.child()
+        processor = self._create_processor(run_cache, cancel_token=token)
+
+        def process():
+            try:
+                self._log(f"文件 {src_path} 已變更，重新處理。")
+                if not processor.process(src_path, dest_path):
+                    self._log(f"處理文件 {src_path} 失敗。", is_error=True)
+                self._advance_progress(1)
+            except OperationCancelledError:
+                pass
+            finally:
+                with self._progress_lock:
+                    if in_flight.get(src_path, (None,))[0] is token:
+                        del in_flight[src_path]
+
+        with self._progress_lock:
+            in_flight[src_path] = (token, executor.submit(process))
+
+    def enqueue(self):
+        """協調者：掃描文件、建立輸出目錄結構，並把工作寫入共用佇列。
+
+        工作依處理順序策略排列，內容相同的文件相鄰，先完成的結果會被其餘文件複用。
+        """
+        try:
+            self._setup_logging()
+            work_queue = self._create_work_queue()
+            self.cpu_pool = self._create_cpu_pool()
+            scanner = self._create_scanner()
+
+            self._log("開始掃描文件和複製項目結構...")
+            files_to_process = scanner.scan_and_copy()
+            self._log(f"掃描完成，共找到 {len(files_to_process)} 個文件需要處理。")
+            self._log_generated_summary(scanner)
+
+            hashes = self.cpu_pool.hash_files([src for src, _ in files_to_process])
+            digests = {
+                src_path: digest
+                for (src_path, _), (digest, _) in zip(files_to_process, hashes)
+            }
+            groups = self._create_scheduler().order(
+                self._group_identical_files(files_to_process, hashes)
+            )
+            src_dir = Path(self.settings.get("folder"))
+            pending = work_queue.enqueue(
+                (src_path.relative_to(src_dir).as_posix(), digests[src_path])
+                for group in groups
+                for src_path, _ in group
+            )
+            self._log(f"已將 {pending} 個工作加入佇列 {work_queue.db_path}。")
+        except Exception as e:
+            self._log(f"建立工作佇列時發生錯誤: {e}", is_error=True)
+        finally:
+            if self.cpu_pool is not None:
+                self.cpu_pool.close()
+
+    def run_worker(self):
+        """工作進程：從共用佇列租用工作並處理，直到佇列中沒有待處理或處理中的工作。
+
+        可同時啟動多個工作進程，各自使用自己的 API 金鑰；佇列資料庫必須位於
+        本機檔案系統，工作進程需與協調者在同一台機器上運行。
+        """
+        try:
+            self._setup_logging()
+            if not self._setup_api_client():
+                self._log("API 客戶端初始化失敗，終止處理。", is_error=True)
+                return
+
+            work_queue = self._create_work_queue()
+            worker_id = (
+                self.settings.get("worker_id")
+                or f"{socket.gethostname()}-{os.getpid()}"
+            )
+            self.writer = OutputWriter().start()
+            run_cache = self._create_run_cache()
+            self.cpu_pool = self._create_cpu_pool()
+            processor = self._create_processor(run_cache)
+            self._total_files = None
+            self._processed_files = 0
+            self._log(f"工作進程 {worker_id} 開始從佇列 {work_queue.db_path} 租用工作。")
+
+            while True:
+                self._wait_if_paused()
+                job = work_queue.lease(worker_id)
+                if job is None:
+                    counts = work_queue.counts()
+                    if not counts.get("pending") and not counts.get("leased"):
+                        break
+                    # 其他進程處理中的工作可能因租約過期而重新排入佇列
+                    self.cancel_token.sleep(Config.QUEUE_POLL_SECONDS)
+                    continue
+                self._process_job(work_queue, worker_id, job, processor)
+
+            self.writer.close()
+            for failed_path in self.writer.failed:
+                self._log(f"寫入文件 {failed_path} 失敗。", is_error=True)
+            for relative_path, error in work_queue.failed_jobs():
+                self._log(f"工作 {relative_path} 多次嘗試後仍失敗: {error}", is_error=True)
+            self._log(
+                f"佇列已清空，工作進程 {worker_id} 共處理 {self._processed_files} 個文件。"
+            )
             self._update_progress(100, "處理完成")
+        except OperationCancelledError:
+            self._finish_cancelled()
+        except Exception as e:
+            self._log(f"工作進程發生未預期的錯誤: {e}", is_error=True)
+            self._update_progress(100, f"錯誤: {e}")
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+            if self.cpu_pool is not None:
+                self.cpu_pool.close()
+            self._close_api_client()
+
+    def _process_job(self, work_queue, worker_id, job, processor):
+        """處理一個租用的工作，處理期間在背景續約。"""
+        from core.work_queue import LeaseKeeper
 
+        src_path = Path(self.settings.get("folder")) / job.relative_path
+        output_path = Path(self.settings.get("output"))
+        dest_path = output_path / job.relative_path
+        needs_api = False
+        failed_before = len(self.writer.failed)
+        try:
+            with LeaseKeeper(work_queue, job, worker_id) as keeper:
+                duplicate = work_queue.find_done(
+                    job.content_hash, src_path.suffix.lower(), exclude_id=job.id
+                )
+                if duplicate is not None:
+                    # 其他工作已處理過相同內容，直接複製其結果
+                    self.writer.copy(output_path / duplicate, dest_path)
+                    logging.info(f"文件 {src_path} 與 {duplicate} 內容相同，已複用結果。")
+                    success = True
+                else:
+                    needs_api = processor.needs_api(src_path)
+                    success = processor.process(src_path, dest_path)
+                # 標記完成前確保結果已寫入，其他工作進程才能安全地複用
+                self.writer.flush()
+                write_failed = dest_path in self.writer.failed[failed_before:]
+        except OperationCancelledError:
+            work_queue.release(job, worker_id)
+            raise
+
+        if keeper.lost:
+            self._log(
+                f"工作 {job.relative_path} 的租約已過期並由其他工作進程接手。",
+                is_error=True,
+            )
+        elif success and not write_failed:
+            work_queue.complete(job, worker_id)
+        else:
+            # 結果沒有寫入時不能標記完成，否則其他工作會複用不存在或過期的輸出
+            work_queue.fail(job, worker_id, "寫入失敗" if write_failed else "處理失敗")
+            self._log(
+                f"處理文件 {src_path} 失敗 (第 {job.attempts} 次嘗試)。", is_error=True
+            )
+        self._advance_progress(1)
+        if needs_api:
+            self.cancel_token.sleep(self.settings.get("delay", 1))
+
+    def _create_work_queue(self):
+        """開啟 --queue 指定的共用工作佇列。"""
+        from core.work_queue import WorkQueue
+
+        return WorkQueue(
+            self.settings.get("queue"),
+            lease_seconds=self.settings.get("lease_seconds")
+            or Config.QUEUE_LEASE_SECONDS,
+        )
+
+    def run_batch(self):
+        """批次模式：所有文件的提示詞作為 Gemini 批次工作提交，完成後取回結果並寫入。
+
+        已提交的工作記錄在檢查點中，中斷後以相同設定重新運行會接續等待，
+        只提交新增或內容改變的文件。批次結果無法重試，無效的回應保留原始內容。
+        """
+        from core.backends.gemini_batch import (
+            TERMINAL_STATES,
+            GeminiBatchClient,
+            split_batch_requests,
+        )
+        from core.batch_checkpoint import BatchCheckpoint, prompt_hash
+
+        try:
+            self._setup_logging()
+            self._log("協調器開始運行 (批次模式)...")
+            scanner = self._create_scanner()
+            self.writer = OutputWriter().start()
+            run_cache = self._create_run_cache()
+            processor = self._create_processor(run_cache)
+            self._processed_files = 0
+
+            self._log("開始掃描文件和複製項目結構...")
+            files_to_process = scanner.scan_and_copy()
+            self._total_files = len(files_to_process)
+            self._log(f"掃描完成，共找到 {self._total_files} 個文件需要處理。")
+            self._log_generated_summary(scanner)
+
+            src_dir = Path(self.settings.get("folder"))
+            requests = {}
+            for src_path, dest_path in files_to_process:
+                self.cancel_token.check()
+                prepared = processor.prepare_batch_request(src_path, dest_path)
+                if prepared is None:
+                    self._advance_progress(1)
+                    continue
+                key = src_path.relative_to(src_dir).as_posix()
+                requests[key] = (src_path, dest_path) + prepared
+            if not requests:
+                self._finish_run()
+                return
+
+            model = self._model_name() or Config.DEFAULT_MODEL_NAME
+            output_format = processor.output_format
+            client = GeminiBatchClient(
+                api_key=self.settings.get("api_key"),
+                model=model,
+                base_url=self.settings.get("base_url"),
+                cancel_token=self.cancel_token,
+            )
+            checkpoint = BatchCheckpoint(
+                self._batch_checkpoint_path(), model, output_format
+            )
+            hashes = {
+                key: prompt_hash(request[3]) for key, request in requests.items()
+            }
+            for job in checkpoint.stale_jobs(hashes):
+                # 其中的文件都已改變，結果不再有用
+                self._log(
+                    f"批次工作 {job['name']} 的文件都已改變，取消並忽略其結果。",
+                    is_warning=True,
+                )
+                try:
+                    client.cancel(job["name"])
+                except BatchJobError as e:
+                    logging.warning(f"取消批次工作 {job['name']} 失敗: {e}")
+                checkpoint.remove_job(job)
+
+            submitted = checkpoint.covered_keys(hashes)
+            if submitted:
+                self._log(
+                    f"接續 {len(checkpoint.jobs)} 個已提交的批次工作 "
+                    f"(共 {len(submitted)} 個文件)。"
+                )
+            pending = [
+                (key, request[3])
+                for key, request in requests.items()
+                if key not in submitted
+            ]
+            for group in split_batch_requests(pending):
+                name = client.create(
+                    group,
+                    display_name=f"comment_maker {src_dir.name}",
+                    json_mode=self.settings.get("json_mode", Config.DEFAULT_JSON_MODE),
+                )
+                # 每提交一個工作就保存，之後中斷也不會重複提交
+                checkpoint.add_job(name, {key: hashes[key] for key, _ in group})
+                self._log(f"已提交批次工作 {name}，共 {len(group)} 個文件。")
+
+            poll_seconds = self.settings.get("batch_poll") or Config.BATCH_POLL_SECONDS
+            while checkpoint.jobs:
+                for job in list(checkpoint.jobs):
+                    batch = self._retry_batch_call(
+                        lambda: client.get(job["name"]), f"查詢批次工作 {job['name']}"
+                    )
+                    state = client.state(batch)
+                    if state != job["state"]:
+                        self._log(f"批次工作 {job['name']} 狀態: {state}")
+                        checkpoint.update_state(job, state)
+                    if state not in TERMINAL_STATES:
+                        continue
+                    # 提交後已改變的文件由較新的工作處理
+                    keys = [
+                        key
+                        for key, value in job["requests"].items()
+                        if hashes.get(key) == value
+                    ]
+                    if state == "SUCCEEDED":
+                        results = self._retry_batch_call(
+                            lambda: client.results(batch, list(job["requests"])),
+                            f"取回批次工作 {job['name']} 的結果",
+                        )
+                        for key in keys:
+                            self._apply_batch_result(
+                                processor, requests[key], results.get(key)
+                            )
+                    else:
+                        self._log(
+                            f"批次工作 {job['name']} 以 {state} 結束，"
+                            f"{len(keys)} 個文件保留原始內容。",
+                            is_error=True,
+                        )
+                        self._advance_progress(len(keys))
+                    # 移除記錄前確保結果已寫入，中斷時才能重新取回
+                    self.writer.flush()
+                    checkpoint.remove_job(job)
+                if checkpoint.jobs:
+                    self.cancel_token.sleep(poll_seconds)
+
+            self._finish_run()
+
+        except OperationCancelledError:
+            self._log(
+                "已提交的批次工作仍在服務端處理，以 --batch 重新運行即可接續取回結果。"
+            )
+            self._finish_cancelled()
         except Exception as e:
-            self._log(f"協調過程中發生未預期的錯誤: {e}", is_error=True)
+            self._log(f"批次處理過程中發生錯誤: {e}", is_error=True)
             self._update_progress(100, f"錯誤: {e}")
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+
+    def _retry_batch_call(self, call, description):
+        """執行批次 API 請求，暫時性錯誤時以指數退避重試，永久性錯誤直接拋出
+
+        工作在服務端繼續處理，查詢失敗不應放棄已提交的工作；
+        需要停止時可以取消，之後以 --batch 重新運行接續。
+        """
+        delay = Config.BATCH_RETRY_BASE_SECONDS
+        while True:
+            try:
+                return call()
+            except BatchJobError as e:
+                if not e.transient:
+                    raise
+                self._log(
+                    f"{description} 失敗: {e}，{delay:.0f} 秒後重試。", is_warning=True
+                )
+                self.cancel_token.sleep(delay)
+                delay = min(delay * 2, Config.BATCH_RETRY_MAX_SECONDS)
+
+    def _apply_batch_result(self, processor, request, result):
+        """寫入單一文件的批次結果並回報進度"""
+        src_path, dest_path, code_content, _ = request
+        text, error = result if result is not None else (None, "結果中沒有此文件")
+        if error is not None:
+            self._log(f"文件 {src_path} 的批次請求失敗: {error}", is_error=True)
+        else:
+            processor.apply_batch_response(src_path, dest_path, code_content, text)
+        self._advance_progress(1)
+
+    def _batch_checkpoint_path(self):
+        """批次檢查點保存在增量快取目錄中，與配額狀態檔相同"""
+        src_dir = Path(self.settings.get("folder"))
+        cache_dir = RunCache.default_dir(
+            self.settings.get("cache_dir") or Config.DEFAULT_CACHE_DIR, src_dir
+        )
+        return cache_dir / Config.BATCH_CHECKPOINT_FILE
+
+    def estimate(self):
+        """只掃描文件並估算請求數、token 與處理時間，不呼叫 API 也不寫入輸出目錄。
+
+        Returns:
+            dict: RunEstimator.estimate() 的結果。
+        """
+        scanner = self._create_scanner()
+        files_to_process = scanner.scan()
+        sizes = []
+        for src_path, _ in files_to_process:
+            try:
+                sizes.append(src_path.stat().st_size)
+            except OSError:
+                sizes.append(0)
+        estimator = RunEstimator(
+            QuotaPlanner.from_settings(self.settings),
+            delay=self.settings.get("delay", Config.DEFAULT_REQUEST_DELAY),
+            workers=self.settings.get("workers", 1),
+        )
+        result = estimator.estimate(sizes)
+        classifier = scanner.classifier
+        result["skipped_generated"] = classifier.skipped_files if classifier else 0
+        result["saved_tokens"] = classifier.saved_tokens() if classifier else 0
+        return result
+
+    def _create_scanner(self):
+        """依設定建立文件掃描器。"""
+        return FileScanner(
+            src_dir=Path(self.settings.get("folder")),
+            output_path=Path(self.settings.get("output")),
+            filters=[
+                f.strip() for f in self.settings.get("filter", "").split(",") if f.strip()
+            ],
+            recursive=self.settings.get("recursive", False),
+            exclude_patterns=self.exclude_patterns,  # 傳遞排除模式
+            git_range=self.settings.get("git_range"),
+            git_files=self.settings.get("git_files", False),
+            files_from=self.settings.get("files_from"),
+            skip_generated=not self.settings.get("include_generated", False),
+        )
+
+    def _create_scheduler(self):
+        """依設定建立決定處理順序的排程器。"""
+        priority_paths = self.settings.get("priority_paths") or []
+        if isinstance(priority_paths, str):
+            priority_paths = priority_paths.split(",")
+        return WorkScheduler(
+            policy=self.settings.get("priority") or Config.DEFAULT_PRIORITY,
+            priority_paths=priority_paths,
+            src_dir=Path(self.settings.get("folder")),
+        )
+
+    def _create_processor(self, run_cache, cancel_token=None):
+        """依設定建立文件處理器。
+
+        指定 cancel_token 時處理器與 API 客戶端改用該信號，可單獨取消。
+        """
+        api_client = self.api_client
+        if cancel_token is None:
+            cancel_token = self.cancel_token
+        elif api_client is not None:
+            api_client = api_client.with_cancel_token(cancel_token)
+        max_file_size = self.settings.get("max_file_size")
+        if max_file_size is None and self.settings.get("low_memory", False):
+            max_file_size = Config.LOW_MEMORY_MAX_FILE_BYTES
+        return FileProcessor(
+            api_client,
+            output_format=self.settings.get(
+                "output_format", Config.DEFAULT_OUTPUT_FORMAT
+            ),
+            stream=self.settings.get("stream", False),
+            run_cache=run_cache,
+            writer=self.writer,
+            max_file_size=max_file_size or 0,
+            cancel_token=cancel_token,
+            cpu_pool=self.cpu_pool,
+            on_warning=lambda message: self._log(message, is_warning=True),
+            # 是否略過產生的代碼已由掃描器依 --include-generated 與 exclude.yaml 決定
+            skip_generated=False,
+        )
+
+    def _create_cpu_pool(self):
+        """依設定建立 CPU 子進程池，未設定時在目前線程執行 CPU 工作。"""
+        cpu_workers = max(
+            0, int(self.settings.get("cpu_workers", Config.DEFAULT_CPU_WORKERS) or 0)
+        )
+        if cpu_workers:
+            self._log(f"使用 {cpu_workers} 個子進程執行雜湊與註釋拼接。")
+        return CpuPool(cpu_workers).start()
+
+    def _create_run_cache(self):
+        """增量模式、配額規劃模式或批次模式下建立上次結果的快取，否則返回 None。
+
+        配額規劃與批次模式需要快取，才能在中斷後重新運行時跳過已完成的文件。
+        """
+        if not (
+            self.settings.get("incremental", False)
+            or self.settings.get("quota_plan", False)
+            or self.settings.get("batch", False)
+        ):
+            return None
+        src_dir = Path(self.settings.get("folder"))
+        cache_dir = RunCache.default_dir(
+            self.settings.get("cache_dir") or Config.DEFAULT_CACHE_DIR, src_dir
+        )
+        self._log(f"增量模式已啟用，快取目錄: {cache_dir}")
+        return RunCache(cache_dir, src_dir, writer=self.writer)
+
+    def _create_quota_planner(self, run_cache):
+        """建立配額規劃器，狀態檔保存在增量快取目錄中。"""
+        self.quota_planner = QuotaPlanner.from_settings(
+            self.settings, state_path=run_cache.cache_dir / Config.QUOTA_STATE_FILE
+        )
+        return self.quota_planner
+
+    def _plan_quota(self, processor, run_cache, groups):
+        """估算需要呼叫 API 的文件所需額度，與每日配額比較並記錄處理計劃。
+
+        上次運行未完成的文件排在最前面優先處理，其餘保持原有順序。
+
+        Returns:
+            list: 調整順序後的文件組。
+        """
+        planner = self._create_quota_planner(run_cache)
+
+        src_dir = Path(self.settings.get("folder"))
+        previous_pending = set(planner.pending)
+        if previous_pending:
+            resumed = [
+                group
+                for group in groups
+                if group[0][0].relative_to(src_dir).as_posix() in previous_pending
+            ]
+            if resumed:
+                self._log(f"上次運行還有 {len(resumed)} 個文件未完成，優先處理。")
+                resumed_ids = {id(group) for group in resumed}
+                groups = resumed + [
+                    group for group in groups if id(group) not in resumed_ids
+                ]
+
+        sizes = []
+        for group in groups:
+            src_path = group[0][0]
+            if not processor.needs_api(src_path):
+                continue
+            try:
+                sizes.append(src_path.stat().st_size)
+            except OSError:
+                sizes.append(0)
+            self._pending_files[src_path] = src_path.relative_to(src_dir).as_posix()
+        planner.save_pending(self._pending_files.values())
+
+        plan = planner.plan(sizes)
+        self._log(
+            f"配額規劃: 需要 {plan['requests']} 次請求，估計約 {plan['tokens']} token "
+            f"(輸入 {plan['input_tokens']}，輸出 {plan['output_tokens']})。"
+        )
+        token_info = (
+            f"，{plan['remaining_tokens_today']}/{planner.daily_tokens} token"
+            if planner.daily_tokens
+            else ""
+        )
+        self._log(
+            f"{planner.key_count} 個金鑰今日剩餘額度: "
+            f"{plan['remaining_requests_today']}/{planner.daily_requests} 次請求{token_info}。"
+        )
+        if plan["days"] > 1:
+            self._log(
+                f"預計需要 {plan['days']} 天完成，額度用完時會等待配額重置後自動繼續。"
+            )
+
+        delay = self.settings.get("delay", 1)
+        workers = max(1, int(self.settings.get("workers", 1) or 1))
+        if planner.requests_per_minute and delay > 0:
+            requests_per_minute = workers * 60 / delay
+            if requests_per_minute > planner.requests_per_minute:
+                self._log(
+                    f"目前設定每分鐘最多約 {requests_per_minute:.0f} 次請求，"
+                    f"超過每分鐘 {planner.requests_per_minute} 次的限制，建議增加 --delay。",
+                    is_warning=True,
+                )
+        return groups
+
+    def _reserve_quota(self, prompt):
+        """每次呼叫模型前 (包括重試) 預留配額，額度用完時保存剩餘工作並等待配額重置。"""
+
+        def on_exhausted(wait_seconds):
+            with self._progress_lock:
+                pending = list(self._pending_files.values())
+            self.quota_planner.save_pending(pending)
+            self._log(
+                f"今日配額已用完，剩餘 {len(pending)} 個文件，"
+                f"將在約 {wait_seconds / 3600:.1f} 小時後配額重置時繼續。",
+                is_warning=True,
+            )
+
+        # 提示詞已包含固定的外框，估算略為偏高
+        tokens = self.quota_planner.estimate_request_tokens(len(prompt.encode("utf-8")))
+        self.quota_planner.reserve(
+            tokens,
+            on_exhausted=on_exhausted,
+            sleep=self.cancel_token.sleep,
+        )
+
+    def _group_identical_files(self, files_to_process, hashes=None):
+        """依內容雜湊 (與副檔名) 將文件分組，保持原有順序。
+
+        副檔名也納入分組依據，因為不同語言的註釋符號不同。
+
+        Args:
+            files_to_process (list): (來源路徑, 目標路徑) 列表。
+            hashes (list, optional): 已計算的 (雜湊值, 錯誤訊息)，與 files_to_process
+                順序相同。
+
+        Returns:
+            list: 每組為內容相同的 (來源路徑, 目標路徑) 列表，第一個為代表。
+        """
+        if hashes is None:
+            # 雜湊是 CPU 密集工作，設定 --cpu-workers 時分批交給子進程計算
+            hashes = self.cpu_pool.hash_files([src for src, _ in files_to_process])
+        groups = {}
+        for (src_path, dest_path), (digest, error) in zip(files_to_process, hashes):
+            if error is None:
+                key = (src_path.suffix.lower(), digest)
+            else:
+                # 無法讀取的文件單獨成組，交由處理器報告錯誤
+                logging.warning(f"計算文件 {src_path} 的雜湊失敗: {error}")
+                key = ("", str(src_path))
+            groups.setdefault(key, []).append((src_path, dest_path))
+        return list(groups.values())
+
+    def _process_group(self, processor, group):
+        """處理一組內容相同的文件：只處理第一個，再將結果複製給其餘文件。"""
+        src_path, dest_path = group[0]
+        self._wait_if_paused()
+        # 配額規劃模式下，複用快取結果的文件不消耗配額也不需要等待；
+        # 配額在每次實際呼叫模型前預留 (見 _before_request)，重試同樣計入
+        needs_api = self.quota_planner is None or processor.needs_api(src_path)
+        # 只有成功取得註釋時 process 才返回 True，失敗的文件留在待處理列表中，
+        # 寫入失敗的文件則在 _finish_run 放回
+        if processor.process(src_path, dest_path):
+            with self._progress_lock:
+                self._pending_files.pop(src_path, None)
+            for duplicate_src, duplicate_dest in group[1:]:
+                # 寫入線程依提交順序處理，複製時代表文件的結果已寫入
+                self.writer.copy(dest_path, duplicate_dest)
+                logging.info(f"文件 {duplicate_src} 與 {src_path} 內容相同，已複用結果。")
+        else:
+            for failed_src, _ in group:
+                self._log(f"處理文件 {failed_src} 失敗。", is_error=True)
+
+        self._advance_progress(len(group))
+        if needs_api:
+            self.cancel_token.sleep(self.settings.get("delay", 1))
+
+    def _advance_progress(self, count):
+        """累加已處理文件數並回報進度 (可在多個工作線程中調用)"""
+        with self._progress_lock:
+            self._processed_files += count
+            processed_files = self._processed_files
+        total_files = self._total_files
+        if total_files is None:
+            # 低記憶體模式邊掃描邊處理，無法預知總數
+            self._update_progress(0, f"進度: 已處理 {processed_files} 個文件")
+            return
+        progress = int((processed_files / total_files) * 100) if total_files else 100
+        self._update_progress(progress, f"進度: {processed_files}/{total_files}")
 
     def _setup_logging(self):
         output_path = Path(self.settings.get("output"))
         output_path.mkdir(parents=True, exist_ok=True)
+        if self.settings.get("external_logging", False):
+            # 常駐服務同時運行多個工作，日誌由服務統一設定
+            return
         log_file = output_path / "commenter.log"
         setup_logging(log_file)
 
+    def _model_name(self):
+        # GUI 以 model_name 傳入，CLI 則是 model
+        return self.settings.get("model_name") or self.settings.get("model")
+
+    def _before_request(self, prompt):
+        """每次呼叫模型前 (包括重試) 預留配額並等待共用的速率限制"""
+        if self.quota_planner is not None:
+            self._reserve_quota(prompt)
+        if self.request_limiter is not None:
+            self.request_limiter.acquire(sleep=self.cancel_token.sleep)
+
+    def _close_api_client(self):
+        """關閉自行建立的 API 客戶端 (刪除 context cache 等服務端資源)"""
+        if self._owns_api_client and self.api_client is not None:
+            self.api_client.close()
+            self.api_client = None
+
     def _setup_api_client(self):
+        if self.api_client is not None:
+            self.api_client = self.api_client.with_cancel_token(
+                self.cancel_token
+            ).with_request_hook(self._before_request)
+            return True
         api_key = self.settings.get("api_key")
+        model = self._model_name()
+        # GUI 以 use_nyaproxy 傳入，CLI 則是 nyaproxy
+        nyaproxy = bool(
+            self.settings.get("use_nyaproxy") or self.settings.get("nyaproxy")
+        )
+        backend = self.settings.get("backend")
+        base_url = self.settings.get("base_url")
         max_retries = 5
         for attempt in range(max_retries):
             try:
                 tester = TestApiConnection(
-                    api_key=api_key, nyaproxy=self.settings.get("use_nyaproxy", False)
+                    api_key=api_key,
+                    nyaproxy=nyaproxy,
+                    backend=backend,
+                    base_url=base_url,
                 )
                 if tester.test_api_connection():
-                    self._log("API 連線成功。")
                     self.api_client = SendCode(
                         api_key=api_key,
-                        model=self.settings.get("model_name"),
-                        nyaproxy=self.settings.get("use_nyaproxy", False),
+                        model=model,
+                        nyaproxy=nyaproxy,
+                        backend=backend,
+                        base_url=base_url,
+                        stall_timeout=self.settings.get(
+                            "stall_timeout", Config.DEFAULT_STREAM_STALL_TIMEOUT
+                        ),
+                        json_mode=self.settings.get(
+                            "json_mode", Config.DEFAULT_JSON_MODE
+                        ),
+                        cancel_token=self.cancel_token,
+                    ).with_request_hook(self._before_request)
+                    self._log(
+                        f"API 連線成功 (後端: {self.api_client.backend.name}，"
+                        f"模型: {self.api_client.model_name})。"
                     )
                     return True
             except Exception as e:
                 self._log(f"API 連線失敗: {e}", is_error=True)
                 if attempt < max_retries - 1:
                     wait_time = 2**attempt
-                    self._log(f"將在 {wait_time} 秒後重試...")
-                    time.sleep(wait_time)
+                    self._log(f"將在 {wait_time} 秒後重試...", is_warning=True)
+                    self.cancel_token.sleep(wait_time)
         self._log("API 連線失敗: 多次重試後仍無法連接到 API。", is_error=True)
         return False
 
-    def _log(self, message, is_error=False):
+    def _log(self, message, is_error=False, is_warning=False):
+        """記錄日誌並轉發給 GUI 或常駐服務 (等級為 INFO、WARNING 或 ERROR)
+
+        is_warning 用於不影響結果的異常情況，例如略過的文件與重試。
+        """
         if is_error:
+            level = "ERROR"
             logging.error(message)
+        elif is_warning:
+            level = "WARNING"
+            logging.warning(message)
         else:
+            level = "INFO"
             logging.info(message)
         if self.progress_queue:
-            self.progress_queue.put(("log", message))
+            self.progress_queue.put(("log", (message, level)))
 
     def _update_progress(self, progress, message):
         if self.progress_queue:
@@ -0,0 +1,259 @@
+import logging
+import os
+import queue
+import shutil
+import stat
+import tempfile
+import threading
+from pathlib import Path
+
+from config.config import Config
+
+
+def _default_file_mode():
+    """新文件的預設權限 (0o666 去掉 umask)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# umask 在進程內不變，匯入時讀取一次，避免多個線程同時修改 umask
+_DEFAULT_FILE_MODE = _default_file_mode()
+
+
+def create_temp_file(dest_path, suffix=".tmp"):
+    """在目標的目錄中建立唯一的空暫存檔並返回其路徑
+
+    每次寫入都使用不同的暫存檔，同一目標的多次寫入 (例如監看模式連續修改、
+    或同一批次中重複提交) 不會互相覆蓋暫存檔。
+    """
+    dest_path = Path(dest_path)
+    fd, temp_name = tempfile.mkstemp(
+        prefix=f".{dest_path.name}.", suffix=suffix, dir=dest_path.parent
+    )
+    os.close(fd)
+    return Path(temp_name)
+
+
+def apply_file_mode(temp_path, *mode_sources):
+    """把暫存檔的權限設為第一個存在的 mode_sources 的權限，都不存在時使用預設權限
+
+    mkstemp 建立的暫存檔權限為 0600，os.replace 後會沿用，因此替換前需要調整，
+    否則輸出會失去原有的權限 (例如可執行位元)。
+
+    Args:
+        temp_path (Path): 暫存檔。
+        mode_sources: 依序嘗試的路徑，例如原有的目標或複製的來源。
+    """
+    mode = _DEFAULT_FILE_MODE
+    for path in mode_sources:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            break
+        except OSError:
+            continue
+    os.chmod(temp_path, mode)
+
+
+class OutputWriter:
+    """在獨立的線程中寫入輸出文件，讓呼叫 API 的工作線程不必等待磁碟。
+
+    每個文件先寫入同目錄下唯一的暫存檔，再以 os.replace 原子性地替換目標，
+    中途崩潰不會留下寫到一半的文件。已建立的目錄會被記住，避免重複 mkdir；
+    fsync 以批次進行，一批文件全部寫完後才逐一同步再替換。
+    """
+
+    def __init__(
+        self,
+        queue_size=Config.WRITER_QUEUE_SIZE,
+        batch_size=Config.WRITER_BATCH_SIZE,
+        fsync=Config.WRITER_FSYNC,
+    ):
+        """初始化寫入器。
+
+        Args:
+            queue_size (int): 待寫入佇列的上限，佇列滿時提交者會等待。
+            batch_size (int): 每批最多處理的寫入數。
+            fsync (bool): 替換前是否將暫存檔與目錄同步到磁碟。
+        """
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self.failed = []
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._created_dirs = set()
+        self._thread = None
+
+    def start(self):
+        """啟動寫入線程"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="OutputWriter", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def write(self, dest_path, text):
+        """提交寫入文字內容 (utf-8)
+
+        Args:
+            dest_path (Path): 目標路徑。
+            text (str): 文件內容。
+        """
+        self._put(("write", Path(dest_path), text))
+
+    def copy(self, src_path, dest_path):
+        """提交複製文件；在此之前提交的寫入會先完成，因此可以複製剛寫入的結果
+
+        Args:
+            src_path (Path): 來源路徑。
+            dest_path (Path): 目標路徑。
+        """
+        self._put(("copy", Path(dest_path), Path(src_path)))
+
+    def move(self, temp_path, dest_path):
+        """提交以已寫好的暫存檔替換目標 (例如串流或分段處理的結果)
+
+        與其他寫入依提交順序完成，暫存檔應以 create_temp_file() 在目標目錄中建立。
+
+        Args:
+            temp_path (Path): 已寫好內容的暫存檔。
+            dest_path (Path): 目標路徑。
+        """
+        self._put(("move", Path(dest_path), Path(temp_path)))
+
+    def remove(self, dest_path):
+        """提交刪除文件；在此之前提交的寫入會先完成，不會在刪除後又被寫回
+
+        Args:
+            dest_path (Path): 要刪除的路徑，不存在時忽略。
+        """
+        self._put(("remove", Path(dest_path), None))
+
+    def flush(self):
+        """等待目前已提交的寫入全部完成"""
+        if self._thread is None:
+            return
+        self._queue.join()
+
+    def close(self):
+        """寫入剩餘的內容並停止線程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _put(self, job):
+        if self._thread is None:
+            # 未啟動時直接在呼叫者線程寫入
+            self._write_batch([job])
+            return
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            batch = [job]
+            # 一次取出佇列中已有的其他任務，湊成一批
+            while job is not None and len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(job)
+            stop = batch[-1] is None
+            jobs = [job for job in batch if job is not None]
+            try:
+                self._write_batch(jobs)
+            except Exception as e:
+                logging.error(f"寫入輸出文件時發生未預期的錯誤: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, jobs):
+        """寫入一批任務：先全部寫入暫存檔，批次同步後再逐一替換目標"""
+        staged = []
+        for kind, dest_path, payload in jobs:
+            if kind == "move":
+                try:
+                    apply_file_mode(payload, dest_path)
+                except OSError as e:
+                    self._fail(dest_path, payload, e)
+                    continue
+                staged.append((payload, dest_path))
+                continue
+            if kind == "remove":
+                self._commit(staged)
+                staged = []
+                try:
+                    dest_path.unlink(missing_ok=True)
+                except OSError as e:
+                    self._fail(dest_path, None, e)
+                continue
+            if kind == "copy":
+                # 複製依賴之前的寫入，先完成已暫存的部分
+                self._commit(staged)
+                staged = []
+            temp_path = None
+            try:
+                self._ensure_dir(dest_path.parent)
+                temp_path = create_temp_file(dest_path)
+                if kind == "copy":
+                    shutil.copyfile(payload, temp_path)
+                    apply_file_mode(temp_path, payload)
+                else:
+                    with open(temp_path, "w", encoding="utf-8") as f:
+                        f.write(payload)
+                    apply_file_mode(temp_path, dest_path)
+                staged.append((temp_path, dest_path))
+            except OSError as e:
+                self._fail(dest_path, temp_path, e)
+        self._commit(staged)
+
+    def _commit(self, staged):
+        if self.fsync:
+            for temp_path, dest_path in staged:
+                try:
+                    fd = os.open(temp_path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    logging.warning(f"同步暫存檔 {temp_path} 失敗: {e}")
+        directories = set()
+        for temp_path, dest_path in staged:
+            try:
+                os.replace(temp_path, dest_path)
+                directories.add(dest_path.parent)
+            except OSError as e:
+                self._fail(dest_path, temp_path, e)
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            # 同步目錄使替換本身也寫入磁碟，每個目錄每批只需一次
+            for directory in directories:
+                try:
+                    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+
+    def _ensure_dir(self, directory):
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    def _fail(self, dest_path, temp_path, error):
+        logging.error(f"寫入文件 {dest_path} 失敗: {error}")
+        self.failed.append(dest_path)
+        if temp_path is None:
+            return
+        try:
+            temp_path.unlink(missing_ok=True)
+        except OSError:
+            pass
@@ -0,0 +1,361 @@
+import datetime
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from config.config import Config, PromptConfig
+
+
+def estimate_tokens_from_size(byte_size):
+    """以文件大小粗略估算 token 數 (不讀取內容)
+
+    Args:
+        byte_size: 文件位元組數
+
+    Returns:
+        int: 估算的 token 數
+    """
+    return int(math.ceil(byte_size / Config.BYTES_PER_TOKEN))
+
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 數
+
+    Args:
+        text: 文本內容
+
+    Returns:
+        int: 估算的 token 數
+    """
+    return estimate_tokens_from_size(len(text.encode("utf-8")))
+
+
+def _parse_rate(rate):
+    """解析 NyaProxy 的速率限制字串，例如 '5/m' → (5, 'm')"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*([smhd])\s*", str(rate or ""))
+    if not match:
+        return None
+    return int(match.group(1)), match.group(2)
+
+
+def load_nyaproxy_limits(config_path="config.yaml"):
+    """從 NyaProxy 的 config.yaml 讀取金鑰數量與 Gemini 的速率限制
+
+    Args:
+        config_path: NyaProxy 設定檔路徑
+
+    Returns:
+        dict: 可能包含 key_count、requests_per_day (所有金鑰合計)、
+            requests_per_minute (每個金鑰)，讀取失敗時返回空字典
+    """
+    import yaml
+
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            nya_config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        logging.info(f"無法讀取 NyaProxy 設定 '{config_path}': {e}")
+        return {}
+
+    gemini = (nya_config.get("apis") or {}).get("gemini") or {}
+    limits = {}
+    key_variable = gemini.get("key_variable", "keys")
+    keys = (gemini.get("variables") or {}).get(key_variable)
+    if isinstance(keys, list) and keys:
+        limits["key_count"] = len(keys)
+
+    rate_limit = gemini.get("rate_limit") or {}
+    endpoint_rate = _parse_rate(rate_limit.get("endpoint_rate_limit"))
+    if endpoint_rate and endpoint_rate[1] == "d":
+        limits["requests_per_day"] = endpoint_rate[0]
+    key_rate = _parse_rate(rate_limit.get("key_rate_limit"))
+    if key_rate and key_rate[1] == "m":
+        limits["requests_per_minute"] = key_rate[0]
+    return limits
+
+
+def _reset_timezone():
+    """取得每日配額重置所在的時區"""
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(Config.QUOTA_RESET_TIMEZONE)
+    except Exception:
+        # 沒有 zoneinfo 或時區資料時以太平洋標準時間近似
+        return datetime.timezone(datetime.timedelta(hours=-8))
+
+
+class RequestLimiter:
+    """在多個工作之間共用的請求間隔限制。
+
+    任意兩次請求的開始時間至少相隔 min_interval 秒，不論來自哪個工作或線程；
+    常駐服務以此讓同時運行的工作合計不超過單一運行的請求速率。
+    """
+
+    def __init__(self, min_interval):
+        """
+        Args:
+            min_interval (float): 兩次請求之間的最小間隔 (秒)，0 表示不限制。
+        """
+        self.min_interval = max(0.0, float(min_interval or 0))
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def acquire(self, sleep=time.sleep):
+        """等待到下一個可用的請求時段
+
+        Args:
+            sleep: 等待函數，可替換為可中斷的等待。
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            sleep(start - now)
+
+
+class QuotaPlanner:
+    """依每日請求數 (RPD) 與 token 數 (TPD) 額度規劃處理流程。
+
+    處理前估算所需的請求與 token，並計算需要幾天完成；處理中每次呼叫 API 前
+    先預留額度，額度用完時等待配額窗口重置後自動繼續。已用額度與剩餘工作會
+    寫入狀態檔，程序重新啟動後可接續同一個配額窗口。
+    """
+
+    def __init__(
+        self,
+        requests_per_day,
+        tokens_per_day=0,
+        key_count=1,
+        requests_per_minute=0,
+        output_format="full",
+        state_path=None,
+    ):
+        """初始化規劃器。
+
+        Args:
+            requests_per_day (int): 每個金鑰每日請求數上限。
+            tokens_per_day (int): 每個金鑰每日 token 上限，0 表示不限制。
+            key_count (int): 可用的金鑰數量。
+            requests_per_minute (int): 每個金鑰每分鐘請求數上限，0 表示不限制。
+            output_format (str): 回應格式，用於估算輸出 token。
+            state_path (Path, optional): 狀態檔路徑，None 表示不保存。
+        """
+        self.key_count = max(1, int(key_count))
+        self.daily_requests = int(requests_per_day) * self.key_count
+        self.daily_tokens = int(tokens_per_day or 0) * self.key_count
+        self.requests_per_minute = int(requests_per_minute or 0) * self.key_count
+        self.output_ratio = Config.OUTPUT_TOKEN_RATIO.get(output_format, 1.0)
+        self.state_path = Path(state_path) if state_path else None
+        self.prompt_overhead = self._prompt_overhead(output_format)
+
+        self._lock = threading.Lock()
+        self.window_start = self._current_window_start()
+        self.requests_used = 0
+        self.tokens_used = 0
+        self.pending = []
+        self._load_state()
+
+    @classmethod
+    def from_settings(cls, settings, state_path=None):
+        """依設定建立規劃器；使用 NyaProxy 時以 config.yaml 中的金鑰與限制為預設值。
+
+        Args:
+            settings (dict): 協調器設定。
+            state_path (Path, optional): 狀態檔路徑。
+
+        Returns:
+            QuotaPlanner: 規劃器實例。
+        """
+        limits = {}
+        if settings.get("use_nyaproxy") or settings.get("nyaproxy"):
+            limits = load_nyaproxy_limits()
+
+        key_count = settings.get("keys") or limits.get("key_count", 1)
+        requests_per_day = settings.get("rpd")
+        if not requests_per_day:
+            if "requests_per_day" in limits:
+                # config.yaml 中的端點限制已是所有金鑰合計
+                requests_per_day = math.ceil(limits["requests_per_day"] / key_count)
+            else:
+                requests_per_day = Config.DEFAULT_RPD_PER_KEY
+        return cls(
+            requests_per_day=requests_per_day,
+            tokens_per_day=settings.get("tpd") or Config.DEFAULT_TPD_PER_KEY,
+            key_count=key_count,
+            requests_per_minute=settings.get("rpm")
+            or limits.get("requests_per_minute", Config.DEFAULT_RPM_PER_KEY),
+            output_format=settings.get("output_format", Config.DEFAULT_OUTPUT_FORMAT),
+            state_path=state_path,
+        )
+
+    @staticmethod
+    def _prompt_overhead(output_format):
+        """估算每次請求中代碼以外的 token (固定指令與提示詞外框)"""
+        if output_format == "diff":
+            instruction = PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION
+            prompt = PromptConfig.get_line_comments_user_prompt("")
+        else:
+            instruction = PromptConfig.SYSTEM_INSTRUCTION
+            prompt = PromptConfig.get_user_prompt("")
+        return estimate_tokens(instruction) + estimate_tokens(prompt)
+
+    def estimate_request_tokens(self, byte_size):
+        """估算處理一個文件的單次請求所需的 token (輸入 + 輸出)
+
+        Args:
+            byte_size (int): 文件位元組數。
+
+        Returns:
+            int: 估算的 token 數。
+        """
+        code_tokens = estimate_tokens_from_size(byte_size)
+        return self.prompt_overhead + code_tokens + int(code_tokens * self.output_ratio)
+
+    def plan(self, sizes):
+        """估算整批工作所需的額度與天數。
+
+        Args:
+            sizes (list): 每個需要呼叫 API 的文件的位元組數。
+
+        Returns:
+            dict: requests、input_tokens、output_tokens、tokens、
+                remaining_requests_today、remaining_tokens_today、days。
+        """
+        requests = len(sizes)
+        input_tokens = sum(
+            self.prompt_overhead + estimate_tokens_from_size(size) for size in sizes
+        )
+        output_tokens = sum(
+            int(estimate_tokens_from_size(size) * self.output_ratio) for size in sizes
+        )
+        tokens = input_tokens + output_tokens
+
+        with self._lock:
+            self._roll_window()
+            remaining_requests = max(0, self.daily_requests - self.requests_used)
+            remaining_tokens = (
+                max(0, self.daily_tokens - self.tokens_used) if self.daily_tokens else None
+            )
+
+        # 先用掉今天剩餘的額度，其餘按每日完整額度計算
+        days_by_requests = (
+            1 + math.ceil(max(0, requests - remaining_requests) / self.daily_requests)
+            if self.daily_requests
+            else 1
+        )
+        days_by_tokens = 1
+        if self.daily_tokens:
+            days_by_tokens = 1 + math.ceil(
+                max(0, tokens - remaining_tokens) / self.daily_tokens
+            )
+        return {
+            "requests": requests,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "tokens": tokens,
+            "remaining_requests_today": remaining_requests,
+            "remaining_tokens_today": remaining_tokens,
+            "days": max(days_by_requests, days_by_tokens) if requests else 0,
+        }
+
+    def reserve(self, tokens, on_exhausted=None, sleep=time.sleep):
+        """為一次請求預留額度，今日額度不足時等待到配額窗口重置。
+
+        Args:
+            tokens (int): 這次請求估算的 token 數。
+            on_exhausted: 開始等待前呼叫一次的回調，參數為需要等待的秒數。
+            sleep: 等待函數，可替換為可中斷的等待。
+        """
+        notified = False
+        while True:
+            with self._lock:
+                self._roll_window()
+                if self._fits(tokens):
+                    self.requests_used += 1
+                    self.tokens_used += tokens
+                    self._save_state()
+                    return
+                wait_seconds = self.seconds_until_reset()
+            if not notified:
+                notified = True
+                if on_exhausted:
+                    on_exhausted(wait_seconds)
+            # 分段等待，讓配額窗口一重置就能繼續
+            sleep(min(wait_seconds, 60.0) + 1.0)
+
+    def save_pending(self, relative_paths):
+        """保存尚未處理的文件列表，供重新啟動後接續。
+
+        Args:
+            relative_paths (list): 相對於來源目錄的路徑字串。
+        """
+        with self._lock:
+            self.pending = list(relative_paths)
+            self._save_state()
+
+    def seconds_until_reset(self):
+        """距離下一次配額重置的秒數"""
+        next_reset = self.window_start + datetime.timedelta(days=1)
+        now = datetime.datetime.now(next_reset.tzinfo)
+        return max(0.0, (next_reset - now).total_seconds())
+
+    def _fits(self, tokens):
+        if self.requests_used >= self.daily_requests:
+            return False
+        if not self.daily_tokens:
+            return True
+        # 單次請求超過整日額度時，只要窗口還沒用過就放行
+        return self.tokens_used + tokens <= self.daily_tokens or self.tokens_used == 0
+
+    @staticmethod
+    def _current_window_start():
+        now = datetime.datetime.now(_reset_timezone())
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _roll_window(self):
+        """配額窗口已重置時歸零已用額度"""
+        window_start = self._current_window_start()
+        if window_start > self.window_start:
+            logging.info("每日配額窗口已重置。")
+            self.window_start = window_start
+            self.requests_used = 0
+            self.tokens_used = 0
+
+    def _load_state(self):
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logging.warning(f"讀取配額狀態檔 {self.state_path} 失敗: {e}")
+            return
+        self.pending = state.get("pending", [])
+        if state.get("window_start") == self.window_start.isoformat():
+            self.requests_used = int(state.get("requests_used", 0))
+            self.tokens_used = int(state.get("tokens_used", 0))
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {
+            "window_start": self.window_start.isoformat(),
+            "requests_used": self.requests_used,
+            "tokens_used": self.tokens_used,
+            "pending": self.pending,
+        }
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.state_path.with_name(f".{self.state_path.name}.tmp")
+            temp_path.write_text(
+                json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logging.warning(f"保存配額狀態檔 {self.state_path} 失敗: {e}")
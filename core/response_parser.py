@@ -0,0 +1,188 @@
+import json
+import re
+
+from core.comment_splicer import find_unsafe_lines, get_comment_syntax
+from core.stream_decoder import StreamingCodeDecoder
+
+# 匹配 ``` 或 ```json / ```python 等圍欄的開頭行
+_FENCE_OPEN_PATTERN = re.compile(r"^\s*```[\w+-]*[ \t]*\r?\n")
+
+
+def _strip_fence(text):
+    """移除最外層的 ``` 圍欄，缺少結尾圍欄 (輸出被截斷) 時保留其餘內容"""
+    match = _FENCE_OPEN_PATTERN.match(text)
+    if not match:
+        return text
+    body = text[match.end() :]
+    closing = body.rfind("```")
+    if closing != -1 and not body[closing + 3 :].strip():
+        body = body[:closing]
+    return body
+
+
+def _unescape_literal_newlines(code):
+    """處理被二次轉義的代碼 (整份代碼只有一行，卻包含字面上的 \\n)"""
+    if "\n" in code or "\\n" not in code:
+        return code
+    try:
+        return json.loads(f'"{code}"', strict=False)
+    except json.JSONDecodeError:
+        return code.replace("\\n", "\n").replace("\\t", "\t")
+
+
+def extract_code_from_response(response_content):
+    """從模型回應中取出 "code" 字段的代碼
+
+    依序嘗試：完整 JSON、回應中內嵌的 JSON 物件、被截斷的 JSON
+    (逐字解碼到中斷處)，最後退回圍欄內的純文本。
+    取出的代碼應再經過 validate_commented_code 檢查。
+
+    Args:
+        response_content: 模型返回的原始文本
+
+    Returns:
+        str: 代碼，完全無法取得時返回 None
+    """
+    if not response_content or not response_content.strip():
+        return None
+
+    body = _strip_fence(response_content.strip())
+
+    # 1. 整段就是 JSON
+    try:
+        parsed = json.loads(body, strict=False)
+        if isinstance(parsed, dict) and isinstance(parsed.get("code"), str):
+            return _unescape_literal_newlines(parsed["code"])
+    except json.JSONDecodeError:
+        pass
+
+    # 2. JSON 物件前後夾雜其他文字
+    decoder = json.JSONDecoder(strict=False)
+    start = body.find("{")
+    while start != -1:
+        try:
+            parsed, _ = decoder.raw_decode(body, start)
+            if isinstance(parsed, dict) and isinstance(parsed.get("code"), str):
+                return _unescape_literal_newlines(parsed["code"])
+        except json.JSONDecodeError:
+            pass
+        start = body.find("{", start + 1)
+
+    # 3. 被截斷的 JSON：盡可能解碼 "code" 字串
+    partial = StreamingCodeDecoder()
+    code = partial.feed(body)
+    if partial.started:
+        return _unescape_literal_newlines(code)
+
+    # 4. 模型沒有使用 JSON，直接返回圍欄內的代碼
+    return body
+
+
+class CommentedCodeValidator:
+    """逐行檢查帶註釋的代碼是否完整保留了每一行原始代碼。
+
+    規則：原始代碼的每個非空行必須依序出現在輸出中，輸出行為該行原文
+    (去除行尾空白)，之後只能有空白加上行尾註釋；位於多行字串中或以反斜線
+    續行的行 (見 find_unsafe_lines) 必須完全相同，且其後不能插入註釋行。
+    輸出中額外的空行與純註釋行會被略過。
+    可以透過 feed() 逐段輸入 (串流模式)，也可以一次輸入完整結果。
+    """
+
+    def __init__(self, original_code, file_name):
+        """
+        Args:
+            original_code: 原始代碼
+            file_name: 文件名，用於判斷註釋符號
+        """
+        unsafe = find_unsafe_lines(original_code, file_name)
+        self._expected = [
+            (number, line.rstrip(), number in unsafe)
+            for number, line in enumerate(original_code.splitlines(), start=1)
+            if line.strip()
+        ]
+        self._prefix = get_comment_syntax(file_name)[0]
+        # 原文之後只允許 空白 + 註釋符號 開頭的行尾註釋
+        self._trailing_comment = re.compile(rf"\s+{re.escape(self._prefix)}")
+        self._index = 0
+        self._partial_line = ""
+        self.problem = None
+
+    def feed(self, text):
+        """輸入一段輸出文本
+
+        Args:
+            text: 帶註釋代碼的片段
+        """
+        if self.problem is not None:
+            return
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._check_line(line)
+            if self.problem is not None:
+                return
+
+    def finish(self):
+        """結束輸入並返回檢查結果
+
+        Returns:
+            str: 問題描述，沒有問題時返回 None
+        """
+        if self.problem is None and self._partial_line:
+            self._check_line(self._partial_line)
+            self._partial_line = ""
+        if self.problem is None and self._index < len(self._expected):
+            number, line, _ = self._expected[self._index]
+            missing = len(self._expected) - self._index
+            self.problem = (
+                f"輸出缺少原始代碼第 {number} 行起的 {missing} 個非空行: {line.strip()[:60]}"
+            )
+        return self.problem
+
+    def _check_line(self, line):
+        line = line.rstrip("\r")
+        stripped = line.strip()
+        if not stripped:
+            return
+        if self._index < len(self._expected):
+            number, expected, exact = self._expected[self._index]
+            if self._matches(line.rstrip(), expected, exact):
+                self._index += 1
+                return
+        else:
+            number, expected = None, None
+        # 模型額外添加的純註釋行可以接受，但不能插在字串內或續行之後
+        after_exact = self._index > 0 and self._expected[self._index - 1][2]
+        if stripped.startswith(self._prefix) and not after_exact:
+            return
+        if expected is None:
+            self.problem = f"輸出包含原始代碼以外的多餘內容: {stripped[:60]}"
+        else:
+            self.problem = (
+                f"原始代碼第 {number} 行被修改或遺漏，應為: {expected.strip()[:60]}"
+                f"，實際為: {stripped[:60]}"
+            )
+
+    def _matches(self, line, expected, exact):
+        """輸出行是否為原文，或原文加上行尾註釋"""
+        if line == expected:
+            return True
+        if exact or not line.startswith(expected):
+            return False
+        return bool(self._trailing_comment.match(line, len(expected)))
+
+
+def validate_commented_code(original_code, commented_code, file_name):
+    """檢查帶註釋的代碼是否保留了所有原始代碼行
+
+    Args:
+        original_code: 原始代碼
+        commented_code: 帶註釋的代碼
+        file_name: 文件名，用於判斷註釋符號
+
+    Returns:
+        str: 問題描述，沒有問題時返回 None
+    """
+    validator = CommentedCodeValidator(original_code, file_name)
+    validator.feed(commented_code)
+    return validator.finish()
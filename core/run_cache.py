@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from core.output_writer import apply_file_mode, create_temp_file
+
+
+class RunCache:
+    """保存每個文件上一次處理時的來源代碼與註釋結果，供增量處理使用。
+
+    快取目錄結構：
+        <cache_dir>/entries/<相對路徑>.json
+            {"source": 上次處理時的來源代碼, "output": 上次產生的帶註釋代碼}
+
+    來源與結果保存在同一個檔案中並原子性地替換，中途中斷時不會出現來源與結果
+    不對應的快取 (否則未變更的判斷會複用錯誤的結果)。
+    """
+
+    def __init__(self, cache_dir, src_root, writer=None):
+        """初始化快取。
+
+        Args:
+            cache_dir (Path): 快取根目錄。
+            src_root (Path): 來源目錄，用於計算相對路徑。
+            writer (OutputWriter, optional): 背景寫入器，提供時快取也交由寫入線程保存。
+        """
+        self.cache_dir = Path(cache_dir)
+        self.src_root = Path(src_root)
+        self.writer = writer
+
+    @staticmethod
+    def default_dir(base_dir, src_root):
+        """依來源目錄的絕對路徑產生獨立的快取子目錄，避免不同專案互相覆蓋。
+
+        Args:
+            base_dir (str | Path): 快取根目錄。
+            src_root (str | Path): 來源目錄。
+
+        Returns:
+            Path: 此來源目錄專用的快取目錄。
+        """
+        resolved = str(Path(src_root).resolve())
+        key = hashlib.sha1(resolved.encode("utf-8")).hexdigest()[:12]
+        return Path(base_dir) / f"{Path(resolved).name or 'root'}-{key}"
+
+    def _path(self, src_path):
+        relative_path = Path(src_path).relative_to(self.src_root)
+        return self.cache_dir / "entries" / f"{relative_path}.json"
+
+    def lookup(self, src_path):
+        """取得文件上一次的來源代碼與註釋結果。
+
+        Args:
+            src_path (Path): 來源文件路徑。
+
+        Returns:
+            tuple | None: (舊來源代碼, 舊註釋結果)，沒有快取時返回 None。
+        """
+        path = self._path(src_path)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            return entry["source"], entry["output"]
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"讀取 {src_path} 的增量快取失敗: {e}")
+            return None
+
+    def store(self, src_path, source, output):
+        """保存文件本次的來源代碼與註釋結果。
+
+        Args:
+            src_path (Path): 來源文件路徑。
+            source (str): 本次的來源代碼。
+            output (str): 本次產生的帶註釋代碼。
+        """
+        path = self._path(src_path)
+        text = json.dumps({"source": source, "output": output}, ensure_ascii=False)
+        if self.writer is not None:
+            self.writer.write(path, text)
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = create_temp_file(path)
+            temp_path.write_text(text, encoding="utf-8")
+            apply_file_mode(temp_path, path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"保存 {src_path} 的增量快取失敗: {e}")
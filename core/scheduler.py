@@ -0,0 +1,113 @@
+import fnmatch
+import logging
+from pathlib import Path
+
+
+def _file_size(path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _file_mtime(path):
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class WorkScheduler:
+    """決定待處理文件的處理順序。
+
+    每個策略是一個 (scheduler, group) -> 排序鍵 的函數，group 為內容相同的
+    (來源路徑, 目標路徑) 列表。可透過 register_policy 新增自訂策略。
+    """
+
+    # 策略名稱 → (排序鍵函數, 說明)；排序鍵為 None 表示保持掃描順序
+    POLICIES = {}
+
+    def __init__(self, policy="scan", priority_paths=None, src_dir=None):
+        """初始化排程器。
+
+        Args:
+            policy (str): 策略名稱，見 WorkScheduler.POLICIES。
+            priority_paths (list, optional): "listed" 策略使用的優先路徑或萬用字元模式，
+                相對於來源目錄，依列出順序處理。
+            src_dir (Path, optional): 來源目錄，用於計算相對路徑。
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"未知的排程策略: {policy}，可用: {', '.join(self.POLICIES)}"
+            )
+        self.policy = policy
+        self.priority_paths = [
+            p.strip().strip("/") for p in priority_paths or [] if p.strip()
+        ]
+        self.src_dir = Path(src_dir) if src_dir else None
+
+    @classmethod
+    def register_policy(cls, name, key_func, description=""):
+        """註冊排程策略。
+
+        Args:
+            name (str): 策略名稱。
+            key_func: 接收 (scheduler, group) 並返回排序鍵的函數，None 表示保持原順序。
+            description (str): 策略說明。
+        """
+        cls.POLICIES[name] = (key_func, description)
+
+    def order(self, groups):
+        """依策略排序。排序是穩定的，鍵相同時保持掃描順序。
+
+        Args:
+            groups (list): 內容相同的 (來源路徑, 目標路徑) 列表所組成的列表。
+
+        Returns:
+            list: 排序後的列表。
+        """
+        key_func, description = self.POLICIES[self.policy]
+        if key_func is None:
+            return list(groups)
+        logging.info(f"使用排程策略: {self.policy} ({description})")
+        return sorted(groups, key=lambda group: key_func(self, group))
+
+    def _listed_rank(self, group):
+        """返回 group 中任一路徑匹配的第一個優先路徑的序號，未匹配則排在最後。"""
+        for src_path, _ in group:
+            relative_path = (
+                src_path.relative_to(self.src_dir).as_posix()
+                if self.src_dir
+                else src_path.as_posix()
+            )
+            for rank, pattern in enumerate(self.priority_paths):
+                if (
+                    relative_path == pattern
+                    or relative_path.startswith(pattern + "/")
+                    or fnmatch.fnmatch(relative_path, pattern)
+                ):
+                    return rank
+        return len(self.priority_paths)
+
+
+WorkScheduler.register_policy("scan", None, "掃描順序")
+WorkScheduler.register_policy(
+    "smallest",
+    lambda scheduler, group: _file_size(group[0][0]),
+    "最小的文件優先，盡快看到進度",
+)
+WorkScheduler.register_policy(
+    "longest",
+    lambda scheduler, group: -_file_size(group[0][0]),
+    "最大的文件優先，並行時縮短尾端等待",
+)
+WorkScheduler.register_policy(
+    "recent",
+    lambda scheduler, group: -max(_file_mtime(src) for src, _ in group),
+    "最近修改的文件優先",
+)
+WorkScheduler.register_policy(
+    "listed",
+    lambda scheduler, group: scheduler._listed_rank(group),
+    "指定的路徑優先，其餘保持掃描順序",
+)
@@ -0,0 +1,105 @@
+import re
+
+# 匹配 JSON 中 "code" 字段字串值的開頭
+_CODE_KEY_PATTERN = re.compile(r'"code"\s*:\s*"')
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class StreamingCodeDecoder:
+    """從串流的 {"code": "..."} 回應中逐段解碼出代碼內容。
+
+    每次 feed() 傳入新收到的文本片段，返回這段文本中已能確定的代碼。
+    不完整的轉義序列會保留到下一個片段再解碼，因此不需要緩存整份回應。
+    """
+
+    def __init__(self):
+        self.started = False  # 是否已找到 "code" 字段
+        self.finished = False  # 是否已讀到字串結尾的引號
+        self._pending = ""  # 尚未處理的文本
+
+    def feed(self, chunk):
+        """傳入新的文本片段
+
+        Args:
+            chunk: 新收到的回應文本
+
+        Returns:
+            str: 本次可以輸出的代碼內容
+        """
+        if self.finished or not chunk:
+            return ""
+        self._pending += chunk
+
+        if not self.started:
+            match = _CODE_KEY_PATTERN.search(self._pending)
+            if not match:
+                # 只保留可能是 "code" 開頭被截斷的尾部，避免緩存整個前綴
+                self._pending = self._pending[-32:]
+                return ""
+            self.started = True
+            self._pending = self._pending[match.end() :]
+
+        return self._decode_pending()
+
+    def _decode_pending(self):
+        """解碼 _pending 中可確定的部分"""
+        text = self._pending
+        output = []
+        i = 0
+        length = len(text)
+        while i < length:
+            char = text[i]
+            if char == '"':
+                self.finished = True
+                i = length
+                break
+            if char != "\\":
+                # 快速複製到下一個特殊字元為止
+                next_special = i + 1
+                while next_special < length and text[next_special] not in '"\\':
+                    next_special += 1
+                output.append(text[i:next_special])
+                i = next_special
+                continue
+
+            # 處理轉義序列
+            if i + 1 >= length:
+                break
+            escape = text[i + 1]
+            if escape in _SIMPLE_ESCAPES:
+                output.append(_SIMPLE_ESCAPES[escape])
+                i += 2
+                continue
+            if escape == "u":
+                if i + 6 > length:
+                    break
+                code_point = int(text[i + 2 : i + 6], 16)
+                if 0xD800 <= code_point <= 0xDBFF:
+                    # 代理對需要等待低位部分
+                    if i + 12 > length:
+                        break
+                    if text[i + 6 : i + 8] == "\\u":
+                        low = int(text[i + 8 : i + 12], 16)
+                        code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00)
+                        output.append(chr(code_point))
+                        i += 12
+                        continue
+                output.append(chr(code_point))
+                i += 6
+                continue
+            # 未知的轉義，原樣保留
+            output.append(escape)
+            i += 2
+
+        self._pending = "" if self.finished else text[i:]
+        return "".join(output)
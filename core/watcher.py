@@ -0,0 +1,255 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from config.config import Config
+
+# inotify 事件旗標，見 <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """以 Linux inotify 監看目錄，只在有事件時喚醒"""
+
+    def __init__(self, root, recursive, is_excluded):
+        libc_name = ctypes.util.find_library("c")
+        if sys.platform != "linux" or not libc_name:
+            raise OSError("此平台不支援 inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self.recursive = recursive
+        self.is_excluded = is_excluded
+        self._watches = {}
+        self._add_tree(Path(root), root=True)
+
+    def _add_tree(self, directory, root=False):
+        """監看目錄 (遞迴模式下包括所有未被排除的子目錄)，返回其中已存在的文件"""
+        if not root and (not self.recursive or self.is_excluded(directory)):
+            return []
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), _WATCH_MASK
+        )
+        if wd < 0:
+            # 目錄可能已被刪除，或超過 max_user_watches 限制
+            logging.warning(
+                f"無法監看目錄 {directory}: {os.strerror(ctypes.get_errno())}"
+            )
+            return []
+        self._watches[wd] = directory
+        files = []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return files
+        for entry in entries:
+            path = Path(entry.path)
+            if entry.is_dir(follow_symlinks=False):
+                files.extend(self._add_tree(path))
+            else:
+                files.append(path)
+        return files
+
+    def wait(self, timeout):
+        """等待事件，返回變更的文件路徑集合；逾時返回空集合"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & _IN_Q_OVERFLOW:
+                    raise OverflowError("inotify 事件佇列溢出")
+                directory = self._watches.get(wd)
+                if directory is None or not name:
+                    if mask & _IN_DELETE_SELF:
+                        self._watches.pop(wd, None)
+                    continue
+                path = directory / os.fsdecode(name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        # 新目錄中可能已有文件，逐一視為變更
+                        changed.update(self._add_tree(path))
+                    continue
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingBackend:
+    """定期比對文件的修改時間與大小，適用於不支援 inotify 的平台或網路磁碟"""
+
+    def __init__(self, root, recursive, is_excluded, interval):
+        self.root = Path(root)
+        self.recursive = recursive
+        self.is_excluded = is_excluded
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+        self._last_snapshot = time.monotonic()
+
+    def _take_snapshot(self):
+        snapshot = {}
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                path = Path(entry.path)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive and not self.is_excluded(path):
+                            pending.append(path)
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        remaining = self._last_snapshot + self.interval - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, remaining))
+        snapshot = self._take_snapshot()
+        self._last_snapshot = time.monotonic()
+        changed = {
+            path
+            for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class FileWatcher:
+    """監看來源目錄的文件變更，並將短時間內的連續變更合併為一批。
+
+    優先使用 inotify，不支援時改為定期比對修改時間。
+    """
+
+    def __init__(
+        self,
+        src_dir,
+        recursive=True,
+        is_excluded=None,
+        debounce=Config.WATCH_DEBOUNCE_SECONDS,
+        poll_interval=Config.WATCH_POLL_INTERVAL,
+        force_polling=False,
+    ):
+        """初始化監看器。
+
+        Args:
+            src_dir (Path): 來源目錄。
+            recursive (bool): 是否監看子目錄。
+            is_excluded (callable, optional): 判斷目錄是否排除的函數，被排除的目錄不監看。
+            debounce (float): 最後一次變更後等待多少秒沒有新變更才產生一批。
+            poll_interval (float): 輪詢模式的比對間隔 (秒)。
+            force_polling (bool): 不使用 inotify，一律以輪詢方式監看。
+        """
+        self.src_dir = Path(src_dir)
+        self.recursive = recursive
+        self.is_excluded = is_excluded or (lambda path: False)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        if not force_polling:
+            try:
+                self.backend = _InotifyBackend(
+                    self.src_dir, recursive, self.is_excluded
+                )
+                self.mode = "inotify"
+            except (OSError, AttributeError) as e:
+                logging.info(f"無法使用 inotify ({e})，改為輪詢監看。")
+        if self.backend is None:
+            self._use_polling()
+
+    def _use_polling(self):
+        self.backend = _PollingBackend(
+            self.src_dir, self.recursive, self.is_excluded, self.poll_interval
+        )
+        self.mode = "polling"
+
+    def batches(self, cancel_token):
+        """持續產生變更的文件路徑集合，直到 cancel_token 被取消。
+
+        連續的儲存 (例如編輯器先寫暫存檔再改名) 在 debounce 秒內會合併為一批。
+
+        Yields:
+            set: 這一批中變更 (新增、修改或刪除) 的文件路徑。
+
+        Raises:
+            OperationCancelledError: 被取消。
+        """
+        pending = set()
+        last_change = None
+        try:
+            while True:
+                cancel_token.check()
+                if pending:
+                    # 已有變更時只等到去抖動時間結束
+                    timeout = max(0.0, last_change + self.debounce - time.monotonic())
+                else:
+                    timeout = cancel_token.POLL_INTERVAL * 5
+                try:
+                    changed = self.backend.wait(timeout)
+                except OverflowError:
+                    logging.warning("inotify 事件過多，改為輪詢監看。")
+                    self.backend.close()
+                    self._use_polling()
+                    continue
+                if changed:
+                    pending.update(changed)
+                    last_change = time.monotonic()
+                elif pending and time.monotonic() - last_change >= self.debounce:
+                    batch, pending = pending, set()
+                    yield batch
+        finally:
+            self.backend.close()
@@ -0,0 +1,262 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config.config import Config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    relative_path TEXT NOT NULL UNIQUE,
+    content_hash TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+
+class Job:
+    """從佇列租用的一個工作"""
+
+    __slots__ = ("id", "relative_path", "content_hash", "attempts")
+
+    def __init__(self, id, relative_path, content_hash, attempts):
+        self.id = id
+        self.relative_path = relative_path
+        self.content_hash = content_hash
+        self.attempts = attempts
+
+
+class WorkQueue:
+    """以 SQLite 保存的工作佇列，供協調者與多個工作進程共用。
+
+    工作的狀態為 pending → leased → done / failed。租用的工作需要定期續約
+    (heartbeat)，租約過期的工作 (工作進程崩潰或斷線) 會在下一次租用時重新
+    排入佇列；重試超過 max_attempts 次的工作標記為 failed。
+    資料庫必須位於協調者所在機器的本機檔案系統，工作進程也在同一台機器上
+    運行：SQLite 的檔案鎖在 NFS、SMB 等網路檔案系統上不可靠，多台機器經由
+    網路磁碟共用同一個資料庫可能導致工作被重複租用或資料庫損毀。
+    """
+
+    def __init__(
+        self,
+        db_path,
+        lease_seconds=Config.QUEUE_LEASE_SECONDS,
+        max_attempts=Config.QUEUE_MAX_ATTEMPTS,
+    ):
+        """初始化佇列並建立資料表。
+
+        Args:
+            db_path (str | Path): SQLite 資料庫路徑。
+            lease_seconds (float): 租約長度 (秒)，超過未續約即視為工作進程已失效。
+            max_attempts (int): 每個工作最多嘗試的次數。
+        """
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=Config.QUEUE_BUSY_TIMEOUT)
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """以 BEGIN IMMEDIATE 開始寫入交易，多個進程同時租用也不會取得同一個工作"""
+        conn = sqlite3.connect(
+            self.db_path, timeout=Config.QUEUE_BUSY_TIMEOUT, isolation_level=None
+        )
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, jobs):
+        """以本次掃描的結果取代佇列中的所有工作。
+
+        協調者每次運行都會重新建立輸出目錄，上一輪的工作 (包括已完成的) 都需要
+        重新處理；搭配增量快取時未變更的文件不會再次呼叫 API。
+
+        Args:
+            jobs (iterable): (相對路徑, 內容雜湊) 列表。
+
+        Returns:
+            int: 需要處理 (pending) 的工作數。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs")
+            conn.executemany(
+                "INSERT INTO jobs (relative_path, content_hash, updated) VALUES (?, ?, ?)",
+                ((relative_path, content_hash, now) for relative_path, content_hash in jobs),
+            )
+            (pending,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'pending'"
+            ).fetchone()
+        return pending
+
+    def lease(self, worker_id):
+        """租用下一個待處理的工作，先把租約過期的工作重新排入佇列。
+
+        Args:
+            worker_id (str): 工作進程識別碼。
+
+        Returns:
+            Job | None: 租用的工作，沒有待處理的工作時返回 None。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT id, relative_path, content_hash, attempts FROM jobs "
+                "WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, row[0]),
+            )
+        return Job(row[0], row[1], row[2], row[3] + 1)
+
+    def heartbeat(self, job, worker_id):
+        """延長租約。
+
+        Returns:
+            bool: 仍持有租約時返回 True；租約已過期並被其他進程取得時返回 False。
+        """
+        now = time.time()
+        return self._update_owned(
+            job,
+            worker_id,
+            "lease_expires = ?, updated = ?",
+            (now + self.lease_seconds, now),
+        )
+
+    def complete(self, job, worker_id):
+        """標記工作完成，返回是否仍持有租約"""
+        return self._update_owned(
+            job,
+            worker_id,
+            "state = 'done', worker = ?, lease_expires = NULL, error = NULL, updated = ?",
+            (worker_id, time.time()),
+        )
+
+    def fail(self, job, worker_id, error):
+        """回報工作失敗：未超過重試次數時重新排入佇列，否則標記為 failed"""
+        state = "failed" if job.attempts >= self.max_attempts else "pending"
+        return self._update_owned(
+            job,
+            worker_id,
+            "state = ?, worker = NULL, lease_expires = NULL, error = ?, updated = ?",
+            (state, str(error), time.time()),
+        )
+
+    def release(self, job, worker_id):
+        """放棄租用 (例如工作進程被取消)，工作重新排入佇列且不計入嘗試次數"""
+        return self._update_owned(
+            job,
+            worker_id,
+            "state = 'pending', worker = NULL, lease_expires = NULL, "
+            "attempts = attempts - 1, updated = ?",
+            (time.time(),),
+        )
+
+    def find_done(self, content_hash, suffix, exclude_id=None):
+        """尋找內容相同且已完成的工作，返回其相對路徑，找不到時返回 None"""
+        if not content_hash:
+            return None
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, relative_path FROM jobs "
+                "WHERE state = 'done' AND content_hash = ?",
+                (content_hash,),
+            ).fetchall()
+        for job_id, relative_path in rows:
+            if job_id != exclude_id and Path(relative_path).suffix.lower() == suffix:
+                return relative_path
+        return None
+
+    def counts(self):
+        """各狀態的工作數，例如 {"pending": 3, "leased": 1, "done": 10}"""
+        with self._transaction() as conn:
+            self._requeue_expired(conn, time.time())
+            return dict(
+                conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            )
+
+    def failed_jobs(self):
+        """已放棄的工作：(相對路徑, 錯誤訊息) 列表"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "SELECT relative_path, error FROM jobs WHERE state = 'failed' ORDER BY id"
+            ).fetchall()
+
+    def _update_owned(self, job, worker_id, assignments, params):
+        """只在此工作進程仍持有租約時更新工作"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} "
+                "WHERE id = ? AND state = 'leased' AND worker = ?",
+                (*params, job.id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def _requeue_expired(self, conn, now):
+        """租約過期的工作重新排入佇列，超過重試次數的標記為 failed"""
+        conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = '租約過期', worker = NULL, lease_expires = NULL, updated = ? "
+            "WHERE state = 'leased' AND lease_expires < ?",
+            (self.max_attempts, now, now),
+        )
+
+
+class LeaseKeeper:
+    """處理工作期間在背景線程中定期續約"""
+
+    def __init__(self, queue, job, worker_id, interval=None):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        # 續約間隔最多為租約長度的三分之一，偶爾續約失敗也不會立即過期
+        self.interval = interval or min(
+            Config.QUEUE_HEARTBEAT_SECONDS, queue.lease_seconds / 3
+        )
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.job, self.worker_id):
+                    self.lost = True
+                    return
+            except sqlite3.Error:
+                # 資料庫暫時無法存取時下一次再試，租約仍可能在過期前續約成功
+                continue
@@ -8,3 +8,38 @@ class ConfigFormatError(Exception):
     """設定檔格式不符合預期。"""
 
     pass
+
+
+class StreamStalledError(Exception):
+    """串流回應在設定時間內沒有收到新的資料。"""
+
+    pass
+
+
+class ResponseFormatError(Exception):
+    """模型回應不符合預期的格式。"""
+
+    pass
+
+
+class GitCommandError(Exception):
+    """執行 git 命令失敗，例如來源目錄不是 git 儲存庫。"""
+
+    pass
+
+
+class OperationCancelledError(Exception):
+    """處理已被使用者取消。"""
+
+    pass
+
+
+class BatchJobError(Exception):
+    """批次工作的 API 請求失敗，或回應內容不符合預期。
+
+    transient 為 True 表示暫時性錯誤 (連線失敗、HTTP 429 或 5xx)，可以稍後重試。
+    """
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
@@ -7,23 +7,49 @@ UI組件模塊
 """
 
 import os
+import time
 import tkinter as tk
+from collections import deque
 from tkinter import ttk, messagebox, filedialog
 import threading
 import queue
 import webbrowser
 
+from config.config import Config
+
 
 class LogPanel:
-    """日誌面板類"""
+    """日誌面板類
 
-    def __init__(self, parent):
+    畫面上只保留最近 MAX_LINES 行，新消息先放入緩衝區，每個 UI 週期合併插入一次；
+    完整的歷史記錄只寫入磁碟上的日誌檔。
+    """
+
+    # 畫面上保留的最大行數
+    MAX_LINES = 2000
+    # 合併插入的間隔 (毫秒)
+    FLUSH_INTERVAL_MS = 100
+    # 顯示等級選項 → 顯示的最低等級
+    LEVEL_OPTIONS = {"全部": 0, "警告以上": 1, "僅錯誤": 2}
+    LEVEL_RANKS = {"INFO": 0, "WARNING": 1, "ERROR": 2}
+
+    def __init__(self, parent, history_path=Config.GUI_LOG_HISTORY_FILE):
         """初始化日誌面板
 
         Args:
             parent: 父窗口
+            history_path: 完整日誌歷史的保存路徑，None 表示不保存
         """
         self.parent = parent
+        self.history_path = history_path
+        self._history_file = None
+        # 最近的 (等級, 消息)，用於切換顯示等級時重建畫面
+        self._lines = deque(maxlen=self.MAX_LINES)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+        self._min_rank = 0
+
         self.frame = ttk.LabelFrame(parent, text="日誌")
         self.frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
@@ -49,31 +75,113 @@ class LogPanel:
         self.btn_frame = ttk.Frame(self.frame)
         self.btn_frame.pack(fill=tk.X, padx=5, pady=5)
 
+        # 添加顯示等級過濾
+        ttk.Label(self.btn_frame, text="顯示:").pack(side=tk.LEFT, padx=5)
+        self.level_combobox = ttk.Combobox(
+            self.btn_frame,
+            values=list(self.LEVEL_OPTIONS),
+            state="readonly",
+            width=10,
+        )
+        self.level_combobox.set("全部")
+        self.level_combobox.pack(side=tk.LEFT)
+        self.level_combobox.bind("<<ComboboxSelected>>", self._on_level_changed)
+
         # 添加清除按鈕
         self.clear_btn = ttk.Button(self.btn_frame, text="清除日誌", command=self.clear)
         self.clear_btn.pack(side=tk.RIGHT, padx=5)
 
-    def add_log(self, message):
-        """添加日誌消息
+    def add_log(self, message, level="INFO"):
+        """添加日誌消息，消息會在下一個 UI 週期合併插入
+
+        需在 Tk 主線程中調用 (內部使用 after 排程)；工作線程的日誌應放入
+        MainWindow.queue，由主線程取出後再調用。
 
         Args:
             message: 日誌消息
+            level: 日誌等級 ("INFO"、"WARNING" 或 "ERROR")
         """
-        # 確保在主線程中執行
-        if threading.current_thread() is threading.main_thread():
-            self._add_log_internal(message)
-        else:
-            self.parent.after(0, lambda: self._add_log_internal(message))
+        with self._pending_lock:
+            self._pending.append((level, message))
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self.parent.after(self.FLUSH_INTERVAL_MS, self._flush)
+
+    def _flush(self):
+        """將緩衝區中的消息一次插入文本框（在主線程中調用）"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            self._flush_scheduled = False
+        if not pending:
+            return
 
-    def _add_log_internal(self, message):
-        """內部添加日誌消息（在主線程中調用）
+        self._write_history(pending)
+        self._lines.extend(pending)
+        if len(pending) >= self.MAX_LINES:
+            # 一次收到的消息超過保留行數時直接重建，不必插入後再刪除
+            self._rebuild()
+            return
 
-        Args:
-            message: 日誌消息
-        """
-        self.log_text.insert(tk.END, message + "\n")
+        visible = [message for level, message in pending if self._is_visible(level)]
+        if not visible:
+            return
+        # 使用者往上捲動查看時不自動捲到底部
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        self.log_text.insert(tk.END, "\n".join(visible) + "\n")
+        self._trim()
+        if at_bottom:
+            self.log_text.see(tk.END)
+
+    def _trim(self):
+        """刪除超過保留行數的最舊內容"""
+        line_count = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if line_count > self.MAX_LINES:
+            self.log_text.delete("1.0", f"{line_count - self.MAX_LINES + 1}.0")
+
+    def _rebuild(self):
+        """依目前的顯示等級重新填入保留的消息"""
+        self.log_text.delete(1.0, tk.END)
+        visible = [message for level, message in self._lines if self._is_visible(level)]
+        if visible:
+            self.log_text.insert(tk.END, "\n".join(visible) + "\n")
+            self._trim()
         self.log_text.see(tk.END)
 
+    def _is_visible(self, level):
+        return self.LEVEL_RANKS.get(level, 0) >= self._min_rank
+
+    def _on_level_changed(self, event=None):
+        self._min_rank = self.LEVEL_OPTIONS.get(self.level_combobox.get(), 0)
+        self._rebuild()
+
+    def _write_history(self, entries):
+        """將消息附加到完整歷史日誌檔"""
+        if not self.history_path:
+            return
+        try:
+            if self._history_file is None:
+                self._history_file = open(self.history_path, "a", encoding="utf-8")
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._history_file.write(
+                "".join(
+                    f"{timestamp} - {level} - {message}\n" for level, message in entries
+                )
+            )
+            self._history_file.flush()
+        except OSError as e:
+            print(f"[ERROR] 寫入日誌歷史 {self.history_path} 失敗: {e}")
+            self.history_path = None
+
+    def close(self):
+        """寫入尚未插入的消息並關閉歷史日誌檔"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        self._write_history(pending)
+        if self._history_file is not None:
+            self._history_file.close()
+            self._history_file = None
+
     def clear(self):
         """清除日誌"""
         # 確保在主線程中執行
@@ -83,7 +191,8 @@ class LogPanel:
             self.parent.after(0, self._clear_internal)
 
     def _clear_internal(self):
-        """內部清除日誌（在主線程中調用）"""
+        """內部清除日誌（在主線程中調用），歷史日誌檔不受影響"""
+        self._lines.clear()
         self.log_text.delete(1.0, tk.END)
 
 
@@ -189,6 +298,15 @@ class StatusBar:
 class SettingsPanel:
     """設置面板類"""
 
+    # 處理順序策略 → 顯示名稱
+    PRIORITY_OPTIONS = {
+        "scan": "掃描順序",
+        "smallest": "小文件優先",
+        "recent": "最近修改優先",
+        "listed": "指定路徑優先",
+        "longest": "大文件優先",
+    }
+
     def __init__(
         self, parent, on_browse_folder, on_browse_output, initial_api_key=None
     ):  # 新增 initial_api_key
@@ -312,6 +430,36 @@ class SettingsPanel:
 
         ttk.Label(self.delay_frame, text="(避免API限制)").pack(side=tk.LEFT, padx=5)
 
+        # 處理順序設置
+        ttk.Label(self.grid, text="處理順序:").grid(
+            row=7, column=0, sticky=tk.W, padx=5, pady=5
+        )
+
+        self.priority_frame = ttk.Frame(self.grid)
+        self.priority_frame.grid(row=7, column=1, sticky=tk.EW, padx=5, pady=5)
+
+        self.priority_var = tk.StringVar(value=self.PRIORITY_OPTIONS["scan"])
+        self.priority_combo = ttk.Combobox(
+            self.priority_frame, textvariable=self.priority_var, state="readonly"
+        )
+        self.priority_combo["values"] = list(self.PRIORITY_OPTIONS.values())
+        self.priority_combo.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # 優先路徑設置 ("指定路徑優先" 策略使用)
+        ttk.Label(self.grid, text="優先路徑:").grid(
+            row=8, column=0, sticky=tk.W, padx=5, pady=5
+        )
+
+        self.priority_paths_frame = ttk.Frame(self.grid)
+        self.priority_paths_frame.grid(row=8, column=1, sticky=tk.EW, padx=5, pady=5)
+
+        self.priority_paths_entry = ttk.Entry(self.priority_paths_frame)
+        self.priority_paths_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        ttk.Label(self.priority_paths_frame, text="(例如: src/core,*.py)").pack(
+            side=tk.RIGHT, padx=5
+        )
+
         # 設置列的權重
         self.grid.columnconfigure(1, weight=1)
 
@@ -330,6 +478,15 @@ class SettingsPanel:
             "delay": self.delay_var.get(),
             "nyaproxy": self.nyaproxy_var.get(),
             "api_key": self.api_key,  # 新增 api_key
+            "priority": next(
+                (
+                    key
+                    for key, label in self.PRIORITY_OPTIONS.items()
+                    if label == self.priority_var.get()
+                ),
+                "scan",
+            ),
+            "priority_paths": self.priority_paths_entry.get(),
         }
 
     def update_api_key(self, new_api_key):  # 新增方法
@@ -37,6 +37,14 @@ from config.show_config import show_system_info
 class GeminiCommenterGUI:
     """Gemini代碼註釋器GUI主類"""
 
+    # 每次處理消息隊列的時間上限 (毫秒)
+    QUEUE_TIME_BUDGET_MS = 30
+    # 消息堆積時下一次處理前讓出給介面的時間 (毫秒)
+    QUEUE_BACKLOG_DELAY_MS = 10
+    # 隊列檢查間隔：有消息時為最短間隔，空閒時逐步加倍到最長間隔 (毫秒)
+    QUEUE_POLL_MIN_MS = 50
+    QUEUE_POLL_MAX_MS = 800
+
     def __init__(self, root):
         """初始化GUI
 
@@ -64,6 +72,7 @@ class GeminiCommenterGUI:
         # 初始化變量
         self.api_key = None
         self.is_processing = False
+        self._queue_poll_ms = self.QUEUE_POLL_MIN_MS
 
         # 獲取API密鑰
         self._get_api_key()
@@ -139,6 +148,15 @@ class GeminiCommenterGUI:
         )
         self.stop_btn.pack(side=tk.LEFT, padx=5)
 
+        # 添加暫停/繼續按鈕
+        self.pause_btn = ttk.Button(
+            self.btn_frame,
+            text="暫停",
+            command=self._toggle_pause,
+            state=tk.DISABLED,
+        )
+        self.pause_btn.pack(side=tk.LEFT, padx=5)
+
         # 添加打開輸出文件夾按鈕
         self.open_output_btn = ttk.Button(
             self.btn_frame, text="打開輸出文件夾", command=self._open_output_folder
@@ -162,6 +180,7 @@ class GeminiCommenterGUI:
         self.menu_bar.add_cascade(label="文件", menu=file_menu)
         file_menu.add_command(label="開始處理", command=self._start_processing)
         file_menu.add_command(label="停止處理", command=self._stop_processing)
+        file_menu.add_command(label="暫停/繼續處理", command=self._toggle_pause)
         file_menu.add_separator()
         file_menu.add_command(label="打開輸出文件夾", command=self._open_output_folder)
         file_menu.add_separator()
@@ -205,37 +224,78 @@ class GeminiCommenterGUI:
         print("[DEBUG] 消息隊列處理已啟動")
 
     def _process_queue(self):
-        """處理消息隊列"""
+        """處理消息隊列
+
+        每次最多花費 QUEUE_TIME_BUDGET_MS 處理消息，剩餘的留到下一次，避免大量消息
+        堆積時凍結介面；連續的進度消息只套用最後一個。隊列空閒時逐步拉長檢查間隔，
+        有消息時恢復為最短間隔。
+        """
+        handled = 0
+        latest_progress = None
+        deadline = time.monotonic() + self.QUEUE_TIME_BUDGET_MS / 1000
         try:
-            # 檢查隊列中是否有消息
-            while not self.queue.empty():
-                message_type, data = self.queue.get(0)
-
-                # 根據消息類型處理
-                if message_type == "log":
-                    self.log_panel.add_log(data)
-                elif message_type == "status":
-                    self.status_bar.update_status(data)
-                elif message_type == "progress":
-                    progress_value, status_message = data  # 解包進度值和狀態消息
-                    self.status_bar.update_progress(progress_value)
-                    self.status_bar.update_status(status_message)  # 更新狀態欄文本
-                elif message_type == "progress_max":
-                    self.status_bar.set_progress_max(data)
-                elif message_type == "message":
-                    title, message, error = data
-                    self._show_message(title, message, error)
-                elif message_type == "processing_done":
-                    self._mark_processing_done()
-
-                # 標記消息已處理
-                self.queue.task_done()
-                print(f"[DEBUG] 消息 {message_type} 處理完成")
+            while time.monotonic() < deadline:
+                try:
+                    message_type, data = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                handled += 1
+                try:
+                    if message_type == "progress":
+                        # 進度消息只保留最新的一個，稍後一次更新
+                        latest_progress = data
+                        continue
+                    if message_type != "log" and latest_progress is not None:
+                        # 其他消息可能依賴目前進度，先套用累積的進度
+                        self._apply_progress(latest_progress)
+                        latest_progress = None
+                    self._handle_message(message_type, data)
+                finally:
+                    # 標記消息已處理
+                    self.queue.task_done()
+            if latest_progress is not None:
+                self._apply_progress(latest_progress)
         except Exception as e:
             print(f"[ERROR] 處理消息隊列時出錯: {e}")
 
-        # 每100毫秒檢查一次隊列
-        self.root.after(100, self._process_queue)
+        if not self.queue.empty():
+            # 時間用完但還有消息，短暫讓出給介面重繪後繼續
+            delay = self.QUEUE_BACKLOG_DELAY_MS
+            self._queue_poll_ms = self.QUEUE_POLL_MIN_MS
+        elif handled:
+            delay = self._queue_poll_ms = self.QUEUE_POLL_MIN_MS
+        else:
+            delay = self._queue_poll_ms
+            self._queue_poll_ms = min(self._queue_poll_ms * 2, self.QUEUE_POLL_MAX_MS)
+        self.root.after(delay, self._process_queue)
+
+    def _handle_message(self, message_type, data):
+        """根據消息類型處理單一消息"""
+        if message_type == "log":
+            # 協調器的日誌為 (消息, 等級)，其他來源可能只有消息
+            if isinstance(data, tuple):
+                self.log_panel.add_log(*data)
+            else:
+                self.log_panel.add_log(data)
+        elif message_type == "status":
+            self.status_bar.update_status(data)
+        elif message_type == "progress":
+            self._apply_progress(data)
+        elif message_type == "progress_max":
+            self.status_bar.set_progress_max(data)
+        elif message_type == "message":
+            title, message, error = data
+            self._show_message(title, message, error)
+        elif message_type == "processing_done":
+            self._mark_processing_done()
+        elif message_type == "callback":
+            # 處理線程要求在主線程中執行的回調
+            data()
+
+    def _apply_progress(self, data):
+        progress_value, status_message = data  # 解包進度值和狀態消息
+        self.status_bar.update_progress(progress_value)
+        self.status_bar.update_status(status_message)  # 更新狀態欄文本
 
     def _check_api_key(self):
         """檢查API密鑰是否有效
@@ -360,6 +420,7 @@ class GeminiCommenterGUI:
         self.is_processing = True
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
+        self.pause_btn.config(state=tk.NORMAL, text="暫停")
         self.status_bar.update_status("正在準備處理...")
         self.status_bar.update_progress(0)
 
@@ -383,17 +444,34 @@ class GeminiCommenterGUI:
         if not self.is_processing:
             return
 
-        # 停止處理
+        # 停止處理，工作線程結束後由完成回調恢復按鈕狀態
         self.file_processor.stop_processing()
 
         # 更新UI狀態
-        self._mark_processing_done()
+        self.stop_btn.config(state=tk.DISABLED)
+        self.pause_btn.config(state=tk.DISABLED)
+        self.status_bar.update_status("正在取消處理...")
+
+    def _toggle_pause(self):
+        """暫停或繼續處理"""
+        if not self.is_processing:
+            return
+
+        if self.file_processor.is_paused:
+            self.file_processor.resume_processing()
+            self.pause_btn.config(text="暫停")
+            self.status_bar.update_status("繼續處理...")
+        else:
+            self.file_processor.pause_processing()
+            self.pause_btn.config(text="繼續")
+            self.status_bar.update_status("已暫停")
 
     def _mark_processing_done(self):
         """標記處理完成"""
         self.is_processing = False
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
+        self.pause_btn.config(state=tk.DISABLED, text="暫停")
         print("[DEBUG] 標記處理完成成功")
 
     def _on_processing_complete(self):
@@ -489,5 +567,8 @@ class GeminiCommenterGUI:
             # 停止處理
             self.file_processor.stop_processing()
 
+        # 關閉日誌歷史檔
+        self.log_panel.close()
+
         # 關閉窗口
         self.root.destroy()
@@ -7,6 +7,7 @@
 """
 
 import os
+from core.cancellation import CancellationToken
 from core.orchestrator import ProjectOrchestrator
 import subprocess
 import threading
@@ -29,6 +30,7 @@ class ProcessingThreadManager:
         self.on_complete_callback = on_complete_callback
         self.is_processing = False
         self.process = None
+        self.cancel_token = None
 
     def start_processing(self, settings):  # 將所有參數替換為一個 settings 字典
         """開始處理文件
@@ -39,6 +41,8 @@ class ProcessingThreadManager:
             return
 
         self.is_processing = True
+        # 每次運行使用新的取消信號，上一次的取消不影響本次
+        self.cancel_token = CancellationToken()
 
         # 從 settings 字典中提取參數
         folder = settings.get("folder")
@@ -50,6 +54,8 @@ class ProcessingThreadManager:
         max_backoff = settings.get("max_backoff", Config.DEFAULT_MAX_BACKOFF)
         model_name = settings.get("model_name", Config.DEFAULT_MODEL_NAME)
         use_nyaproxy = settings.get("nyaproxy", False)  # 注意這裡的鍵名
+        priority = settings.get("priority", Config.DEFAULT_PRIORITY)
+        priority_paths = settings.get("priority_paths", "")
 
         # 在單獨的線程中處理文件
         try:
@@ -65,6 +71,8 @@ class ProcessingThreadManager:
                     max_backoff,
                     model_name,
                     use_nyaproxy,
+                    priority,
+                    priority_paths,
                 ),
                 daemon=True,
             ).start()
@@ -88,6 +96,8 @@ class ProcessingThreadManager:
         max_backoff=Config.DEFAULT_MAX_BACKOFF,
         model_name=Config.DEFAULT_MODEL_NAME,
         use_nyaproxy=False,
+        priority=Config.DEFAULT_PRIORITY,
+        priority_paths="",
     ):
         """處理選定的文件夾中的文件（在單獨的線程中運行）
 
@@ -100,6 +110,8 @@ class ProcessingThreadManager:
             delay: 請求延遲時間
             max_backoff: 最大退避時間
             model_name: 模型名稱
+            priority: 處理順序策略
+            priority_paths: 優先路徑 (逗號分隔)
         """
         print(
             f"[INFO] 開始處理文件: 當前線程ID={threading.get_ident()}, 主線程ID={threading.main_thread().ident}"
@@ -176,21 +188,50 @@ class ProcessingThreadManager:
                 "max_backoff": max_backoff,
                 "use_nyaproxy": use_nyaproxy,
                 "model_name": model_name,
+                "priority": priority,
+                "priority_paths": priority_paths,
             }
 
             # 創建並運行協調器
-            orchestrator = ProjectOrchestrator(settings, self.queue)
+            orchestrator = ProjectOrchestrator(
+                settings, self.queue, cancel_token=self.cancel_token
+            )
             orchestrator.run()
 
         except Exception as e:
             self.queue.put(
-                ("log", f"[FATAL] An error occurred in the processing thread: {e}")
+                (
+                    "log",
+                    (f"[FATAL] An error occurred in the processing thread: {e}", "ERROR"),
+                )
             )
         finally:
+            self.is_processing = False
             # Safely signal the main thread that processing is finished.
             if self.on_complete_callback:
                 self.queue.put(("callback", self.on_complete_callback))
 
     def stop_processing(self):
-        """Requests to stop the processing thread."""
-        # This is a simplified stop mechanism. A truly graceful stop would require
+        """取消處理：中斷等待與進行中的請求，已完成的結果會保留"""
+        if self.cancel_token is None or not self.is_processing:
+            return
+        self.cancel_token.cancel()
+        self.queue.put(("log", ("正在取消處理，等待工作線程結束...", "INFO")))
+
+    def pause_processing(self):
+        """暫停處理：進行中的請求完成後不再開始新的文件"""
+        if self.cancel_token is None or not self.is_processing:
+            return
+        self.cancel_token.pause()
+        self.queue.put(("log", ("處理將在目前的文件完成後暫停。", "INFO")))
+
+    def resume_processing(self):
+        """繼續已暫停的處理"""
+        if self.cancel_token is None or not self.is_processing:
+            return
+        self.cancel_token.resume()
+        self.queue.put(("log", ("繼續處理。", "INFO")))
+
+    @property
+    def is_paused(self):
+        return self.cancel_token is not None and self.cancel_token.paused
@@ -0,0 +1,100 @@
+"""
+CLI 啟動時間基準測試
+在全新的子進程中以 python -X importtime 匯入 CLI 入口模組，統計匯入耗時，
+並檢查只在部分運行中使用的重型依賴 (Gemini SDK、requests、PyYAML) 沒有在
+匯入時被載入。
+
+用法：
+    python utils/import_benchmark.py
+    python utils/import_benchmark.py --runs 10 --top 15 --max-ms 300
+超過 --max-ms 或匯入了延遲載入的模組時以狀態碼 1 結束，可用於 CI。
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 這些模組應該只在實際使用的運行中才被匯入
+LAZY_MODULES = ("google.generativeai", "requests", "yaml")
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$")
+
+
+def measure_imports(module):
+    """在子進程中匯入模組一次。
+
+    Returns:
+        tuple: (該模組的累計耗時毫秒, {模組名: (自身耗時毫秒, 累計耗時毫秒)})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"匯入 {module} 失敗:\n{result.stderr}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = match.groups()
+        modules[name] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return modules[module][1], modules
+
+
+def measure_help():
+    """執行 run_cli.py --help 一次，返回牆鐘時間 (毫秒)"""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(PROJECT_ROOT / "run_cli.py"), "--help"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="測量 CLI 的匯入時間")
+    parser.add_argument("--module", default="cli.main", help="要匯入的模組 (預設：cli.main)")
+    parser.add_argument("--runs", type=int, default=5, help="測量次數，報告中位數 (預設：5)")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗時最多的模組數 (預設：10)")
+    parser.add_argument("--max-ms", type=float, help="匯入耗時中位數的上限 (毫秒)，超過時失敗")
+    args = parser.parse_args()
+
+    totals = []
+    modules = {}
+    for _ in range(max(1, args.runs)):
+        total, modules = measure_imports(args.module)
+        totals.append(total)
+    median = statistics.median(totals)
+    help_median = statistics.median(measure_help() for _ in range(max(1, args.runs)))
+
+    print(f"匯入 {args.module}: 中位數 {median:.1f} ms (最小 {min(totals):.1f} ms，{len(totals)} 次)")
+    print(f"run_cli.py --help: 中位數 {help_median:.1f} ms (含解譯器啟動)")
+    print(f"自身耗時最多的 {args.top} 個模組:")
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)
+    for name, (self_ms, cumulative_ms) in slowest[: args.top]:
+        print(f"  {self_ms:8.1f} ms  (累計 {cumulative_ms:8.1f} ms)  {name}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"[ERROR] 以下模組應延遲載入，但在匯入時被載入: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"[ERROR] 匯入耗時 {median:.1f} ms 超過上限 {args.max_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
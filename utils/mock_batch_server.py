@@ -0,0 +1,203 @@
+"""
+Gemini Batch API 模擬服務
+在本機以標準庫的 http.server 實作批次模式用到的端點 (建立、查詢、下載結果、取消)，
+回應由 fake 後端產生，不需要 API 金鑰即可測試 --batch 的完整流程，
+包括中斷後接續、結果檔下載與暫時性錯誤的重試。
+
+用法：
+    python utils/mock_batch_server.py --port 8089
+    python run_cli.py -f <來源> -o <輸出> --batch --batch-poll 1 --base-url http://127.0.0.1:8089
+    python utils/mock_batch_server.py --polls 3 --responses-file --fail-polls 2
+--fail-key 指定的子字串出現在文件相對路徑中時，該文件的請求返回錯誤。
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config.config import Config, PromptConfig  # noqa: E402
+from core.backends.fake import FakeBackend  # noqa: E402
+
+API_PREFIX = f"/{Config.GEMINI_API_VERSION}/"
+DOWNLOAD_PREFIX = f"/download{API_PREFIX}"
+
+
+class MockBatchService:
+    """保存批次工作的狀態，並以 fake 後端產生每個請求的回應"""
+
+    def __init__(self, polls=2, responses_file=False, fail_polls=0, fail_key=None):
+        """
+        Args:
+            polls (int): 工作在第幾次查詢時完成。
+            responses_file (bool): 結果以 responsesFile 提供 (需另外下載)，否則內嵌於回應。
+            fail_polls (int): 每個工作前幾次查詢返回 HTTP 503，用於測試重試。
+            fail_key (str, optional): key 含此子字串的請求返回錯誤。
+        """
+        self.polls = max(1, polls)
+        self.responses_file = responses_file
+        self.fail_polls = fail_polls
+        self.fail_key = fail_key
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._backend = FakeBackend()
+
+    def create(self, body):
+        requests = body["batch"]["inputConfig"]["requests"]["requests"]
+        with self._lock:
+            name = f"batches/{next(self._ids)}"
+            self.jobs[name] = {"requests": requests, "polls": 0, "state": "RUNNING"}
+        return {"name": name, "metadata": {"name": name, "state": "BATCH_STATE_PENDING"}}
+
+    def get(self, name):
+        """返回 (HTTP 狀態碼, 內容)"""
+        with self._lock:
+            job = self.jobs.get(name)
+            if job is None:
+                return 404, {"error": {"message": f"{name} 不存在"}}
+            job["polls"] += 1
+            if job["polls"] <= self.fail_polls:
+                return 503, {"error": {"message": "服務暫時無法使用"}}
+            if job["state"] == "RUNNING" and job["polls"] - self.fail_polls >= self.polls:
+                job["state"] = "SUCCEEDED"
+            state = job["state"]
+        if state == "RUNNING":
+            return 200, {"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}}
+        if state != "SUCCEEDED":
+            metadata = {"state": f"BATCH_STATE_{state}"}
+            return 200, {"name": name, "done": True, "metadata": metadata}
+        if self.responses_file:
+            output = {"responsesFile": f"files/{name.split('/', 1)[1]}"}
+        else:
+            output = {"inlinedResponses": {"inlinedResponses": self.entries(name)}}
+        return 200, {
+            "name": name,
+            "done": True,
+            "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+            "response": output,
+        }
+
+    def cancel(self, name):
+        with self._lock:
+            job = self.jobs.get(name)
+            if job is None:
+                return 404, {"error": {"message": f"{name} 不存在"}}
+            if job["state"] == "RUNNING":
+                job["state"] = "CANCELLED"
+        return 200, {}
+
+    def entries(self, name):
+        """工作中每個請求的結果，格式與 inlinedResponses 的項目相同"""
+        entries = []
+        for item in self.jobs[name]["requests"]:
+            key = item["metadata"]["key"]
+            if self.fail_key and self.fail_key in key:
+                error = {"message": "模擬的請求錯誤"}
+                entries.append({"metadata": {"key": key}, "error": error})
+                continue
+            prompt = item["request"]["contents"][0]["parts"][0]["text"]
+            text = self._backend.generate(prompt, self._system_instruction(prompt))
+            entries.append(
+                {
+                    "metadata": {"key": key},
+                    "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]},
+                }
+            )
+        return entries
+
+    @staticmethod
+    def _system_instruction(prompt):
+        """批次請求把系統指示放在提示詞開頭，依此判斷輸出格式"""
+        if prompt.startswith(PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION):
+            return PromptConfig.LINE_COMMENTS_SYSTEM_INSTRUCTION
+        return PromptConfig.SYSTEM_INSTRUCTION
+
+
+class MockBatchHandler(BaseHTTPRequestHandler):
+    """把 HTTP 請求對應到 MockBatchService"""
+
+    def log_message(self, format, *args):
+        print(f"[mock] {self.command} {self.path} {format % args}", file=sys.stderr)
+
+    def _send(self, status, payload=None, text=None):
+        if text is None:
+            text = json.dumps(payload, ensure_ascii=False)
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if payload is not None else "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        service = self.server.service
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": {"message": "請求內容不是 JSON"}})
+        if self.path.startswith(API_PREFIX) and self.path.endswith(":batchGenerateContent"):
+            try:
+                return self._send(200, service.create(body))
+            except (KeyError, TypeError) as e:
+                return self._send(400, {"error": {"message": f"缺少字段: {e}"}})
+        if self.path.startswith(API_PREFIX) and self.path.endswith(":cancel"):
+            name = self.path[len(API_PREFIX) : -len(":cancel")]
+            return self._send(*service.cancel(name))
+        self._send(404, {"error": {"message": f"未知的路徑 {self.path}"}})
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path.startswith(DOWNLOAD_PREFIX):
+            # download/v1beta/files/<id>:download?alt=media
+            file_id = self.path[len(DOWNLOAD_PREFIX) :].split(":", 1)[0]
+            name = f"batches/{file_id.split('/', 1)[-1]}"
+            if name not in service.jobs:
+                return self._send(404, {"error": {"message": f"{file_id} 不存在"}})
+            lines = [json.dumps(entry, ensure_ascii=False) for entry in service.entries(name)]
+            return self._send(200, text="\n".join(lines))
+        if self.path.startswith(API_PREFIX):
+            return self._send(*service.get(self.path[len(API_PREFIX) :]))
+        self._send(404, {"error": {"message": f"未知的路徑 {self.path}"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機的 Gemini Batch API 模擬服務")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽位址 (預設：127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8089, help="監聽埠 (預設：8089)")
+    parser.add_argument("--polls", type=int, default=2, help="工作在第幾次查詢時完成 (預設：2)")
+    parser.add_argument(
+        "--responses-file", action="store_true", help="結果以 responsesFile 提供，需另外下載"
+    )
+    parser.add_argument(
+        "--fail-polls", type=int, default=0, help="每個工作前幾次查詢返回 HTTP 503 (預設：0)"
+    )
+    parser.add_argument("--fail-key", help="相對路徑含此子字串的文件返回請求錯誤")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockBatchHandler)
+    server.service = MockBatchService(
+        polls=args.polls,
+        responses_file=args.responses_file,
+        fail_polls=args.fail_polls,
+        fail_key=args.fail_key,
+    )
+    print(f"模擬服務已啟動: http://{args.host}:{args.port}，按 Ctrl+C 停止。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())